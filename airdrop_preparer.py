@@ -1,83 +1,204 @@
+import os
+import csv
 import json
-from decimal import Decimal, getcontext
+import argparse
+from decimal import Decimal
 
-# Set precision high enough to handle large token calculations
-getcontext().prec = 50
+import numpy as np
 
-def prepare_airdrop(json_file_path, tokens_to_airdrop):
+from user_points import PointsStore, DB_FILE
+
+TOKEN_DECIMALS = 18  # Decimals of the token in token.sol
+AIRDROP_BATCH_SIZE = 250  # Recipients per setupAirdrop transaction (one storage write each, well under the block gas limit)
+OUTPUT_DIR = "airdrop"  # Directory the batch files are written to
+
+def to_base_units(tokens, decimals=TOKEN_DECIMALS):
+    """
+    Convert a token amount to integer base units exactly.
+
+    Parameters:
+    - tokens (int, str or Decimal): Tokens to distribute, e.g. 1000 or "0.5".
+    - decimals (int): Decimals of the token.
+
+    Returns:
+    - int: Amount in base units.
+    """
+    units = Decimal(str(tokens)) * (10 ** decimals)
+    if units != units.to_integral_value() or units <= 0:
+        raise ValueError(f"{tokens} tokens is not a positive whole number of base units.")
+    return int(units)
+
+def allocate(rows, n_wallets, total_points, budget):
     """
-    Reads user points from a JSON file, calculates each user's share of the airdrop,
-    and prints two lists: recipients and corresponding token amounts.
+    Split `budget` base units in proportion to points, exactly: every wallet gets
+    floor(budget * points / total_points), and the units left over go one each
+    to the wallets with the largest remainders (largest-remainder rounding), ties
+    to the earliest wallet. The amounts always sum to the budget.
+
+    Needs two passes over the rows but only one remainder (8 bytes) per wallet in
+    memory. Remainders are below total_points, which fits in an int64.
 
     Parameters:
-    - json_file_path (str): Path to the JSON file containing user data.
-    - tokens_to_airdrop (int or float): Total number of tokens to distribute.
+    - rows (callable): rows() yields (wallet_address, points) in a fixed order; called twice.
+    - n_wallets (int): Number of rows.
+    - total_points (int): Sum of points over the rows.
+    - budget (int): Base units to distribute.
+
+    Yields:
+    - tuple: (wallet_address, amount) in the order of rows().
     """
-    # Load user data from JSON file
+    remainders = np.empty(n_wallets, dtype=np.int64)
+    distributed = 0
+    for idx, (_, points) in enumerate(rows()):
+        share, remainders[idx] = divmod(budget * points, total_points)
+        distributed += share
+    extra = budget - distributed  # Fewer than n_wallets units
+    if extra:
+        # The extra-th largest remainder; wallets above it get a unit, ties go in order
+        threshold = np.partition(remainders, n_wallets - extra)[n_wallets - extra]
+        ties = extra - int(np.count_nonzero(remainders > threshold))
+    else:
+        threshold, ties = total_points, 0
+    for idx, (wallet_address, points) in enumerate(rows()):
+        amount = budget * points // total_points
+        if remainders[idx] > threshold:
+            amount += 1
+        elif remainders[idx] == threshold and ties:
+            amount += 1
+            ties -= 1
+        yield wallet_address, amount
+
+def write_batch(output_dir, index, batch, fmt):
+    """
+    Write one setupAirdrop transaction's recipients and amounts.
+
+    CSV files hold one 'recipient,amount' row per wallet. JSON files hold the two
+    arrays, with amounts as strings since they exceed 2**53; both can be pasted
+    as setupAirdrop's arguments in Remix.
+
+    Returns:
+    - str: Path of the file written.
+    """
+    path = os.path.join(output_dir, f"airdrop_{index:05d}.{fmt}")
+    with open(path, 'w', newline='') as f:
+        if fmt == 'csv':
+            writer = csv.writer(f)
+            writer.writerow(['recipient', 'amount'])
+            writer.writerows(batch)
+        else:
+            json.dump({'recipients': [wallet_address for wallet_address, _ in batch],
+                       'amounts': [str(amount) for _, amount in batch]}, f)
+    return path
+
+def prepare_airdrop(db_path, tokens_to_airdrop, output_dir=OUTPUT_DIR, batch_size=AIRDROP_BATCH_SIZE, fmt='json',
+                    decimals=TOKEN_DECIMALS, epoch=None, first_airdrop_id=None):
+    """
+    Reads user points from the points database, calculates each wallet's share of
+    the airdrop, and writes the recipients and amounts in batch files of
+    `batch_size` wallets, one per setupAirdrop transaction.
+
+    Without an epoch, shares follow lifetime points. With one, they follow the
+    points earned in that closed epoch (see PointsStore.close_epoch), and only
+    the users active in it are read.
+
+    Points are streamed from one consistent snapshot of the database, so this runs
+    in bounded memory next to a live Data Server. Users sharing a wallet address
+    are paid together, as setupAirdrop keeps one amount per address.
+
+    Every setupAirdrop call creates a new airdrop id (the contract's
+    currentAirdropId, then increments it), and recipients claim with that id.
+    Given the id the first batch will get, summary.json maps each batch file to
+    its airdrop id, assuming the batches are submitted in order.
+
+    Parameters:
+    - db_path (str): Path to the points database.
+    - tokens_to_airdrop (int, str or Decimal): Total number of tokens to distribute.
+    - output_dir (str): Directory for the batch files and summary.json.
+    - batch_size (int): Recipients per batch file.
+    - fmt (str): 'json' or 'csv'.
+    - decimals (int): Decimals of the token.
+    - epoch (int or None): Closed epoch to pay out, or None for lifetime points.
+    - first_airdrop_id (int or None): The contract's currentAirdropId before the
+      first batch is submitted; None leaves the batches' airdrop ids unrecorded.
+
+    Returns:
+    - dict: Summary of the airdrop (also written to summary.json), or None if no wallet holds points.
+    """
+    budget = to_base_units(tokens_to_airdrop, decimals)
+    if not os.path.isfile(db_path):
+        # PointsStore would create an empty database and report zero points
+        raise FileNotFoundError(f"Points database {db_path} does not exist.")
+    store = PointsStore(db_path)
     try:
-        with open(json_file_path, 'r') as file:
-            user_data = json.load(file)
-    except FileNotFoundError:
-        print(f"Error: The file {json_file_path} does not exist.")
-        return
-    except json.JSONDecodeError:
-        print(f"Error: The file {json_file_path} is not a valid JSON file.")
-        return
-
-    # Extract points and addresses
-    users = []
-    total_points = Decimal(0)
-    for username, info in user_data.items():
-        points = Decimal(info.get("points", 0))
-        wallet_address = info.get("wallet_address", "")
-        if not wallet_address:
-            print(f"Warning: User '{username}' does not have a wallet address. Skipping.")
-            continue
-        users.append({
-            "username": username,
-            "points": points,
-            "wallet_address": wallet_address
-        })
-        total_points += points
-
-    if total_points == 0:
-        print("Error: Total points of all users is zero. Cannot perform airdrop.")
-        return
-
-    # Calculate token distribution
-    recipients = []
-    amounts = []
-    scaling_factor = Decimal(10**18)
-    tokens_to_airdrop_decimal = Decimal(tokens_to_airdrop)
-
-    for user in users:
-        fraction = user["points"] / total_points
-        token_amount = (fraction * tokens_to_airdrop_decimal * scaling_factor).to_integral_value()
-        recipients.append(f'"{user["wallet_address"]}"')
-        amounts.append(str(token_amount))
-
-    # Print the lists in Solidity array format
-    print("\n// Recipients Array")
-    print("address[] memory recipients = new address[](" + str(len(recipients)) + ");")
-    for idx, address in enumerate(recipients):
-        print(f"recipients[{idx}] = {address};")
-
-    print("\n// Amounts Array")
-    print("uint256[] memory amounts = new uint256[](" + str(len(amounts)) + ");")
-    for idx, amount in enumerate(amounts):
-        print(f"amounts[{idx}] = {amount};")
-
-    # Alternatively, print as Solidity array literals
-    print("\n// Alternatively, as Solidity array literals:")
-    print("address[] memory recipients = [" + ", ".join(recipients) + "];")
-    print("uint256[] memory amounts = [" + ", ".join(amounts) + "];")
+        with store.snapshot():
+            n_wallets, total_points, unpaid = store.wallet_totals(epoch)
+            if unpaid:
+                print(f"Warning: {unpaid} users with points have no wallet address. Skipping them.")
+            if total_points == 0:
+                print("Error: Total points of all users is zero. Cannot perform airdrop.")
+                return None
 
-if __name__ == "__main__":
-    # Example usage:
-    # Define the path to your JSON file
-    json_file = "user_points.json"
+            os.makedirs(output_dir, exist_ok=True)
+            files = []
+            batch = []
+            distributed = 0
+            rows = lambda: store.wallet_points(epoch)
+            for wallet_address, amount in allocate(rows, n_wallets, total_points, budget):
+                batch.append((wallet_address, amount))
+                distributed += amount
+                if len(batch) == batch_size:
+                    files.append(write_batch(output_dir, len(files), batch, fmt))
+                    batch = []
+            if batch:
+                files.append(write_batch(output_dir, len(files), batch, fmt))
+    finally:
+        store.close()
+
+    if distributed != budget:
+        raise RuntimeError(f"Amounts add up to {distributed} base units instead of the budget of {budget}.")
+    names = [os.path.basename(path) for path in files]
+    summary = {'epoch': epoch, 'tokens': str(tokens_to_airdrop), 'base_units': str(budget), 'recipients': n_wallets,
+               'total_points': total_points, 'skipped_users': unpaid, 'batches': len(files), 'files': names,
+               'first_airdrop_id': first_airdrop_id,
+               'airdrop_ids': ({name: first_airdrop_id + index for index, name in enumerate(names)}
+                               if first_airdrop_id is not None else None)}
+    with open(os.path.join(output_dir, 'summary.json'), 'w') as f:
+        json.dump(summary, f, indent=4)
+    return summary
 
-    # Define the total tokens to airdrop (adjust as needed)
-    total_tokens = 1000  # Example: 1000 tokens
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Split an airdrop between users by points, in transaction-sized batches.")
+    parser.add_argument('tokens', help="Total tokens to airdrop, e.g. 1000.")
+    parser.add_argument('--db', default=DB_FILE, help="Points database.")
+    parser.add_argument('--out', default=OUTPUT_DIR, help="Directory for the batch files.")
+    parser.add_argument('--batch-size', type=int, default=AIRDROP_BATCH_SIZE, help="Recipients per transaction.")
+    parser.add_argument('--format', choices=('json', 'csv'), default='json', help="Batch file format.")
+    parser.add_argument('--decimals', type=int, default=TOKEN_DECIMALS, help="Token decimals.")
+    parser.add_argument('--close-epoch', action='store_true',
+                        help="Close the open epoch and pay out the points earned in it.")
+    parser.add_argument('--epoch', type=int, default=None, help="Pay out a closed epoch again.")
+    parser.add_argument('--first-airdrop-id', type=int, default=None,
+                        help="The contract's currentAirdropId; recorded per batch in summary.json.")
+    args = parser.parse_args()
 
-    prepare_airdrop(json_file, total_tokens)
+    if not os.path.isfile(args.db):
+        print(f"Error: Points database {args.db} does not exist.")
+        raise SystemExit(1)
+    epoch = args.epoch
+    if args.close_epoch:
+        store = PointsStore(args.db)
+        closed = store.close_epoch()
+        store.close()
+        if closed is None:
+            print("No points earned since the last epoch.")
+            raise SystemExit(1)
+        epoch = closed[0]
+        print(f"Closed epoch {epoch}: {closed[2]} points earned by {closed[1]} users.")
+    summary = prepare_airdrop(args.db, args.tokens, args.out, args.batch_size, args.format, args.decimals, epoch,
+                              args.first_airdrop_id)
+    if summary is not None:
+        print(f"{summary['recipients']} recipients, {summary['base_units']} base units in "
+              f"{summary['batches']} batches written to {args.out}/.")
+        if summary['airdrop_ids'] is None:
+            print("Submit the batches in order: batch N gets airdrop id currentAirdropId + N. "
+                  "Pass --first-airdrop-id to record the ids in summary.json.")
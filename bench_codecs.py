@@ -0,0 +1,75 @@
+# bench_codecs.py
+"""
+Microbenchmark: payload size and encode / decode cost of the frame codecs.
+
+Sends one lease-sized frame of each payload kind through a socket pair with
+every codec available here (zstd and lz4 only if installed), with and without
+integer narrowing, and reports the compression ratio, the seconds spent
+encoding and decoding, and the time the frame would take end to end over a
+link of --link-mbit Mbit/s.
+
+Payload kinds:
+- int-operands: np.random.randint(0, 10) blocks, as in the master's random job.
+- int-results: products of those blocks.
+- float-operands: np.random.rand blocks.
+
+Usage:
+    python bench_codecs.py [--block-size 256] [--blocks 16] [--link-mbit 1000]
+"""
+import argparse
+import socket
+import threading
+
+import numpy as np
+
+from helper import send_frame, receive_frame, ReceiveBuffer, available_codecs, WireStats, MSG_TASK
+
+
+def payloads(block_size, n_blocks):
+    a = [np.random.randint(0, 10, size=(block_size, block_size)) for _ in range(n_blocks)]
+    yield 'int-operands', a
+    yield 'int-results', [x @ x for x in a[:max(1, n_blocks // 2)]]
+    yield 'float-operands', [np.random.rand(block_size, block_size) for _ in range(n_blocks)]
+
+
+def round_trip(arrays, codec, narrow):
+    """
+    Send `arrays` in one frame through a socket pair.
+
+    Returns:
+    - tuple: (sender WireStats, receiver WireStats)
+    """
+    sender, receiver = socket.socketpair()
+    sent, received = WireStats(), WireStats()
+    with sender, receiver:
+        thread = threading.Thread(target=send_frame, args=(sender, MSG_TASK, 0, arrays, None, codec, narrow, sent))
+        thread.start()
+        frame = receive_frame(receiver, ReceiveBuffer(receiver), received)
+        thread.join()
+    assert all(np.array_equal(x, y) and x.dtype == y.dtype for x, y in zip(arrays, frame.arrays)), "Lossy round trip."
+    return sent, received
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--block-size', type=int, default=256, help="Square block size.")
+    parser.add_argument('--blocks', type=int, default=16, help="Blocks per frame.")
+    parser.add_argument('--link-mbit', type=float, default=1000, help="Link speed for the end-to-end estimate.")
+    args = parser.parse_args()
+
+    codecs = [None] + [codec for codec in available_codecs() if codec != 'narrow']
+    link = args.link_mbit * 1e6 / 8
+    print(f"{args.blocks} blocks of {args.block_size}x{args.block_size} per frame, {args.link_mbit:g} Mbit/s link")
+    print(f"{'payload':>15} {'codec':>6} {'narrow':>7} {'MiB':>7} {'ratio':>7} {'enc ms':>7} {'dec ms':>7} {'link ms':>8}")
+    for kind, arrays in payloads(args.block_size, args.blocks):
+        for narrow in (False, True):
+            for codec in codecs:
+                sent, received = round_trip(arrays, codec, narrow)
+                total = sent.wire_bytes / link + sent.encode_seconds + received.decode_seconds
+                print(f"{kind:>15} {codec or '-':>6} {'yes' if narrow else 'no':>7} {sent.raw_bytes / 2**20:>7.1f} "
+                      f"{sent.raw_bytes / sent.wire_bytes:>7.2f} {sent.encode_seconds * 1e3:>7.1f} "
+                      f"{received.decode_seconds * 1e3:>7.1f} {total * 1e3:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
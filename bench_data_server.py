@@ -0,0 +1,96 @@
+# bench_data_server.py
+"""
+Load benchmark: Data Server requests per second by number of serving processes.
+
+Starts data_server.py in a temporary directory with each process count in
+--workers (one process runs Flask's threaded server, more run under gunicorn),
+registers --users users, then has --clients client processes send requests
+over keep-alive sessions for --seconds per endpoint. Reports requests per
+second and mean latency for /get_points, /update_points and /increment_points.
+
+Usage:
+    python bench_data_server.py [--workers 1 2 4] [--clients 8] [--seconds 5]
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+ENDPOINTS = ('get_points', 'update_points', 'increment_points')
+
+
+def client(url, endpoint, n_users, seconds):
+    """
+    Send requests to one endpoint for `seconds`.
+
+    Returns:
+    - tuple: (requests completed, errors)
+    """
+    session = requests.Session()
+    done = errors = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        username = f"user{random.randrange(n_users)}"
+        if endpoint == 'get_points':
+            response = session.get(f"{url}/get_points", params={'username': username}, timeout=10)
+        else:
+            response = session.post(f"{url}/{endpoint}", json={'username': username, 'points': 1}, timeout=10)
+        done += 1
+        errors += response.status_code != 200
+    return done, errors
+
+
+def wait_until_up(url, process):
+    for _ in range(200):
+        if process.poll() is not None:
+            raise RuntimeError("The Data Server exited.")
+        try:
+            requests.get(f"{url}/get_points", timeout=1)
+            return
+        except requests.ConnectionError:
+            time.sleep(0.05)
+    raise RuntimeError("The Data Server did not start.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4], help="Serving process counts.")
+    parser.add_argument('--clients', type=int, default=8, help="Client processes.")
+    parser.add_argument('--users', type=int, default=100, help="Registered users.")
+    parser.add_argument('--seconds', type=float, default=5, help="Load duration per endpoint.")
+    parser.add_argument('--port', type=int, default=5051)
+    args = parser.parse_args()
+
+    server = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data_server.py')
+    url = f"http://127.0.0.1:{args.port}"
+    print(f"{os.cpu_count()} cores, {args.clients} clients, {args.users} users")
+    print(f"{'workers':>8} {'endpoint':>17} {'req/s':>9} {'ms':>7} {'errors':>7}")
+    for workers in args.workers:
+        with tempfile.TemporaryDirectory() as directory:
+            process = subprocess.Popen([sys.executable, server, '--host', '127.0.0.1', '--port', str(args.port),
+                                        '--workers', str(workers), '--log-level', 'WARNING'],
+                                       cwd=directory, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            try:
+                wait_until_up(url, process)
+                for idx in range(args.users):
+                    requests.post(f"{url}/register", json={'username': f"user{idx}", 'password': 'bench'})
+                with multiprocessing.Pool(args.clients) as pool:
+                    for endpoint in ENDPOINTS:
+                        results = pool.starmap(client, [(url, endpoint, args.users, args.seconds)] * args.clients)
+                        done = sum(result[0] for result in results)
+                        errors = sum(result[1] for result in results)
+                        rate = done / args.seconds
+                        print(f"{workers:>8} {endpoint:>17} {rate:>9.0f} {args.clients / rate * 1e3:>7.2f} {errors:>7}")
+            finally:
+                process.terminate()
+                process.wait()
+
+
+if __name__ == "__main__":
+    main()
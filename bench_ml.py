@@ -0,0 +1,62 @@
+# bench_ml.py
+"""
+Microbenchmark: ml.block_multiply (einsum tile engine) against the original
+per-block Python loop (ml.block_multiply_loop) and plain x @ W.
+
+Multiplies a (batch x n) float32 activation by an (n x n) weight matrix, as in
+ml.Dense.forward, for each size in --sizes and block size in --block-sizes,
+checks that both block paths agree, and reports milliseconds per multiply.
+
+Usage:
+    python bench_ml.py [--batch 64] [--sizes 64 256 1024] [--block-sizes 4 16 64]
+"""
+import argparse
+import time
+
+import numpy as np
+
+import ml
+
+
+def timed(function, repeats):
+    """
+    Returns:
+    - tuple: (best seconds of `repeats` calls, last result)
+    """
+    best = float('inf')
+    for _ in range(repeats):
+        started = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--batch', type=int, default=64, help="Rows of the activation.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[64, 256, 1024], help="Layer widths.")
+    parser.add_argument('--block-sizes', type=int, nargs='+', default=[4, 16, 64], help="Block sizes.")
+    parser.add_argument('--max-loop-seconds', type=float, default=5.0,
+                        help="Skip the loop path where one call would take longer than this.")
+    args = parser.parse_args()
+
+    print(f"{'size':>6} {'block':>6} {'loop ms':>10} {'tiles ms':>9} {'x@W ms':>8} {'speedup':>8}")
+    for n in args.sizes:
+        x = np.random.randn(args.batch, n).astype(np.float32)
+        W = np.random.randn(n, n).astype(np.float32)
+        plain, _ = timed(lambda: x @ W, 5)
+        for block_size in args.block_sizes:
+            tiles, result = timed(lambda: ml.block_multiply(x, W, block_size), 5)
+            # The loop path makes one np.dot call per block triple
+            calls = -(-args.batch // block_size) * (-(-n // block_size)) ** 2
+            if calls * 2e-6 > args.max_loop_seconds:
+                print(f"{n:>6} {block_size:>6} {'skipped':>10} {tiles * 1e3:>9.2f} {plain * 1e3:>8.2f} {'-':>8}")
+                continue
+            loop, reference = timed(lambda: ml.block_multiply_loop(x, W, block_size), 1)
+            assert np.allclose(result, reference, rtol=1e-4, atol=1e-4), "Tile engine disagrees with the loop."
+            print(f"{n:>6} {block_size:>6} {loop * 1e3:>10.2f} {tiles * 1e3:>9.2f} {plain * 1e3:>8.2f} "
+                  f"{loop / tiles:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+# bench_panels.py
+"""
+Benchmark: operand bytes sent to workers with and without worker panel caches.
+
+Runs the real asyncio master in-process (offline, no data server) with a few
+workers that speak the real protocol. Without a cache every task carries its A
+and B panels. With one, workers keep the panels they were sent (up to
+--cache-mb) and the master only sends the panels a worker does not hold; tasks
+are handed out by supertile so consecutive leases share panels.
+
+Usage:
+    python bench_panels.py [--size 2048] [--block-size 128] [--workers 4] [--cache-mb 64]
+"""
+import argparse
+import asyncio
+import logging
+import socket
+import threading
+import time
+
+import numpy as np
+
+import master
+from panels import PanelCache, resolve_panels
+from helper import send_frame, receive_frame, ReceiveBuffer, MSG_HELLO, MSG_LEASE, MSG_RESULT, MSG_DONE, MSG_CANCEL
+
+
+def receive_reply(sock, buffer):
+    while True:
+        frame = receive_frame(sock, buffer)
+        if frame is None or frame.msg_type != MSG_CANCEL:
+            return frame
+
+
+def worker_loop(port, username, cache_bytes):
+    sock = socket.create_connection(('127.0.0.1', port))
+    recv_buffer = ReceiveBuffer(sock)
+    cache = PanelCache(cache_bytes)
+    with sock:
+        send_frame(sock, MSG_HELLO, meta={'username': username, 'gflops': 10.0, 'panel_cache': cache_bytes})
+        while True:
+            send_frame(sock, MSG_LEASE, meta={'max_tasks': 16})
+            frame = receive_reply(sock, recv_buffer)
+            if frame is None or frame.msg_type == MSG_DONE:
+                return
+            missing = []
+            if 'panels' in frame.meta:
+                blocks, missing = resolve_panels(cache, frame)
+            else:
+                blocks = list(zip(frame.arrays[0::2], frame.arrays[1::2]))
+            results = [np.dot(*block) if block is not None else np.empty((0, 0)) for block in blocks]
+            send_frame(sock, MSG_RESULT, frame.task_id, arrays=results,
+                       meta={'username': username, 'task_ids': frame.meta['task_ids'], 'missing': missing})
+            if receive_reply(sock, recv_buffer) is None:
+                return
+
+
+def run_job(port, A, B, block_size, n_workers, cache_bytes, run):
+    job = master.submit_job(A, B, submitter=f"bench-{run}", block_size=block_size)
+    threads = [threading.Thread(target=worker_loop, args=(port, f"bench-{run}-{idx}", cache_bytes), daemon=True)
+               for idx in range(n_workers)]
+    for thread in threads:
+        thread.start()
+    while job.finished is None:
+        time.sleep(0.01)
+    for thread in threads:
+        thread.join()
+    assert np.allclose(job.aggregator.C, A @ B), "Wrong product."
+    return job.finished - job.started, job.operand_bytes_sent, job.operand_bytes_saved
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size', type=int, default=2048, help="Matrix dimension (square matrices).")
+    parser.add_argument('--block-size', type=int, default=128, help="Square block size.")
+    parser.add_argument('--workers', type=int, default=4, help="Number of workers.")
+    parser.add_argument('--cache-mb', type=float, default=64, help="Panel cache per worker in MiB.")
+    parser.add_argument('--port', type=int, default=65435)
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    master.OFFLINE = True
+    master.CHECKPOINT_DIR = None
+    master.SPECULATION = False
+    master.IDLE_WAIT_SECONDS = 0
+    threading.Thread(target=lambda: asyncio.run(master.serve('127.0.0.1', args.port)), daemon=True).start()
+    time.sleep(0.5)
+
+    A = np.random.rand(args.size, args.size)
+    B = np.random.rand(args.size, args.size)
+    print(f"{args.size}x{args.size} float64 multiply, {args.block_size}x{args.block_size} blocks, "
+          f"{args.workers} workers, supertiles of {master.SUPERTILE_BLOCKS} blocks")
+    print(f"{'cache':>10} {'job s':>8} {'sent MiB':>9} {'saved MiB':>10}")
+    for run, cache_bytes in enumerate((0, int(args.cache_mb * 1024 * 1024))):
+        elapsed, sent, saved = run_job(args.port, A, B, args.block_size, args.workers, cache_bytes, run)
+        label = f"{args.cache_mb:g} MiB" if cache_bytes else 'off'
+        print(f"{label:>10} {elapsed:>8.2f} {sent / 2**20:>9.1f} {saved / 2**20:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+# bench_points_store.py
+"""
+Microbenchmark: latency of one points update as the user base grows.
+
+Compares the earlier whole-file JSON store (every write re-serializes all users
+with indent=4) with the SQLite store in user_points.py (one row updated in a
+WAL transaction), for each user count in --users.
+
+Usage:
+    python bench_points_store.py [--users 1000 10000 100000] [--writes 200]
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+from user_points import PointsStore
+
+
+def json_writes(directory, n_users, n_writes):
+    path = os.path.join(directory, f"points_{n_users}.json")
+    user_points = {f"user{idx}": {"points": 0, "wallet_address": None} for idx in range(n_users)}
+    started = time.perf_counter()
+    for _ in range(n_writes):
+        user_points[f"user{random.randrange(n_users)}"]["points"] += 1
+        with open(path, 'w') as f:
+            json.dump(user_points, f, indent=4)
+    return (time.perf_counter() - started) / n_writes
+
+
+def sqlite_writes(directory, n_users, n_writes):
+    store = PointsStore(os.path.join(directory, f"points_{n_users}.db"))
+    with store._transaction() as conn:
+        conn.executemany("INSERT INTO users (username) VALUES (?)", ((f"user{idx}",) for idx in range(n_users)))
+    started = time.perf_counter()
+    for _ in range(n_writes):
+        store.increment(f"user{random.randrange(n_users)}", 1)
+    elapsed = (time.perf_counter() - started) / n_writes
+    store.close()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, nargs='+', default=[1000, 10000, 100000], help="User counts.")
+    parser.add_argument('--writes', type=int, default=200, help="Updates timed per store and user count.")
+    args = parser.parse_args()
+
+    print(f"{'users':>8} {'json ms':>9} {'sqlite ms':>10}")
+    with tempfile.TemporaryDirectory() as directory:
+        for n_users in args.users:
+            # The JSON store is slow at scale; fewer writes still give a stable mean
+            json_ms = json_writes(directory, n_users, max(5, args.writes * 1000 // n_users)) * 1e3
+            sqlite_ms = sqlite_writes(directory, n_users, args.writes) * 1e3
+            print(f"{n_users:>8} {json_ms:>9.3f} {sqlite_ms:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+# bench_recv.py
+"""
+Microbenchmark: receive throughput against frame size over TCP loopback.
+
+Compares the old `data += packet` receive loop with ReceiveBuffer, which reads
+into a reused bytearray with recv_into(). The old loop is quadratic, so it is
+only run up to --legacy-max bytes by default.
+
+Usage:
+    python bench_recv.py [--max-size 268435456] [--legacy-max 16777216]
+"""
+import argparse
+import socket
+import threading
+import time
+
+from helper import ReceiveBuffer
+
+KB = 1024
+MB = 1024 * 1024
+
+
+def legacy_recvall(conn, n):
+    """The receive loop helper.recvall used before ReceiveBuffer existed."""
+    data = b''
+    while len(data) < n:
+        packet = conn.recv(n - len(data))
+        if not packet:
+            return None
+        data += packet
+    return data
+
+
+def frame_sizes(max_size):
+    size = KB
+    while size <= max_size:
+        yield size
+        size *= 4
+
+
+def iterations_for(size, budget=512 * MB):
+    return max(3, min(2000, budget // size))
+
+
+def run_case(size, iterations, receive):
+    """
+    Stream `iterations` frames of `size` bytes through a loopback connection
+    and time how long the receiver takes to consume them.
+    """
+    listener = socket.create_server(('127.0.0.1', 0))
+    port = listener.getsockname()[1]
+    payload = bytes(size)
+
+    def sender():
+        with socket.create_connection(('127.0.0.1', port)) as out:
+            for _ in range(iterations):
+                out.sendall(payload)
+
+    thread = threading.Thread(target=sender, daemon=True)
+    thread.start()
+    conn, _ = listener.accept()
+    with conn, listener:
+        start = time.perf_counter()
+        receive(conn, size, iterations)
+        elapsed = time.perf_counter() - start
+    thread.join()
+    return size * iterations / elapsed / MB
+
+
+def receive_legacy(conn, size, iterations):
+    for _ in range(iterations):
+        if legacy_recvall(conn, size) is None:
+            raise RuntimeError("Sender closed early.")
+
+
+def receive_buffered(conn, size, iterations):
+    buffer = ReceiveBuffer(conn)
+    for _ in range(iterations):
+        if buffer.recv_exact(size) is None:
+            raise RuntimeError("Sender closed early.")
+
+
+def human(size):
+    return f"{size // MB} MB" if size >= MB else f"{size // KB} KB"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--max-size', type=int, default=256 * MB, help="Largest frame size in bytes.")
+    parser.add_argument('--legacy-max', type=int, default=16 * MB, help="Largest frame size for the old loop.")
+    args = parser.parse_args()
+
+    print(f"{'frame':>8} {'iters':>6} {'legacy MB/s':>12} {'buffered MB/s':>14} {'speedup':>8}")
+    for size in frame_sizes(args.max_size):
+        iterations = iterations_for(size)
+        buffered = run_case(size, iterations, receive_buffered)
+        if size <= args.legacy_max:
+            legacy = run_case(size, iterations, receive_legacy)
+            print(f"{human(size):>8} {iterations:>6} {legacy:>12.1f} {buffered:>14.1f} {buffered / legacy:>7.1f}x")
+        else:
+            print(f"{human(size):>8} {iterations:>6} {'skipped':>12} {buffered:>14.1f} {'-':>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+# bench_stragglers.py
+"""
+Benchmark: job time with a slow worker, with and without speculative copies.
+
+Runs the real asyncio master in-process (offline, no data server) with a few
+fast workers and one worker that sleeps --slow-delay seconds per task. Without
+speculation the job cannot finish before the slow worker returns its last
+lease; with speculation the idle fast workers copy that lease once it is past
+its deadline, the first valid result wins and the slow worker is told to skip
+the rest.
+
+Usage:
+    python bench_stragglers.py [--size 1024] [--block-size 128] [--workers 4] [--slow-delay 3.0]
+"""
+import argparse
+import asyncio
+import logging
+import select
+import socket
+import threading
+import time
+
+import numpy as np
+
+import master
+from stragglers import LatencyTracker
+from helper import (send_frame, receive_frame, ReceiveBuffer, MSG_HELLO, MSG_LEASE, MSG_RESULT, MSG_DONE,
+                    MSG_CANCEL)
+
+
+def receive_reply(sock, buffer):
+    while True:
+        frame = receive_frame(sock, buffer)
+        if frame is None or frame.msg_type != MSG_CANCEL:
+            return frame
+
+
+def worker_loop(port, username, delay, stats):
+    sock = socket.create_connection(('127.0.0.1', port))
+    recv_buffer = ReceiveBuffer(sock)
+    control_buffer = ReceiveBuffer(sock, initial_size=4096)
+    with sock:
+        send_frame(sock, MSG_HELLO, meta={'username': username, 'gflops': 1.0})
+        while True:
+            send_frame(sock, MSG_LEASE, meta={'max_tasks': 64})
+            frame = receive_reply(sock, recv_buffer)
+            if frame is None or frame.msg_type == MSG_DONE:
+                return
+            task_ids = frame.meta['task_ids']
+            results = []
+            cancelled = set()
+            for task_id, a, b in zip(task_ids, frame.arrays[0::2], frame.arrays[1::2]):
+                while select.select([sock], [], [], 0)[0]:
+                    notice = receive_frame(sock, control_buffer)
+                    if notice is None:
+                        return
+                    if notice.msg_type == MSG_CANCEL and notice.task_id == frame.task_id:
+                        cancelled.update(notice.meta['task_ids'])
+                if task_id in cancelled:
+                    results.append(np.empty((0, 0), dtype=np.result_type(a, b)))
+                    stats['skipped'] += 1
+                    continue
+                time.sleep(delay)
+                results.append(np.dot(a, b))
+            send_frame(sock, MSG_RESULT, frame.task_id, arrays=results,
+                       meta={'username': username, 'task_ids': task_ids})
+            if receive_reply(sock, recv_buffer) is None:
+                return
+
+
+def run_job(port, A, B, block_size, n_workers, slow_delay, speculation, run):
+    master.SPECULATION = speculation
+    # Start each run without the previous run's latencies
+    master.latency_tracker = master.lease_table.latency = LatencyTracker()
+    job = master.submit_job(A, B, submitter=f"bench-{run}", block_size=block_size)
+    stats = {'skipped': 0}
+    delays = [0.0] * n_workers + [slow_delay]
+    threads = [threading.Thread(target=worker_loop, args=(port, f"bench-{run}-{idx}", delay, stats), daemon=True)
+               for idx, delay in enumerate(delays)]
+    for thread in threads:
+        thread.start()
+    while job.finished is None:
+        time.sleep(0.01)
+    for thread in threads:
+        thread.join()
+    assert np.allclose(job.aggregator.C, A @ B), "Wrong product."
+    return job.finished - job.started, job.speculative_tasks, job.speculative_wins, stats['skipped']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size', type=int, default=1024, help="Matrix dimension (square matrices).")
+    parser.add_argument('--block-size', type=int, default=128, help="Square block size.")
+    parser.add_argument('--workers', type=int, default=4, help="Number of fast workers.")
+    parser.add_argument('--slow-delay', type=float, default=3.0, help="Extra seconds per task on the slow worker.")
+    parser.add_argument('--port', type=int, default=65434)
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    master.OFFLINE = True
+    master.CHECKPOINT_DIR = None
+    master.IDLE_WAIT_SECONDS = 0
+    threading.Thread(target=lambda: asyncio.run(master.serve('127.0.0.1', args.port)), daemon=True).start()
+    time.sleep(0.5)
+
+    A = np.random.rand(args.size, args.size)
+    B = np.random.rand(args.size, args.size)
+    print(f"{args.size}x{args.size} float64 multiply, {args.block_size}x{args.block_size} blocks, "
+          f"{args.workers} fast workers + 1 with {args.slow_delay}s per task")
+    print(f"{'speculation':>12} {'job s':>8} {'copies':>7} {'won':>5} {'skipped':>8}")
+    for run, speculation in enumerate((False, True)):
+        elapsed, copies, wins, skipped = run_job(args.port, A, B, args.block_size, args.workers,
+                                                 args.slow_delay, speculation, run)
+        print(f"{'on' if speculation else 'off':>12} {elapsed:>8.2f} {copies:>7} {wins:>5} {skipped:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+# bench_tiling.py
+"""
+Benchmark: time to solution of one distributed multiply across tile shapes.
+
+Runs the real lease protocol (binary frames over loopback sockets, TaskSource
+leasing, Freivalds verification on the master side) with in-process worker
+threads, once per square block size and once with the tile shape chosen by
+scheduler.plan_tiles for the measured local workers.
+
+Usage:
+    python bench_tiling.py [--size 512] [--workers 4]
+"""
+import argparse
+import socket
+import threading
+import time
+
+import numpy as np
+
+from check import check
+from helper import send_frame, receive_frame, ReceiveBuffer, MSG_TASK, MSG_RESULT, MSG_DONE
+from scheduler import WorkerProfile, plan_tiles, fixed_plan, estimate_seconds, measure_gflops
+from task_source import TaskSource
+
+LEASE_BYTES = 4 * 1024 * 1024  # Operand bytes per lease
+
+
+def worker_loop(sock):
+    recv_buffer = ReceiveBuffer(sock)
+    while True:
+        frame = receive_frame(sock, recv_buffer)
+        if frame is None or frame.msg_type == MSG_DONE:
+            return
+        results = [np.dot(a, b) for a, b in zip(frame.arrays[0::2], frame.arrays[1::2])]
+        send_frame(sock, MSG_RESULT, frame.task_id, arrays=results)
+
+
+def master_loop(sock, A, B, plan, source, tasks_per_lease):
+    recv_buffer = ReceiveBuffer(sock)
+    lease_id = 0
+    while True:
+        leased = source.lease(tasks_per_lease)
+        if not leased:
+            send_frame(sock, MSG_DONE)
+            return
+        lease_id += 1
+        blocks = []
+        for first, _ in leased:
+            i, j, kk = source.coordinates(first)
+            depth = slice(kk * plan.tile_k, (kk + 1) * plan.tile_k)
+            blocks.append(A[i * plan.tile_m:(i + 1) * plan.tile_m, depth])
+            blocks.append(B[depth, j * plan.tile_n:(j + 1) * plan.tile_n])
+        send_frame(sock, MSG_TASK, lease_id, arrays=blocks)
+        frame = receive_frame(sock, recv_buffer)
+        for (first, _), a, b, c in zip(leased, blocks[0::2], blocks[1::2], frame.arrays):
+            if check(a, b, c) == 1:
+                source.complete([first])
+            else:
+                source.fail([first])
+
+
+def run_job(A, B, plan, n_workers):
+    """
+    Execute one job end to end and return the wall-clock time in seconds.
+    """
+    source = TaskSource(plan.grid_m, plan.grid_n, plan.grid_k)
+    task_bytes = (plan.tile_m + plan.tile_n) * plan.tile_k * A.itemsize
+    tasks_per_lease = max(1, LEASE_BYTES // task_bytes)
+
+    threads = []
+    start = time.perf_counter()
+    for _ in range(n_workers):
+        master_side, worker_side = socket.socketpair()
+        threads.append(threading.Thread(target=worker_loop, args=(worker_side,), daemon=True))
+        threads.append(threading.Thread(target=master_loop, args=(master_side, A, B, plan, source, tasks_per_lease), daemon=True))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    assert source.completed == source.total, "Job did not complete."
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size', type=int, default=512, help="Matrix dimension (square matrices).")
+    parser.add_argument('--workers', type=int, default=4, help="Number of in-process workers.")
+    parser.add_argument('--min-block', type=int, default=4, help="Smallest square block size to try.")
+    args = parser.parse_args()
+
+    size = args.size
+    A = np.random.randint(0, 10, size=(size, size))
+    B = np.random.randint(0, 10, size=(size, size))
+
+    # Local workers: measured compute, loopback treated as a fast link
+    gflops = measure_gflops()
+    profiles = [WorkerProfile(gflops=gflops / args.workers, bandwidth=1e9) for _ in range(args.workers)]
+
+    plans = []
+    block = args.min_block
+    while block <= size:
+        plans.append((f"{block}x{block}", fixed_plan(size, size, size, block)))
+        block *= 2
+    chosen = plan_tiles(size, size, size, A.itemsize, profiles)
+    plans.append((f"auto {chosen.tile_m}x{chosen.tile_n}x{chosen.tile_k}", chosen))
+
+    print(f"{size}x{size} int64 multiply, {args.workers} workers, ~{gflops:.1f} GFLOP/s local BLAS")
+    print(f"{'tiles':>22} {'tasks':>8} {'model s':>9} {'measured s':>11}")
+    for label, plan in plans:
+        tasks = plan.grid_m * plan.grid_n * plan.grid_k
+        model = estimate_seconds(size, size, size, plan.tile_m, plan.tile_n, plan.tile_k, A.itemsize, profiles)
+        elapsed = run_job(A, B, plan, args.workers)
+        print(f"{label:>22} {tasks:>8} {model:>9.3f} {elapsed:>11.3f}")
+
+
+if __name__ == "__main__":
+    main()
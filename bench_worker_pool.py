@@ -0,0 +1,68 @@
+# bench_worker_pool.py
+"""
+Microbenchmark: worker compute throughput by number of compute slots.
+
+Runs one lease of small tiles and one of BLAS-sized tiles through a
+ComputePool with 1, 2, 4, ... slots up to the core count, and reports tasks
+per second and GFLOP/s. Small tiles go to the process pool in batches, large
+ones to the thread pool one per slot.
+
+Usage:
+    python bench_worker_pool.py [--small 32] [--large 512] [--tasks 2048]
+"""
+import argparse
+import os
+import threading
+import time
+
+import numpy as np
+
+from worker_pool import ComputePool
+
+
+def run_lease(pool, blocks):
+    finished = threading.Event()
+    out = {}
+
+    def done(results, seconds):
+        out['results'] = results
+        finished.set()
+
+    started = time.perf_counter()
+    pool.run(blocks, lambda index: False, done)
+    finished.wait()
+    return time.perf_counter() - started, out['results']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--small', type=int, default=32, help="Block size of the small-tile lease.")
+    parser.add_argument('--large', type=int, default=512, help="Block size of the large-tile lease.")
+    parser.add_argument('--tasks', type=int, default=2048, help="Tasks in the small-tile lease.")
+    args = parser.parse_args()
+
+    cores = os.cpu_count() or 1
+    slot_counts = sorted({1 << i for i in range(cores.bit_length()) if 1 << i <= cores} | {cores})
+    leases = [
+        ('small', args.small, [(np.random.rand(args.small, args.small), np.random.rand(args.small, args.small))
+                               for _ in range(args.tasks)]),
+        ('large', args.large, [(np.random.rand(args.large, args.large), np.random.rand(args.large, args.large))
+                               for _ in range(max(cores, 4))]),
+    ]
+    print(f"{cores} cores")
+    print(f"{'tiles':>6} {'block':>6} {'slots':>6} {'tasks/s':>10} {'GFLOP/s':>8}")
+    for slots in slot_counts:
+        pool = ComputePool(slots)
+        try:
+            run_lease(pool, leases[0][2][:slots * 64])  # Start the pool's processes
+            for kind, size, blocks in leases:
+                seconds, results = run_lease(pool, blocks)
+                assert np.allclose(results[0], blocks[0][0] @ blocks[0][1]), "Wrong product."
+                gflops = 2 * size ** 3 * len(blocks) / seconds / 1e9
+                print(f"{kind:>6} {size:>6} {slots:>6} {len(blocks) / seconds:>10.0f} {gflops:>8.2f}")
+        finally:
+            pool.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,20 @@
 # check.py
+import os
+import random
+import threading
 import numpy as np
 import logging
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+# Floating point verification
+FLOAT_PROBES = 3  # Independent Gaussian probe vectors per float check
+TOLERANCE_FACTOR = 2.0  # Safety factor on the k * eps rounding-error bound
 
 def check(a_block, b_block, c_block):
     """
-    Validates the result of a single block multiplication using a random vector.
+    Validates the result of a single block multiplication using random probe
+    vectors: exact for integer blocks, within a rounding-error bound for floats.
     Returns 1 if correct, 0 otherwise.
     
     Parameters:
@@ -16,24 +26,252 @@ def check(a_block, b_block, c_block):
     - int: 1 if the multiplication is correct, 0 otherwise.
     """
     try:
-        # Generate a random vector with entries between 0 and 999
-        test_vector = np.random.randint(0, 1000, size=(b_block.shape[1], 1))
-        
-        # Compute (A * B) * test_vector
-        expected = np.dot(a_block, np.dot(b_block, test_vector))
-        
-        # Compute C * test_vector
-        actual = np.dot(c_block, test_vector)
-        
-        # Check if the two results match
-        if np.array_equal(expected, actual):
-            return 1
-        else:
-            # Log the discrepancy for debugging
-            logging.debug(f"Validation failed:")
-            logging.debug(f"Expected:\n{expected}")
-            logging.debug(f"Actual:\n{actual}")
+        if not result_matches(a_block, b_block, c_block):
             return 0
+        return int(check_batch(a_block[None], b_block[None], c_block[None])[0])
     except Exception as e:
         logging.error(f"Error during validation: {e}")
         return 0
+
+def result_matches(a_block, b_block, c_block):
+    """
+    Whether a result has the shape and dtype of a_block @ b_block. The dtype is
+    fixed by the operands, not chosen by the worker: a less precise result would
+    widen the float tolerance, and a float result would dodge the exact integer check.
+    """
+    if a_block.shape[1] != b_block.shape[0] or c_block.shape != (a_block.shape[0], b_block.shape[1]):
+        logging.debug(f"Validation failed: result shape {c_block.shape} does not match operands.")
+        return False
+    if c_block.dtype != np.result_type(a_block, b_block):
+        logging.debug(f"Validation failed: result dtype {c_block.dtype} does not match operands.")
+        return False
+    return True
+
+def float_epsilon(*arrays):
+    """
+    Machine epsilon of the least precise floating point array, or None if all
+    arrays are integer.
+    """
+    eps = [np.finfo(a.dtype).eps for a in arrays if a.dtype.kind in 'fc']
+    return max(eps) if eps else None
+
+def check_batch(a_stack, b_stack, c_stack, probes=None):
+    """
+    Validates many same-shape block multiplications at once. Random probe vectors
+    are shared by the whole batch and both sides of the Freivalds test are
+    computed with single batched np.matmul calls.
+
+    Integer batches are compared exactly. If either operand is floating point,
+    the test runs in float64 against the standard rounding-error bound
+    |C r - A (B r)| <= TOLERANCE_FACTOR * k * eps * |A| (|B| |r|), where eps is
+    the epsilon of the less precise operand. The bound never depends on the
+    result's dtype, which callers check first with result_matches. A result that is off by an error
+    vector e in some row passes one Gaussian probe with probability at most
+    about 0.8 * bound / ||e||, and every one of the `probes` independent probes
+    must pass, so correct but reordered BLAS results are accepted while the
+    false-accept probability stays bounded.
+
+    Parameters:
+    - a_stack (np.ndarray): Stacked A blocks, shape (n, m, k).
+    - b_stack (np.ndarray): Stacked B blocks, shape (n, k, p).
+    - c_stack (np.ndarray): Stacked result blocks, shape (n, m, p).
+    - probes (int or None): Number of probe vectors; defaults to 1 for integers
+      and FLOAT_PROBES for floats.
+
+    Returns:
+    - np.ndarray: 1 for each correct result, 0 otherwise.
+    """
+    eps = float_epsilon(a_stack, b_stack)
+    if eps is None:
+        test_vectors = np.random.randint(0, 1000, size=(b_stack.shape[2], probes or 1))
+        expected = np.matmul(a_stack, np.matmul(b_stack, test_vectors))
+        actual = np.matmul(c_stack, test_vectors)
+        return np.all(expected == actual, axis=(1, 2)).astype(int)
+
+    work = np.complex128 if any(x.dtype.kind == 'c' for x in (a_stack, b_stack)) else np.float64
+    a_work = a_stack.astype(work, copy=False)
+    b_work = b_stack.astype(work, copy=False)
+    c_work = c_stack.astype(work, copy=False)
+    test_vectors = np.random.standard_normal((b_stack.shape[2], probes or FLOAT_PROBES))
+
+    expected = np.matmul(a_work, np.matmul(b_work, test_vectors))
+    actual = np.matmul(c_work, test_vectors)
+    magnitude = np.matmul(np.abs(a_work), np.matmul(np.abs(b_work), np.abs(test_vectors)))
+    bound = TOLERANCE_FACTOR * a_stack.shape[2] * eps * magnitude
+    within = (np.abs(expected - actual) <= bound) & np.isfinite(actual)
+    return np.all(within, axis=(1, 2)).astype(int)
+
+def check_many(triples):
+    """
+    Validates a list of (a_block, b_block, c_block) triples. Results of the wrong
+    shape or dtype fail; the rest are stacked by shapes and dtypes and checked
+    together with check_batch.
+
+    Parameters:
+    - triples (list of tuple): (a_block, b_block, c_block) per result.
+
+    Returns:
+    - list of int: 1 if the corresponding result is correct, 0 otherwise.
+    """
+    verdicts = [0] * len(triples)
+    groups = defaultdict(list)
+    for idx, (a_block, b_block, c_block) in enumerate(triples):
+        if not result_matches(a_block, b_block, c_block):
+            continue
+        groups[(a_block.shape, b_block.shape, a_block.dtype, b_block.dtype, c_block.dtype)].append(idx)
+
+    for idxs in groups.values():
+        try:
+            a_stack = np.stack([triples[idx][0] for idx in idxs])
+            b_stack = np.stack([triples[idx][1] for idx in idxs])
+            c_stack = np.stack([triples[idx][2] for idx in idxs])
+            for idx, verdict in zip(idxs, check_batch(a_stack, b_stack, c_stack)):
+                verdicts[idx] = int(verdict)
+        except Exception as e:
+            logging.error(f"Error during batch validation: {e}")
+    return verdicts
+
+class VerificationPool:
+    """
+    Runs batch verification on a shared thread pool, off the per-connection
+    threads. NumPy releases the GIL inside matmul, so batches from different
+    workers are verified in parallel.
+    """
+    def __init__(self, max_workers=None):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers or os.cpu_count(),
+                                            thread_name_prefix="Verifier")
+
+    def submit(self, triples):
+        """
+        Queue a batch of (a_block, b_block, c_block) triples for verification.
+        The arrays must not be modified until the returned future is done.
+
+        Returns:
+        - concurrent.futures.Future: Resolves to the list of verdicts from check_many.
+        """
+        return self._executor.submit(check_many, triples)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+class VerificationPolicy:
+    """
+    Spot-check policy driven by per-worker trust.
+
+    Every worker starts on probation and has all of its results verified. Once it
+    has passed `probation` checks, its results are sampled at a rate that decays
+    with its record, down to `min_rate`. Results accepted without verification
+    stay in a per-worker audit window (bounded by `audit_window_bytes`) so that a
+    failed spot check can retroactively invalidate them; a failure also puts the
+    worker back on probation. The windows of all workers together are bounded by
+    `audit_budget_bytes`: past it, the oldest results of any worker leave first.
+    Results that age out of the window are final.
+    """
+    def __init__(self, min_rate=0.05, probation=32, audit_window_bytes=64 * 1024 * 1024,
+                 audit_budget_bytes=1024 * 1024 * 1024):
+        self.min_rate = min_rate
+        self.probation = probation
+        self.audit_window_bytes = audit_window_bytes
+        self.audit_budget_bytes = audit_budget_bytes
+        self._workers = {}  # worker -> {'passed', 'window', 'window_bytes'}; window holds (seq, entry)
+        self._order = deque()  # (seq, worker) of every windowed result, oldest first; may hold stale entries
+        self._seq = 0
+        self._entries = 0  # Results in all windows
+        self._window_bytes = 0  # Bytes in all windows
+        self._lock = threading.Lock()
+
+    def _record(self, worker):
+        return self._workers.setdefault(worker, {'passed': 0, 'window': deque(), 'window_bytes': 0})
+
+    def _evict_oldest(self, record):
+        # Called with the lock held
+        _, entry = record['window'].popleft()
+        record['window_bytes'] -= entry[2].nbytes
+        self._window_bytes -= entry[2].nbytes
+        self._entries -= 1
+
+    def sample_rate(self, worker):
+        """
+        Fraction of a worker's results that should be verified.
+        """
+        with self._lock:
+            passed = self._record(worker)['passed']
+        if passed < self.probation:
+            return 1.0
+        return max(self.min_rate, self.probation / passed)
+
+    def select(self, worker, n):
+        """
+        Decide which of n results from a worker to verify.
+
+        Returns:
+        - list of bool: True for each result that must be verified.
+        """
+        rate = self.sample_rate(worker)
+        return [rate >= 1.0 or random.random() < rate for _ in range(n)]
+
+    def record_pass(self, worker, passed, accepted=()):
+        """
+        Record a lease whose spot checks all passed.
+
+        Parameters:
+        - worker (str): Worker identity (username).
+        - passed (int): Number of results verified and found correct.
+        - accepted (iterable): (task_id, span, block, ...) of results accepted unverified;
+          any fields after the block are kept as they are.
+        """
+        with self._lock:
+            record = self._record(worker)
+            record['passed'] += passed
+            for entry in accepted:
+                self._seq += 1
+                record['window'].append((self._seq, entry))
+                record['window_bytes'] += entry[2].nbytes
+                self._order.append((self._seq, worker))
+                self._window_bytes += entry[2].nbytes
+                self._entries += 1
+            while record['window'] and record['window_bytes'] > self.audit_window_bytes:
+                self._evict_oldest(record)
+            while self._order and self._window_bytes > self.audit_budget_bytes:
+                seq, owner = self._order.popleft()
+                oldest = self._workers.get(owner)
+                # Skip results already gone: evicted from their own window or invalidated
+                if oldest is not None and oldest['window'] and oldest['window'][0][0] == seq:
+                    self._evict_oldest(oldest)
+            if len(self._order) > 2 * self._entries + 1024:
+                # Mostly stale: rebuild from the windows
+                self._order = deque(sorted((seq, owner) for owner, record in self._workers.items()
+                                           for seq, _ in record['window']))
+
+    def record_failure(self, worker):
+        """
+        Record a failed spot check: the worker goes back on probation.
+
+        Returns:
+        - list of tuple: (task_id, span, block, ...) entries of the worker's unverified results
+          still in the audit window, which must be invalidated and recomputed.
+        """
+        with self._lock:
+            record = self._record(worker)
+            invalidated = [entry for _, entry in record['window']]
+            self._window_bytes -= record['window_bytes']
+            self._entries -= len(invalidated)
+            self._workers[worker] = {'passed': 0, 'window': deque(), 'window_bytes': 0}
+        logging.warning(f"Spot check failed for '{worker}': back on probation, "
+                        f"{len(invalidated)} unverified results invalidated.")
+        return invalidated
+
+    def windowed(self, field):
+        """
+        The distinct values of entry[field] over all unverified results still in
+        the audit windows, e.g. the jobs whose results may yet be invalidated.
+        """
+        with self._lock:
+            return {entry[field] for record in self._workers.values() for _, entry in record['window']}
+
+    def window_bytes(self):
+        """
+        Bytes of unverified results held in the audit windows of all workers.
+        """
+        with self._lock:
+            return self._window_bytes
@@ -0,0 +1,248 @@
+# checkpoint.py
+import os
+import json
+import time
+import shutil
+import struct
+import logging
+import threading
+
+import numpy as np
+
+# One record per result written into C: first task id and number of k tiles.
+# A negative count retracts an earlier result.
+PROGRESS_RECORD = struct.Struct('<qi')
+RECORD_DTYPE = np.dtype([('first', '<i8'), ('count', '<i4')])
+COMMIT_INTERVAL_SECONDS = 1.0  # Group commit interval of the progress log
+
+
+class JobCheckpoint:
+    """
+    On-disk state of one job, enough to resume it after the master restarts:
+
+    - meta.json: id, submitter, priority, tile plan and state of the job.
+    - a.npy, b.npy: the operands.
+    - c.npy: C itself, memory-mapped by the job's ResultAggregator.
+    - progress.log: append-only PROGRESS_RECORDs of the results added to C.
+
+    Once a finished job's results are final, compact() deletes the operands and
+    the log; meta.json and C stay so the result survives a restart until the
+    job is evicted, which discards the directory.
+
+    Records are group-committed every COMMIT_INTERVAL_SECONDS: C is flushed
+    before the records are appended and fsynced, so every logged result is on
+    disk in C. Writes to C that had not been logged yet when the master died
+    cannot be told apart, so on resume only (i, j) blocks whose k tiles are all
+    logged are kept; every other block is zeroed and recomputed.
+
+    Once closed as cancelled, the directory is gone and every further call is a
+    no-op, so results of the job still in flight cannot fail on it.
+
+    Parameters:
+    - directory (str): The job's checkpoint directory.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.c_path = os.path.join(directory, 'c.npy')
+        self.log_path = os.path.join(directory, 'progress.log')
+        self.meta_path = os.path.join(directory, 'meta.json')
+        self.aggregator = None
+        self.cancelled = False
+        self._log = None
+        self._pending = []
+        self._lock = threading.Lock()  # Guards _pending
+        self._commit_lock = threading.Lock()  # Keeps commits, and so the log, in order
+        self._stop = threading.Event()
+        self._thread = None
+
+    def save(self, job):
+        """
+        Write the operands and metadata of a new job. meta.json is written last,
+        so a directory without it is an incomplete checkpoint and is never resumed.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        for name, array in (('a', job.a), ('b', job.b)):
+            path = os.path.join(self.directory, f'{name}.npy')
+            with open(path, 'wb') as f:
+                np.save(f, array)
+                f.flush()
+                os.fsync(f.fileno())
+        self.write_meta({
+            'job_id': job.job_id,
+            'submitter': job.submitter,
+            'priority': job.priority,
+            'plan': list(job.plan),
+            'dtype': job.dtype.str,
+            'submitted': job.submitted,
+            'state': 'running',
+        })
+
+    def write_meta(self, meta):
+        tmp_path = self.meta_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(meta, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.meta_path)
+
+    def read_meta(self):
+        with open(self.meta_path) as f:
+            return json.load(f)
+
+    def load_operands(self):
+        """
+        Memory-map the saved operands read-only.
+        """
+        return (np.load(os.path.join(self.directory, 'a.npy'), mmap_mode='r'),
+                np.load(os.path.join(self.directory, 'b.npy'), mmap_mode='r'))
+
+    def replay(self, plan):
+        """
+        Read the progress log back.
+
+        Parameters:
+        - plan (scheduler.TilePlan): The job's tile plan.
+
+        Returns:
+        - np.ndarray: (grid_m * grid_n,) bool, True for (i, j) blocks whose k tiles are all logged.
+        """
+        total = plan.grid_m * plan.grid_n * plan.grid_k
+        data = b''
+        if os.path.exists(self.log_path):
+            with open(self.log_path, 'rb') as f:
+                data = f.read()
+        # A record torn by the crash is ignored
+        usable = len(data) - len(data) % PROGRESS_RECORD.size
+        records = np.frombuffer(data[:usable], dtype=RECORD_DTYPE)
+        if (records['count'] > 0).all():
+            # No retractions: mark the logged ranges in one pass
+            delta = np.zeros(total + 1, dtype=np.int64)
+            np.add.at(delta, records['first'], 1)
+            np.add.at(delta, records['first'] + records['count'], -1)
+            logged = np.cumsum(delta[:-1]) > 0
+        else:
+            logged = np.zeros(total, dtype=bool)
+            for first, count in records:
+                logged[first:first + abs(count)] = count > 0
+        if usable != len(data):
+            with open(self.log_path, 'r+b') as f:
+                f.truncate(usable)
+        return logged.reshape(plan.grid_m * plan.grid_n, plan.grid_k).all(axis=1)
+
+    def open(self, aggregator=None):
+        """
+        Start logging results added to `aggregator`, whose C is memory-mapped at
+        c_path. Without an aggregator, reopen the log of a closed checkpoint.
+        """
+        self.aggregator = aggregator or self.aggregator
+        with self._commit_lock:
+            if self._log is not None or self.cancelled:
+                return
+            self._log = open(self.log_path, 'ab')
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"Checkpoint-{os.path.basename(self.directory)}",
+                                        daemon=True)
+        self._thread.start()
+
+    def record(self, first, count):
+        """
+        Log a result added to C. It is durable after the next commit.
+        """
+        if self.cancelled:
+            return
+        with self._lock:
+            self._pending.append(PROGRESS_RECORD.pack(first, count))
+
+    def retract(self, first, count):
+        """
+        Log that a result is about to be subtracted from C. Commits immediately:
+        the retraction must be durable before C changes. A finished job's log is
+        reopened, as the retracted tiles will be recomputed.
+        """
+        if self.cancelled:
+            return
+        self.open()
+        with self._lock:
+            self._pending.append(PROGRESS_RECORD.pack(first, -count))
+        self.commit()
+
+    def commit(self):
+        """
+        Flush C, then append and fsync the pending records.
+        """
+        with self._commit_lock:
+            with self._lock:
+                records, self._pending = self._pending, []
+            if not records or self._log is None:
+                return
+            try:
+                self.aggregator.C.flush()
+                self._log.write(b''.join(records))
+                self._log.flush()
+                os.fsync(self._log.fileno())
+            except Exception as e:
+                logging.error(f"Checkpoint of {self.directory} failed: {e}")
+
+    def _run(self):
+        stop = self._stop
+        while not stop.wait(COMMIT_INTERVAL_SECONDS):
+            self.commit()
+
+    def compact(self, job):
+        """
+        Delete the operands and progress log of a finished job whose results are
+        final. meta.json records the shapes and dtypes of the operands instead,
+        and that C is complete.
+        """
+        if self.cancelled:
+            return
+        meta = self.read_meta()
+        if meta.get('compacted'):
+            return
+        meta.update(compacted=True, shape=list(job.shape), a_dtype=np.dtype(job.a.dtype).str,
+                    b_dtype=np.dtype(job.b.dtype).str)
+        self.write_meta(meta)
+        for name in ('a.npy', 'b.npy', 'progress.log'):
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+
+    def close(self, state, finished=None):
+        """
+        Stop logging and record the job's final state ('done' or 'cancelled').
+        A cancelled job's directory is removed with its result.
+        """
+        if self.cancelled:
+            return
+        self._stop.set()
+        self.commit()
+        with self._commit_lock:
+            if self._log is not None:
+                self._log.close()
+                self._log = None
+            self.cancelled = state == 'cancelled'
+        if state == 'cancelled':
+            shutil.rmtree(self.directory, ignore_errors=True)
+            return
+        meta = self.read_meta()
+        meta.update(state=state, finished=finished or time.time())
+        self.write_meta(meta)
+
+
+def find_checkpoints(root):
+    """
+    Checkpoint directories under `root` that can be resumed, oldest first.
+    """
+    if not root or not os.path.isdir(root):
+        return []
+    checkpoints = []
+    for name in os.listdir(root):
+        checkpoint = JobCheckpoint(os.path.join(root, name))
+        try:
+            meta = checkpoint.read_meta()
+        except (OSError, ValueError):
+            continue
+        checkpoints.append((meta.get('submitted', 0), checkpoint))
+    return [checkpoint for _, checkpoint in sorted(checkpoints, key=lambda entry: entry[0])]
@@ -2,10 +2,14 @@
 from flask import Flask, request, jsonify
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_cors import CORS
-import json
-import os
+import argparse
 import logging
-from user_points import load_user_points, save_user_points, set_wallet_address, get_wallet_address
+from user_points import PointsStore, DB_FILE
+
+try:
+    from gunicorn.app.base import BaseApplication
+except ImportError:  # Optional: only needed to serve with several processes
+    BaseApplication = None
 
 # Configure Logging
 logging.basicConfig(
@@ -17,21 +21,18 @@ logging.basicConfig(
     ]
 )
 
+# Data Server Configuration
+DATA_SERVER_HOST = '0.0.0.0'
+DATA_SERVER_PORT = 5001  # Differs from master.py's ports
+SERVER_WORKERS = 1  # Processes serving requests; more than one needs gunicorn (pip install gunicorn)
+SERVER_THREADS = 8  # Threads per process
+
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all domains on all routes
 
-# User Data File
-USER_DATA_FILE = 'users.json'
-
-# Load or initialize user data
-if os.path.exists(USER_DATA_FILE):
-    with open(USER_DATA_FILE, 'r') as f:
-        users = json.load(f)
-else:
-    users = {}
-
-# Load user points
-user_points = load_user_points()  # Maps usernames to points and wallet addresses
+# Users, points and wallet addresses; users.json and user_points.json of earlier versions are imported once
+store = PointsStore(DB_FILE)
+store.migrate_json()
 
 @app.route('/register', methods=['POST'])
 def register():
@@ -46,15 +47,9 @@ def register():
     username = data['username']
     password = data['password']
 
-    if username in users:
-        return jsonify({'message': 'Username already exists.'}), 400
-
     hashed_password = generate_password_hash(password)
-    users[username] = hashed_password
-    save_users()
-
-    user_points[username] = {"points": 0, "wallet_address": None}  # Initialize points and wallet
-    save_user_points(user_points)
+    if not store.register(username, hashed_password):  # Starts with no points and no wallet
+        return jsonify({'message': 'Username already exists.'}), 400
 
     logging.info(f"User registered: {username}")
     return jsonify({'message': 'Registration successful.'}), 201
@@ -72,11 +67,13 @@ def login():
     username = data['username']
     password = data['password']
 
-    if username not in users or not check_password_hash(users[username], password):
+    hashed_password = store.password_hash(username)
+    if hashed_password is None or not check_password_hash(hashed_password, password):
         return jsonify({'message': 'Invalid username or password.'}), 401
 
-    points = user_points.get(username, {}).get('points', 0)
-    wallet_address = user_points.get(username, {}).get('wallet_address', None)
+    user_info = store.get(username)
+    points = user_info['points']
+    wallet_address = user_info['wallet_address']
     logging.info(f"User logged in: {username}")
     return jsonify({'message': 'Login successful.', 'points': points, 'wallet_address': wallet_address}), 200
 
@@ -90,12 +87,12 @@ def get_points():
     if not username:
         return jsonify({'message': 'Username is required.'}), 400
 
-    if username not in user_points:
+    user_info = store.get(username)
+    if user_info is None:
         return jsonify({'message': 'User does not exist.'}), 400
 
-    user_info = user_points.get(username, {})
-    points = user_info.get('points', 0)
-    wallet_address = user_info.get('wallet_address', None)
+    points = user_info['points']
+    wallet_address = user_info['wallet_address']
     return jsonify({'username': username, 'points': points, 'wallet_address': wallet_address}), 200
 
 @app.route('/update_points', methods=['POST'])
@@ -111,15 +108,55 @@ def update_points():
     username = data['username']
     points = data['points']
 
-    if username not in users:
+    if not store.set_points(username, points):
         return jsonify({'message': 'User does not exist.'}), 400
 
-    user_points[username]['points'] = points
-    save_user_points(user_points)
-
     logging.info(f"Points updated for user '{username}': {points}")
     return jsonify({'message': 'Points updated successfully.'}), 200
 
+@app.route('/increment_points', methods=['POST'])
+def increment_points():
+    """
+    Add points to a given user; negative points debit them.
+    Expects JSON payload with 'username' and 'points'.
+    """
+    data = request.get_json()
+    if not isinstance(data, dict) or not data.get('username') or type(data.get('points')) is not int:
+        return jsonify({'message': 'Username and integer points are required.'}), 400
+
+    username = data['username']
+    points = store.increment(username, data['points'])
+    if points is None:
+        return jsonify({'message': 'User does not exist.'}), 400
+
+    logging.info(f"Points of user '{username}' changed by {data['points']} to {points}")
+    return jsonify({'message': 'Points updated successfully.', 'points': points}), 200
+
+@app.route('/bulk_increment', methods=['POST'])
+def bulk_increment():
+    """
+    Add points to many users at once, atomically; negative points debit them.
+    Expects JSON payload with 'credits' mapping usernames to points, and an
+    optional 'batch_id': a batch id that was already applied is not applied
+    again, so a client may safely retry a request whose reply it lost.
+    Unknown users are skipped and listed under 'unknown'.
+    """
+    data = request.get_json()
+    credits = data.get('credits') if isinstance(data, dict) else None
+    if not isinstance(credits, dict) or not all(type(points) is int for points in credits.values()):
+        return jsonify({'message': 'Credits mapping usernames to integer points are required.'}), 400
+
+    batch_id = data.get('batch_id')
+    if batch_id is not None and not isinstance(batch_id, str):
+        return jsonify({'message': 'batch_id must be a string.'}), 400
+    applied, unknown = store.bulk_increment(credits, batch_id)
+    if not applied:
+        logging.info(f"Batch {batch_id} was already applied.")
+        return jsonify({'message': 'Batch already applied.', 'unknown': unknown}), 200
+
+    logging.info(f"Points of {len(credits) - len(unknown)} users updated in bulk.")
+    return jsonify({'message': 'Points updated successfully.', 'unknown': unknown}), 200
+
 @app.route('/set_wallet', methods=['POST'])
 def set_wallet():
     """
@@ -137,21 +174,58 @@ def set_wallet():
     if not isinstance(wallet_address, str) or not wallet_address.startswith('0x') or len(wallet_address) != 42:
         return jsonify({'message': 'Invalid wallet address format.'}), 400
 
-    if username not in user_points:
+    if not store.set_wallet_address(username, wallet_address):
         return jsonify({'message': 'User does not exist.'}), 400
 
-    user_points[username]['wallet_address'] = wallet_address
-    save_user_points(user_points)
-
     logging.info(f"Wallet address set for user '{username}': {wallet_address}")
     return jsonify({'message': 'Wallet address updated successfully.'}), 200
 
-def save_users():
-    """Save user data to the JSON file."""
-    with open(USER_DATA_FILE, 'w') as f:
-        json.dump(users, f)
-    logging.info("User data saved.")
+if BaseApplication is not None:
+    class DataServerApplication(BaseApplication):
+        """
+        gunicorn serving `app` with the given settings, without a config file.
+        """
+        def __init__(self, options):
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return app
+
+def serve(host=DATA_SERVER_HOST, port=DATA_SERVER_PORT, workers=SERVER_WORKERS, threads=SERVER_THREADS):
+    """
+    Serve the Data Server. One worker runs Flask's threaded server; several run
+    as gunicorn processes, which share users and points through the database.
+    The same app can also be served by any WSGI server as `data_server:app`.
+
+    Parameters:
+    - host (str): Interface to bind.
+    - port (int): Port to listen on.
+    - workers (int): Processes serving requests.
+    - threads (int): Threads per gunicorn process.
+    """
+    if workers <= 1:
+        app.run(host=host, port=port, debug=False, threaded=True)
+        return
+    if BaseApplication is None:
+        raise RuntimeError("Serving with several workers needs gunicorn: pip install gunicorn")
+    logging.info(f"Serving on {host}:{port} with {workers} processes of {threads} threads.")
+    DataServerApplication({'bind': f"{host}:{port}", 'workers': workers, 'threads': threads,
+                           'worker_class': 'gthread' if threads > 1 else 'sync'}).run()
 
 if __name__ == '__main__':
-    # Run the Flask app on port 5001 to differentiate from master.py
-    app.run(host='0.0.0.0', port=5001, debug=False)
+    parser = argparse.ArgumentParser(description="Data Server: users, points and wallet addresses.")
+    parser.add_argument('--host', default=DATA_SERVER_HOST, help="Interface to bind.")
+    parser.add_argument('--port', type=int, default=DATA_SERVER_PORT, help="Port to listen on.")
+    parser.add_argument('--workers', type=int, default=SERVER_WORKERS,
+                        help="Processes serving requests; more than one runs under gunicorn.")
+    parser.add_argument('--threads', type=int, default=SERVER_THREADS, help="Threads per gunicorn process.")
+    parser.add_argument('--log-level', default='DEBUG', help="Logging level, e.g. WARNING under load.")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(args.log_level)
+    serve(args.host, args.port, args.workers, args.threads)
@@ -1,81 +1,642 @@
 # helper.py
-import pickle
+import json
+import time
+import zlib
+import asyncio
 import struct
 import logging
+import threading
+from collections import namedtuple
 
-def send_data_in_chunks(conn, data):
+import numpy as np
+
+# Optional compressors; a frame is only compressed with a codec both ends have
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+try:
+    import lz4.block
+except ImportError:
+    lz4 = None
+
+# Message types carried in the frame header
+MSG_HELLO = 1    # worker -> master: meta {'username', 'codecs', ...}; master -> worker: meta {'codec', 'narrow'}
+                 # in reply, sent only to workers that offered codecs
+MSG_TASK = 2     # master -> worker: meta {'task_ids'}, arrays (a_0, b_0, a_1, b_1, ...)
+MSG_RESULT = 3   # worker -> master: meta {'username', 'task_ids'}, arrays (c_0, c_1, ...)
+MSG_POINTS = 4   # master -> worker: meta {'points'}
+MSG_DONE = 5     # master -> worker: no more tasks, close the connection
+MSG_LEASE = 6    # worker -> master: meta {'max_tasks'}, asks for the next batch of tasks
+MSG_CANCEL = 7   # master -> worker: meta {'task_ids'}, tasks of the current lease another worker already finished
+MSG_HEARTBEAT = 8  # worker -> master: no payload, sent every meta['heartbeat'] seconds of HELLO while connected
+
+FRAME_MAGIC = b'IM'
+FRAME_VERSION = 1
+
+# magic, version, msg_type, flags, n_arrays, task_id, meta_len, payload_len
+FRAME_HEADER = struct.Struct('!2sBBBxHQIQ')
+
+# Frame flags: the low bits name the compressor of the payload
+CODEC_MASK = 0x0F
+CODEC_IDS = {'zlib': 1, 'lz4': 2, 'zstd': 3}
+CODEC_NAMES = {codec_id: name for name, codec_id in CODEC_IDS.items()}
+FLAG_NARROWED = 0x10  # Some integer arrays travel in a narrower dtype
+
+# dtype string (e.g. '<i8'), ndim, wire type code of a narrowed array (NUL if not narrowed),
+# shape padded out to MAX_NDIM dimensions
+MAX_NDIM = 4
+ARRAY_DESCRIPTOR = struct.Struct(f'!4sBc2x{MAX_NDIM}Q')
+
+# Each array payload starts on an 8-byte boundary so np.frombuffer views stay aligned
+PAYLOAD_ALIGNMENT = 8
+
+# Only plain numeric arrays may cross the wire, never object arrays
+ALLOWED_DTYPE_KINDS = 'biufc'
+
+MAX_META_BYTES = 16 * 1024 * 1024
+MAX_PAYLOAD_BYTES = 1 << 31
+
+# Linux caps a single sendmsg() at IOV_MAX (1024) buffers
+MAX_IOVECS = 512
+
+# Compression
+COMPRESS_MIN_BYTES = 4096  # Smaller payloads are sent as they are
+COMPRESS_MAX_RATIO = 0.9  # Send the payload uncompressed unless compression saves more than this
+COMPRESS_PROBE_BYTES = 64 * 1024  # Larger payloads are only compressed if this much of them compresses
+ZSTD_LEVEL = 1
+ZLIB_LEVEL = 1
+OFFLOAD_BYTES = 1 << 20  # The asyncio side decodes larger compressed or narrowed payloads on an executor
+
+Frame = namedtuple('Frame', ['msg_type', 'task_id', 'meta', 'arrays'])
+
+
+def available_codecs():
+    """
+    Codecs this process can encode and decode, preferred first. 'narrow' is
+    integer narrowing: integer arrays travel in the smallest dtype that holds
+    their values and are widened back on receipt.
     """
-    Serialize and send data with a fixed-length header indicating the data size.
-    
+    codecs = []
+    if zstandard is not None:
+        codecs.append('zstd')
+    if lz4 is not None:
+        codecs.append('lz4')
+    return codecs + ['zlib', 'narrow']
+
+
+def negotiate_codecs(offered, preferred):
+    """
+    Pick the codecs for a connection.
+
+    Parameters:
+    - offered (list of str): Codecs the peer can decode.
+    - preferred (sequence of str): Codecs this side is willing to use, preferred first.
+
+    Returns:
+    - tuple: (compressor name or None, whether to narrow integer arrays).
+    """
+    common = [codec for codec in preferred if codec in offered and codec in available_codecs()]
+    compressor = next((codec for codec in common if codec != 'narrow'), None)
+    return compressor, 'narrow' in common
+
+
+class WireStats:
+    """
+    Payload bytes of frames before and after encoding, and the seconds spent
+    encoding and decoding them.
+    """
+    def __init__(self):
+        self.raw_bytes = 0  # Array bytes as the application sees them
+        self.wire_bytes = 0  # Payload bytes on the wire
+        self.encode_seconds = 0.0
+        self.decode_seconds = 0.0
+        self.peer_seconds = 0.0  # Encoding and decoding time reported by the other end
+        self._lock = threading.Lock()
+
+    def record(self, raw_bytes, wire_bytes, encode_seconds=0.0, decode_seconds=0.0, peer_seconds=0.0):
+        with self._lock:
+            self.raw_bytes += raw_bytes
+            self.wire_bytes += wire_bytes
+            self.encode_seconds += encode_seconds
+            self.decode_seconds += decode_seconds
+            self.peer_seconds += peer_seconds
+
+    def take(self):
+        """
+        Return the counts as a new WireStats and reset these.
+        """
+        taken = WireStats()
+        with self._lock:
+            taken.record(self.raw_bytes, self.wire_bytes, self.encode_seconds, self.decode_seconds, self.peer_seconds)
+            self.raw_bytes = self.wire_bytes = 0
+            self.encode_seconds = self.decode_seconds = self.peer_seconds = 0.0
+        return taken
+
+    def merge(self, other):
+        self.record(other.raw_bytes, other.wire_bytes, other.encode_seconds, other.decode_seconds, other.peer_seconds)
+
+    def summary(self):
+        """
+        JSON-serializable totals, with the bytes saved and the compression ratio.
+        """
+        with self._lock:
+            return {
+                'raw_bytes': self.raw_bytes,
+                'wire_bytes': self.wire_bytes,
+                'saved_bytes': self.raw_bytes - self.wire_bytes,
+                'ratio': self.raw_bytes / self.wire_bytes if self.wire_bytes else 1.0,
+                'encode_seconds': self.encode_seconds,
+                'decode_seconds': self.decode_seconds,
+                'peer_codec_seconds': self.peer_seconds,
+            }
+
+
+def _padding(nbytes):
+    return -nbytes % PAYLOAD_ALIGNMENT
+
+
+def _narrow_dtype(array):
+    """
+    Smallest integer dtype that holds every value of an integer array, or None
+    if it would not be narrower than the array's own.
+    """
+    if array.dtype.kind not in 'iu' or array.dtype.itemsize == 1 or not array.size:
+        return None
+    wire = np.result_type(np.min_scalar_type(array.min()), np.min_scalar_type(array.max()))
+    if wire.kind not in 'iu' or wire.itemsize >= array.dtype.itemsize:
+        return None
+    return wire.newbyteorder('<')
+
+
+def _describe_array(array, wire=None):
+    """
+    Build the wire descriptor for a C-contiguous numeric array, sent as `wire`
+    dtype if it is narrowed.
+    """
+    if array.dtype.kind not in ALLOWED_DTYPE_KINDS:
+        raise ValueError(f"Unsupported dtype on the wire: {array.dtype}")
+    if array.ndim > MAX_NDIM:
+        raise ValueError(f"Arrays with more than {MAX_NDIM} dimensions are not supported.")
+    shape = tuple(array.shape) + (0,) * (MAX_NDIM - array.ndim)
+    code = wire.char.encode('ascii') if wire is not None else b'\0'
+    return ARRAY_DESCRIPTOR.pack(array.dtype.str.encode('ascii'), array.ndim, code, *shape)
+
+
+def _parse_descriptor(raw):
+    """
+    Inverse of _describe_array. Returns (dtype, shape, wire dtype or None).
+    """
+    dtype_str, ndim, code, *shape = ARRAY_DESCRIPTOR.unpack(raw)
+    dtype = np.dtype(dtype_str.rstrip(b'\0').decode('ascii'))
+    if dtype.kind not in ALLOWED_DTYPE_KINDS:
+        raise ValueError(f"Refusing to decode dtype {dtype}.")
+    if ndim > MAX_NDIM:
+        raise ValueError(f"Invalid array rank {ndim}.")
+    wire = None
+    if code != b'\0':
+        wire = np.dtype(code.decode('ascii')).newbyteorder('<')
+        if wire.kind not in 'iu' or dtype.kind not in 'iu' or wire.itemsize >= dtype.itemsize:
+            raise ValueError(f"Invalid narrowing of {dtype} to {wire}.")
+    return dtype, tuple(shape[:ndim]), wire
+
+
+def _compress(codec, data):
+    if codec == 'zstd':
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    if codec == 'lz4':
+        return lz4.block.compress(data, store_size=False)
+    if codec == 'zlib':
+        return zlib.compress(data, ZLIB_LEVEL)
+    raise ValueError(f"Unknown codec {codec}.")
+
+
+def _compressible(codec, chunk):
+    """
+    Whether the start of a payload compresses well enough to compress all of it.
+    Saves compressing payloads such as random floats only to send them as they are.
+    """
+    if len(chunk) < 2 * COMPRESS_PROBE_BYTES:
+        return True
+    sample = bytes(chunk[:COMPRESS_PROBE_BYTES])
+    return len(_compress(codec, sample)) < COMPRESS_MAX_RATIO * len(sample)
+
+
+def _decompress(codec_id, data, size):
+    """
+    Decompress a payload that must come out at exactly `size` bytes.
+    """
+    codec = CODEC_NAMES.get(codec_id)
+    if codec not in available_codecs():
+        raise ValueError(f"Frame compressed with unsupported codec {codec or codec_id}.")
+    if codec == 'zstd':
+        out = zstandard.ZstdDecompressor().decompress(data, max_output_size=size)
+    elif codec == 'lz4':
+        out = lz4.block.decompress(data, uncompressed_size=size)
+    else:
+        decompressor = zlib.decompressobj()
+        out = decompressor.decompress(data, size)
+    if len(out) != size:
+        raise ValueError(f"Payload decompressed to {len(out)} bytes, expected {size}.")
+    return out
+
+
+def _send_buffers(conn, buffers):
+    """
+    Send a list of buffers with scatter/gather I/O, handling partial sends.
+    Falls back to sendall() on platforms without sendmsg().
+    """
+    views = [memoryview(buf).cast('B') for buf in buffers if len(buf)]
+    if not hasattr(conn, 'sendmsg'):
+        for view in views:
+            conn.sendall(view)
+        return
+
+    idx = 0
+    while idx < len(views):
+        sent = conn.sendmsg(views[idx:idx + MAX_IOVECS])
+        # Skip past fully sent buffers and trim the partially sent one
+        while sent:
+            remaining = len(views[idx])
+            if sent >= remaining:
+                sent -= remaining
+                idx += 1
+            else:
+                views[idx] = views[idx][sent:]
+                sent = 0
+
+
+def encode_frame(msg_type, task_id=0, arrays=(), meta=None, codec=None, narrow=False, stats=None):
+    """
+    Build the buffers of one binary frame: a fixed header, optional JSON metadata,
+    one descriptor per array and then the raw array buffers. Arrays are referenced,
+    not copied, unless they are not C-contiguous, narrowed or compressed.
+
+    Parameters:
+    - codec (str or None): Compress the payload with this codec ('zstd', 'lz4' or
+      'zlib'), unless it is small or does not compress; the flags say which was used.
+    - narrow (bool): Send integer arrays in the smallest dtype that holds their values.
+    - stats (WireStats or None): Records the payload bytes and encoding time.
+
+    Returns:
+    - list: Buffers to write to the connection in order.
+    """
+    started = time.perf_counter()
+    arrays = [np.ascontiguousarray(a) for a in arrays]
+    meta_bytes = json.dumps(meta).encode('utf-8') if meta is not None else b''
+
+    flags = 0
+    descriptors = []
+    payload = []
+    payload_len = 0
+    raw_len = 0
+    for array in arrays:
+        wire = _narrow_dtype(array) if narrow else None
+        descriptors.append(_describe_array(array, wire))
+        raw_len += array.nbytes
+        if wire is not None:
+            array = array.astype(wire)
+            flags |= FLAG_NARROWED
+        payload.append(array.reshape(-1).view(np.uint8))
+        pad = _padding(array.nbytes)
+        if pad:
+            payload.append(bytes(pad))
+        payload_len += array.nbytes + pad
+
+    if codec and payload_len >= COMPRESS_MIN_BYTES and _compressible(codec, payload[0]):
+        compressed = _compress(codec, b''.join(payload))
+        if len(compressed) < COMPRESS_MAX_RATIO * payload_len:
+            payload = [compressed]
+            payload_len = len(compressed)
+            flags |= CODEC_IDS[codec]
+    if stats is not None and arrays:
+        stats.record(raw_len, payload_len, encode_seconds=time.perf_counter() - started if codec or narrow else 0.0)
+
+    header = FRAME_HEADER.pack(FRAME_MAGIC, FRAME_VERSION, msg_type, flags, len(arrays),
+                               task_id, len(meta_bytes), payload_len)
+    return [header + meta_bytes + b''.join(descriptors)] + payload
+
+
+def send_frame(conn, msg_type, task_id=0, arrays=(), meta=None, codec=None, narrow=False, stats=None):
+    """
+    Send one binary frame built by encode_frame. Arrays are sent straight from
+    their memory with sendmsg(); nothing is pickled.
+
     Parameters:
     - conn (socket.socket): The socket connection to send data through.
-    - data (any): The data to serialize and send.
-    
+    - msg_type (int): One of the MSG_* constants.
+    - task_id (int): Identifier of the task this frame refers to.
+    - arrays (sequence of np.ndarray): Numeric arrays to ship alongside the header.
+    - meta (dict or None): Small JSON-serializable control data (username, points, ...).
+    - codec, narrow, stats: Payload encoding, as for encode_frame.
+
     Raises:
     - Exception: Propagates any exceptions encountered during sending.
     """
     try:
-        serialized_data = pickle.dumps(data)
-        data_length = len(serialized_data)
-        header = struct.pack('!I', data_length)  # 4-byte unsigned int, network byte order
-        conn.sendall(header + serialized_data)
-        logging.debug(f"Sent data of length {data_length} bytes.")
+        _send_buffers(conn, encode_frame(msg_type, task_id, arrays, meta, codec, narrow, stats))
+        logging.debug(f"Sent frame type {msg_type} for task {task_id}: {len(arrays)} arrays.")
+    except Exception as e:
+        logging.error(f"Error sending frame: {e}")
+        raise
+
+
+def _encode_in_memory(msg_type, task_id, arrays, meta, codec, narrow, stats):
+    """
+    encode_frame for an executor: arrays mapped from disk are read into memory
+    here, so the event loop never waits on page faults while it sends them.
+    """
+    arrays = [np.array(array) if isinstance(array, np.memmap) else array for array in arrays]
+    return encode_frame(msg_type, task_id, arrays, meta, codec, narrow, stats)
+
+
+async def send_frame_async(writer, msg_type, task_id=0, arrays=(), meta=None, codec=None, narrow=False, stats=None):
+    """
+    asyncio counterpart of send_frame for an asyncio.StreamWriter. Waits for the
+    transport to drain, so a slow peer only holds up its own coroutine. Frames
+    with arrays are built on an executor: slicing operands into contiguous
+    buffers, reading memory-mapped ones and compressing never run on the loop.
+    """
+    try:
+        if len(arrays):
+            buffers = await asyncio.get_running_loop().run_in_executor(
+                None, _encode_in_memory, msg_type, task_id, arrays, meta, codec, narrow, stats)
+        else:
+            buffers = encode_frame(msg_type, task_id, arrays, meta, codec, narrow, stats)
+        writer.writelines(buffers)
+        await writer.drain()
+        logging.debug(f"Sent frame type {msg_type} for task {task_id}: {len(arrays)} arrays.")
     except Exception as e:
-        logging.error(f"Error sending data: {e}")
+        logging.error(f"Error sending frame: {e}")
         raise
 
-def receive_data_in_chunks(conn):
+
+def _parse_header(raw, max_payload=MAX_PAYLOAD_BYTES):
+    """
+    Unpack and sanity-check a frame header, refusing payloads over `max_payload` bytes.
+
+    Returns:
+    - tuple: (msg_type, flags, n_arrays, task_id, meta_len, payload_len)
+    """
+    magic, version, msg_type, flags, n_arrays, task_id, meta_len, payload_len = FRAME_HEADER.unpack(raw)
+    if magic != FRAME_MAGIC or version != FRAME_VERSION:
+        raise ValueError(f"Unexpected frame magic/version: {magic!r}/{version}")
+    if meta_len > MAX_META_BYTES or payload_len > max_payload:
+        raise ValueError(f"Frame too large: meta {meta_len} bytes, payload {payload_len} bytes.")
+    return msg_type, flags, n_arrays, task_id, meta_len, payload_len
+
+
+def _parse_prologue(raw, meta_len, n_arrays, payload_len, flags=0, max_payload=MAX_PAYLOAD_BYTES):
+    """
+    Decode the JSON metadata and array descriptors that follow the header.
+
+    Returns:
+    - tuple: (meta, specs, size) where specs is a list of (dtype, shape, wire dtype)
+      and size the payload length once decompressed.
+    """
+    meta = None
+    specs = []
+    if meta_len:
+        meta = json.loads(bytes(raw[:meta_len]).decode('utf-8'))
+    for idx in range(n_arrays):
+        start = meta_len + idx * ARRAY_DESCRIPTOR.size
+        specs.append(_parse_descriptor(raw[start:start + ARRAY_DESCRIPTOR.size]))
+
+    expected = 0
+    for dtype, shape, wire in specs:
+        nbytes = int(np.prod(shape, dtype=np.int64)) * (wire or dtype).itemsize
+        expected += nbytes + _padding(nbytes)
+    if flags & CODEC_MASK:
+        if expected > max_payload:
+            raise ValueError(f"Frame too large: {expected} payload bytes once decompressed.")
+    elif expected != payload_len:
+        raise ValueError(f"Payload length {payload_len} does not match array descriptors ({expected}).")
+    return meta, specs, expected
+
+
+def _build_arrays(payload, specs):
+    """
+    Wrap the frame payload as np.frombuffer views, one per descriptor. Narrowed
+    arrays are widened back into arrays of their own.
+    """
+    arrays = []
+    offset = 0
+    for dtype, shape, wire in specs:
+        count = int(np.prod(shape, dtype=np.int64))
+        array = np.frombuffer(payload, dtype=wire or dtype, count=count, offset=offset).reshape(shape)
+        arrays.append(array.astype(dtype) if wire is not None else array)
+        nbytes = count * (wire or dtype).itemsize
+        offset += nbytes + _padding(nbytes)
+    return arrays
+
+
+def _decode_payload(payload, specs, flags, size, stats=None):
+    """
+    Decompress a frame's payload if needed and build its arrays.
+    """
+    started = time.perf_counter()
+    wire_bytes = len(payload)
+    if flags & CODEC_MASK:
+        payload = _decompress(flags & CODEC_MASK, payload, size)
+    arrays = _build_arrays(payload, specs)
+    if stats is not None and arrays:
+        decode_seconds = time.perf_counter() - started if flags else 0.0
+        stats.record(sum(array.nbytes for array in arrays), wire_bytes, decode_seconds=decode_seconds)
+    return arrays
+
+
+class ReceiveBuffer:
     """
-    Receive data sent with a fixed-length header indicating the data size.
-    
+    Reusable receive buffer for one connection.
+
+    Bytes are read with recv_into() into a preallocated bytearray and handed back
+    as memoryviews over it. The buffer only grows (geometrically) and is kept for
+    the lifetime of the connection, so steady-state receiving does not allocate.
+    Views returned by recv_exact(), and arrays built on them, are only valid until
+    the next read on the same buffer.
+    """
+
+    def __init__(self, conn, initial_size=64 * 1024):
+        self.conn = conn
+        self._buffer = bytearray(initial_size)
+        self._view = memoryview(self._buffer)
+
+    @property
+    def capacity(self):
+        return len(self._buffer)
+
+    def _reserve(self, n):
+        if n > len(self._buffer):
+            # Allocate a fresh bytearray: views handed out earlier may still
+            # reference the old one, and a bytearray with exports cannot resize.
+            self._buffer = bytearray(max(n, 2 * len(self._buffer)))
+            self._view = memoryview(self._buffer)
+
+    def recv_exact(self, n):
+        """
+        Receive exactly n bytes into the buffer.
+
+        Parameters:
+        - n (int): The exact number of bytes to receive.
+
+        Returns:
+        - memoryview: View over the first n bytes of the buffer.
+        - None: If the connection is closed before receiving n bytes.
+        """
+        self._reserve(n)
+        view = self._view[:n]
+        if not recv_into_exactly(self.conn, view):
+            return None
+        return view
+
+
+def receive_frame(conn, buffer=None, stats=None):
+    """
+    Receive one frame written by send_frame. The payload is read with recv_into()
+    into a preallocated buffer and the arrays are np.frombuffer() views over it,
+    so no bytes are copied after they leave the socket.
+
     Parameters:
     - conn (socket.socket): The socket connection to receive data from.
-    
+    - buffer (ReceiveBuffer or None): Per-connection buffer to reuse. The returned
+      arrays then alias it and stay valid only until the next receive on it.
+      Without one, a private buffer is allocated and the arrays own their memory.
+      Arrays of compressed or narrowed frames always own their memory.
+    - stats (WireStats or None): Records the payload bytes and decoding time.
+
     Returns:
-    - any: The deserialized data received.
-    - None: If no data is received.
+    - Frame: (msg_type, task_id, meta, arrays) tuple.
+    - None: If the connection closed or the frame was malformed.
     """
+    if buffer is None:
+        buffer = ReceiveBuffer(conn, initial_size=0)
     try:
-        # First, receive the header
-        header = recvall(conn, 4)
+        header = buffer.recv_exact(FRAME_HEADER.size)
         if not header:
             logging.warning("No header received.")
             return None
-        data_length = struct.unpack('!I', header)[0]
-        logging.debug(f"Expecting to receive {data_length} bytes of data.")
+        msg_type, flags, n_arrays, task_id, meta_len, payload_len = _parse_header(header)
+
+        meta = None
+        specs = []
+        size = 0
+        prologue_len = meta_len + n_arrays * ARRAY_DESCRIPTOR.size
+        if prologue_len:
+            prologue = buffer.recv_exact(prologue_len)
+            if prologue is None:
+                logging.warning("Connection closed while reading frame metadata.")
+                return None
+            meta, specs, size = _parse_prologue(prologue, meta_len, n_arrays, payload_len, flags)
+        elif payload_len:
+            raise ValueError(f"Payload of {payload_len} bytes without array descriptors.")
 
-        # Then, receive the actual data
-        serialized_data = recvall(conn, data_length)
-        if not serialized_data:
-            logging.warning("No serialized data received.")
+        payload = buffer.recv_exact(payload_len)
+        if payload is None:
+            logging.warning("Connection closed while reading frame payload.")
             return None
-        data = pickle.loads(serialized_data)
-        logging.debug(f"Received data: {data}")
-        return data
+        arrays = _decode_payload(payload, specs, flags, size, stats)
+
+        logging.debug(f"Received frame type {msg_type} for task {task_id}: {n_arrays} arrays, {payload_len} payload bytes.")
+        return Frame(msg_type, task_id, meta, arrays)
     except Exception as e:
-        logging.error(f"Error receiving data: {e}")
+        logging.error(f"Error receiving frame: {e}")
         return None
 
+
+async def receive_frame_async(reader, stats=None, payload_limit=None):
+    """
+    asyncio counterpart of receive_frame for an asyncio.StreamReader. The arrays
+    are read-only views over the bytes returned by readexactly() and keep them
+    alive, so unlike ReceiveBuffer views they stay valid after the next receive.
+    Large compressed or narrowed payloads are decoded on an executor.
+
+    Parameters:
+    - reader (asyncio.StreamReader): The connection to read from.
+    - stats (WireStats or None): Records the payload bytes and decoding time.
+    - payload_limit (callable or None): Called once the header has arrived;
+      returns the largest payload, compressed or not, to accept. A larger frame
+      is refused before its payload is read. Defaults to MAX_PAYLOAD_BYTES.
+
+    Returns:
+    - Frame: (msg_type, task_id, meta, arrays) tuple.
+    - None: If the connection closed or the frame was malformed.
+    """
+    try:
+        header = await reader.readexactly(FRAME_HEADER.size)
+        max_payload = payload_limit() if payload_limit is not None else MAX_PAYLOAD_BYTES
+        msg_type, flags, n_arrays, task_id, meta_len, payload_len = _parse_header(header, max_payload)
+
+        meta = None
+        specs = []
+        size = 0
+        prologue_len = meta_len + n_arrays * ARRAY_DESCRIPTOR.size
+        if prologue_len:
+            prologue = await reader.readexactly(prologue_len)
+            meta, specs, size = _parse_prologue(memoryview(prologue), meta_len, n_arrays, payload_len, flags,
+                                                max_payload)
+        elif payload_len:
+            raise ValueError(f"Payload of {payload_len} bytes without array descriptors.")
+
+        payload = await reader.readexactly(payload_len) if payload_len else b''
+        if flags and size > OFFLOAD_BYTES:
+            arrays = await asyncio.get_running_loop().run_in_executor(
+                None, _decode_payload, payload, specs, flags, size, stats)
+        else:
+            arrays = _decode_payload(payload, specs, flags, size, stats)
+
+        logging.debug(f"Received frame type {msg_type} for task {task_id}: {n_arrays} arrays, {payload_len} payload bytes.")
+        return Frame(msg_type, task_id, meta, arrays)
+    except asyncio.IncompleteReadError:
+        logging.warning("Connection closed by the other side.")
+        return None
+    except Exception as e:
+        logging.error(f"Error receiving frame: {e}")
+        return None
+
+
+def recv_into_exactly(conn, view):
+    """
+    Fill a writable memoryview from the socket using recv_into().
+
+    Parameters:
+    - conn (socket.socket): The socket connection to receive data from.
+    - view (memoryview): Destination buffer; filled completely on success.
+
+    Returns:
+    - bool: True if the view was filled, False if the connection closed first.
+    """
+    total = len(view)
+    # Most small frames arrive in one piece; avoid slicing the view for them
+    received = conn.recv_into(view, total) if total else 0
+    if total and not received:
+        logging.warning("Connection closed by the other side.")
+        return False
+    while received < total:
+        nbytes = conn.recv_into(view[received:], total - received)
+        if not nbytes:
+            logging.warning("Connection closed by the other side.")
+            return False
+        received += nbytes
+    return True
+
+
 def recvall(conn, n):
     """
     Helper function to receive exactly n bytes or return None if EOF is hit.
-    
+    Reads straight into a preallocated bytearray, so large reads cost O(n).
+
     Parameters:
     - conn (socket.socket): The socket connection to receive data from.
     - n (int): The exact number of bytes to receive.
-    
+
     Returns:
-    - bytes: The received bytes.
+    - bytearray: The received bytes.
     - None: If the connection is closed before receiving n bytes.
     """
-    data = b''
+    data = bytearray(n)
     try:
-        while len(data) < n:
-            packet = conn.recv(n - len(data))
-            if not packet:
-                logging.warning("Connection closed by the other side.")
-                return None
-            data += packet
+        if not recv_into_exactly(conn, memoryview(data)):
+            return None
         return data
     except Exception as e:
         logging.error(f"Error in recvall: {e}")
@@ -0,0 +1,138 @@
+# job_api.py
+import io
+import os
+import logging
+
+import numpy as np
+from flask import Flask, request, jsonify, send_file
+
+# Operands may only be numeric matrices
+ALLOWED_KINDS = 'iufc'
+
+
+def _resolve_path(path, data_dir):
+    """
+    Resolve a client-supplied .npy path against `data_dir`, refusing paths that
+    leave it (absolute paths, '..' or symlinks pointing elsewhere).
+    """
+    if not data_dir:
+        raise ValueError("Path operands are disabled on this master.")
+    root = os.path.realpath(data_dir)
+    resolved = os.path.realpath(os.path.join(root, path))
+    if os.path.commonpath([root, resolved]) != root:
+        raise ValueError(f"Path '{path}' is outside the data directory.")
+    return resolved
+
+
+def _load_operand(name, data_dir=None):
+    """
+    Read operand `name` ('a' or 'b') from the current request: an uploaded .npy
+    file, a .npy path relative to the master's `data_dir` ('<name>_path'), or a
+    nested JSON list.
+    """
+    if name in request.files:
+        return np.load(request.files[name], allow_pickle=False)
+    data = request.get_json(silent=True) or {}
+    if data.get(f'{name}_path'):
+        return np.load(_resolve_path(str(data[f'{name}_path']), data_dir), mmap_mode='r', allow_pickle=False)
+    if data.get(name) is not None:
+        return np.asarray(data[name])
+    raise ValueError(f"Missing operand '{name}'.")
+
+
+def _options():
+    data = request.get_json(silent=True) or request.form
+    block_size = data.get('block_size')
+    return {
+        'submitter': data.get('submitter') or request.remote_addr or 'anonymous',
+        'priority': int(data.get('priority', 0)),
+        'block_size': int(block_size) if block_size else None,
+    }
+
+
+def create_job_api(job_queue, submit_job, metrics=None, data_dir=None):
+    """
+    Build the HTTP API for submitting and tracking jobs.
+
+    Routes:
+    - POST /jobs: submit A and B (JSON lists, .npy paths under `data_dir` or .npy
+      uploads) with optional 'submitter', 'priority' and 'block_size'; returns the job id.
+    - GET /jobs: status of all jobs.
+    - GET /jobs/<job_id>: status and progress of one job.
+    - GET /jobs/<job_id>/result: C as a .npy file, or JSON with ?format=json.
+    - DELETE /jobs/<job_id>: cancel a job and drop its result.
+    - GET /metrics: master-wide counters, if `metrics` is given.
+
+    Parameters:
+    - job_queue (jobs.JobQueue): The master's job queue.
+    - submit_job (callable): submit_job(a, b, submitter, priority, block_size) -> Job.
+    - metrics (callable or None): Returns a JSON-serializable dict of master metrics.
+    - data_dir (str or None): Directory that '<name>_path' operands are read from;
+      None rejects path operands.
+
+    Returns:
+    - Flask: The application, ready to run in a thread.
+    """
+    app = Flask(__name__)
+
+    @app.route('/jobs', methods=['POST'])
+    def submit():
+        try:
+            a = _load_operand('a', data_dir)
+            b = _load_operand('b', data_dir)
+            options = _options()
+            if a.ndim != 2 or b.ndim != 2 or a.shape[1] != b.shape[0]:
+                raise ValueError(f"Cannot multiply shapes {a.shape} and {b.shape}.")
+            if a.dtype.kind not in ALLOWED_KINDS or b.dtype.kind not in ALLOWED_KINDS:
+                raise ValueError(f"Unsupported dtypes {a.dtype} and {b.dtype}.")
+        except Exception as e:
+            return jsonify({'message': f"Invalid job: {e}"}), 400
+        job = submit_job(a, b, **options)
+        return jsonify({'message': 'Job queued.', 'job_id': job.job_id}), 201
+
+    @app.route('/jobs', methods=['GET'])
+    def list_jobs():
+        return jsonify({'jobs': [job.status() for job in job_queue.jobs()]}), 200
+
+    @app.route('/jobs/<job_id>', methods=['GET'])
+    def job_status(job_id):
+        job = job_queue.get(job_id)
+        if job is None:
+            return jsonify({'message': 'Job not found.'}), 404
+        return jsonify(job.status()), 200
+
+    @app.route('/jobs/<job_id>/result', methods=['GET'])
+    def job_result(job_id):
+        job = job_queue.get(job_id)
+        if job is None:
+            return jsonify({'message': 'Job not found.'}), 404
+        if job.state != 'done':
+            return jsonify({'message': f"Job is {job.state}.", 'status': job.status()}), 409
+        C = job.aggregator.C
+        if request.args.get('format') == 'json':
+            return jsonify({'job_id': job_id, 'result': C.tolist()}), 200
+        if job.aggregator.path:
+            # Flask resolves relative paths against the app's root, not the working directory
+            return send_file(os.path.abspath(job.aggregator.path), mimetype='application/octet-stream',
+                             as_attachment=True, download_name=f"{job_id}.npy")
+        buffer = io.BytesIO()
+        np.save(buffer, C)
+        buffer.seek(0)
+        return send_file(buffer, mimetype='application/octet-stream',
+                         as_attachment=True, download_name=f"{job_id}.npy")
+
+    @app.route('/jobs/<job_id>', methods=['DELETE'])
+    def cancel_job(job_id):
+        job = job_queue.remove(job_id)
+        if job is None:
+            return jsonify({'message': 'Job not found.'}), 404
+        logging.info(f"Job {job_id} removed ({job.state}).")
+        return jsonify({'message': 'Job removed.'}), 200
+
+    @app.route('/metrics', methods=['GET'])
+    def master_metrics():
+        if metrics is None:
+            return jsonify({'message': 'No metrics available.'}), 404
+        return jsonify(metrics()), 200
+
+    return app
@@ -0,0 +1,335 @@
+# jobs.py
+import os
+import time
+import uuid
+import threading
+import logging
+from collections import defaultdict
+
+import numpy as np
+
+from task_source import TaskSource
+from singleSystem import ResultAggregator
+from scheduler import TilePlan
+from checkpoint import JobCheckpoint
+from helper import WireStats
+
+
+class Job:
+    """
+    One C = A x B multiply submitted to the master: its operands, tile plan,
+    task source and the aggregator that assembles C.
+
+    Parameters:
+    - a, b (np.ndarray): Operands; b.shape[0] must equal a.shape[1].
+    - plan (scheduler.TilePlan): Tile shape and grid of the job.
+    - submitter (str): Who submitted the job; fair share is computed per submitter.
+    - priority (int): Higher priorities are served first.
+    - output_path (str or None): Memory-mapped .npy file for C, may contain '{job_id}';
+      None keeps C in memory.
+    - max_retries (int): Retries per task before it is dropped.
+    - checkpoint_dir (str or None): Checkpoint the job to <checkpoint_dir>/<job_id>/,
+      C included (output_path is then ignored); None keeps no checkpoint.
+    - checkpoint (checkpoint.JobCheckpoint or None): Resume from this checkpoint
+      instead; see Job.resume.
+    - supertile (int): Side, in blocks, of the squares of C each worker keeps taking
+      tasks from, so that its leases reuse the panels it has cached.
+    """
+
+    def __init__(self, a, b, plan, submitter='anonymous', priority=0, output_path=None, max_retries=3,
+                 checkpoint_dir=None, checkpoint=None, supertile=1):
+        self.job_id = uuid.uuid4().hex[:12]
+        self.a = a
+        self.b = b
+        self.shape = (a.shape[0], a.shape[1], b.shape[1])  # m, k, n; kept once the operands are released
+        self.plan = plan
+        self.submitter = submitter
+        self.priority = priority
+        self.dtype = np.result_type(a, b)
+        self.itemsize = self.dtype.itemsize
+        self.submitted = time.time()
+        done_blocks = None
+        if checkpoint is not None:
+            meta = checkpoint.read_meta()
+            self.job_id = meta['job_id']
+            self.submitted = meta['submitted']
+            if meta.get('compacted'):
+                done_blocks = np.ones(plan.grid_m * plan.grid_n, dtype=bool)
+            else:
+                done_blocks = checkpoint.replay(plan)
+        elif checkpoint_dir:
+            checkpoint = JobCheckpoint(os.path.join(checkpoint_dir, self.job_id))
+            checkpoint.save(self)
+        self.checkpoint = checkpoint
+        self.tasks = TaskSource(plan.grid_m, plan.grid_n, plan.grid_k, max_retries=max_retries, done_blocks=done_blocks,
+                                supertile=supertile)
+        if checkpoint is not None:
+            output_path = checkpoint.c_path
+        elif output_path:
+            output_path = output_path.format(job_id=self.job_id)
+        self.aggregator = ResultAggregator((a.shape[0], b.shape[1]), self.dtype, plan, path=output_path,
+                                           resume=done_blocks is not None)
+        if done_blocks is not None:
+            self.aggregator.restore(done_blocks)
+        if checkpoint is not None:
+            checkpoint.aggregator = self.aggregator
+            if not self.aggregator.done:
+                checkpoint.open()
+        self.started = None
+        self.finished = None
+        self.cancelled = False
+        self.finalized = False  # Operands released; the result can no longer change
+        self.speculative_tasks = 0  # Tasks handed out again as copies of straggling leases
+        self.speculative_wins = 0  # Of those, results that arrived before the original
+        self.reclaimed_tasks = 0  # Tasks requeued from leases of workers that went silent
+        self.operand_bytes_sent = 0  # Operand panel bytes put on the wire
+        self.operand_bytes_saved = 0  # Panel bytes not sent because the worker had them cached
+        self.wire = WireStats()  # Compression and narrowing of the job's frames
+
+    @classmethod
+    def resume(cls, checkpoint, max_retries=3, supertile=1):
+        """
+        Rebuild a job from its checkpoint after a restart. Only the tasks of
+        (i, j) blocks that were not complete are handed out again.
+
+        Parameters:
+        - checkpoint (checkpoint.JobCheckpoint): The job's checkpoint.
+        - max_retries (int): Retries per task before it is dropped.
+        - supertile (int): As for Job.
+
+        Returns:
+        - Job: The job, 'done' if it had finished before the restart.
+        """
+        meta = checkpoint.read_meta()
+        if meta.get('compacted'):
+            # Only C is left; zero-strided stand-ins carry the operands' shapes and dtypes
+            m, k, n = meta['shape']
+            a = np.broadcast_to(np.zeros((), dtype=meta['a_dtype']), (m, k))
+            b = np.broadcast_to(np.zeros((), dtype=meta['b_dtype']), (k, n))
+        else:
+            a, b = checkpoint.load_operands()
+        job = cls(a, b, TilePlan(*meta['plan']), submitter=meta['submitter'], priority=meta['priority'],
+                  max_retries=max_retries, checkpoint=checkpoint, supertile=supertile)
+        if job.aggregator.done:
+            job.started = job.submitted
+            job.finished = meta.get('finished') or time.time()
+        if meta.get('compacted'):
+            job.finalize()
+        return job
+
+    def finalize(self):
+        """
+        Release the operands of a finished job whose results can no longer be
+        invalidated. C is kept until the job is evicted; a checkpoint keeps only C.
+        """
+        if self.checkpoint is not None:
+            self.checkpoint.compact(self)
+        self.a = self.b = None
+        self.finalized = True
+        logging.info(f"Job {self.job_id} finalized: operands released.")
+
+    def discard(self):
+        """
+        Delete the job's files: its checkpoint, or the memory-mapped C.
+        """
+        if self.checkpoint is not None:
+            self.checkpoint.close('cancelled')
+        elif self.aggregator.path:
+            try:
+                os.remove(self.aggregator.path)
+            except OSError as e:
+                logging.warning(f"Could not remove {self.aggregator.path}: {e}")
+
+    def task_blocks(self, task_id, span=1):
+        """
+        Slice the operand blocks for a task: a tile_m x (span * tile_k) panel of A and
+        the matching (span * tile_k) x tile_n panel of B.
+        """
+        plan = self.plan
+        i, j, kk = self.tasks.coordinates(task_id)
+        rows = slice(i * plan.tile_m, (i + 1) * plan.tile_m)
+        cols = slice(j * plan.tile_n, (j + 1) * plan.tile_n)
+        depth = slice(kk * plan.tile_k, (kk + span) * plan.tile_k)
+        return self.a[rows, depth], self.b[depth, cols]
+
+    def panel_keys(self, task_id, span=1):
+        """
+        Names of the A and B panels of a task, as returned by task_blocks. Tasks
+        in the same row of blocks share their A panel, tasks in the same column
+        their B panel.
+        """
+        i, j, kk = self.tasks.coordinates(task_id)
+        return f"a{i}.{kk}.{span}", f"b{kk}.{span}.{j}"
+
+    def tile_flops(self, span=1):
+        plan = self.plan
+        return 2 * plan.tile_m * plan.tile_n * plan.tile_k * span
+
+    def task_bytes(self, span=1):
+        """
+        Operand bytes sent for one task.
+        """
+        plan = self.plan
+        return (plan.tile_m + plan.tile_n) * plan.tile_k * span * self.itemsize
+
+    @property
+    def state(self):
+        if self.cancelled:
+            return 'cancelled'
+        if self.aggregator.done:
+            return 'done'
+        if self.tasks.failed and self.tasks.done:
+            return 'failed'
+        return 'running' if self.started else 'queued'
+
+    def status(self):
+        """
+        JSON-serializable progress report.
+        """
+        tasks = self.tasks
+        finished = self.finished or (time.time() if self.started else None)
+        return {
+            'job_id': self.job_id,
+            'submitter': self.submitter,
+            'priority': self.priority,
+            'state': self.state,
+            'shape': list(self.shape),
+            'tiles': [self.plan.tile_m, self.plan.tile_n, self.plan.tile_k],
+            'tasks': tasks.total,
+            'completed': tasks.completed,
+            'failed': tasks.failed,
+            'in_flight': tasks.in_flight,
+            'speculative_tasks': self.speculative_tasks,
+            'speculative_wins': self.speculative_wins,
+            'reclaimed_tasks': self.reclaimed_tasks,
+            'operand_bytes_sent': self.operand_bytes_sent,
+            'operand_bytes_saved': self.operand_bytes_saved,
+            'wire': self.wire.summary(),
+            'progress': tasks.completed / tasks.total if tasks.total else 1.0,
+            'submitted': self.submitted,
+            'elapsed': finished - self.started if self.started else 0.0,
+        }
+
+
+class JobQueue:
+    """
+    Jobs sharing one pool of workers.
+
+    Each lease is served from a single job. Strictly higher priorities go first.
+    Within a priority level, work goes to the submitter that has been served the
+    fewest FLOPs so far (fair share), and among that submitter's jobs, to the
+    oldest. A submitter that becomes active starts level with the least-served
+    active submitter instead of at zero, so it cannot starve the others while
+    it catches up.
+    """
+
+    def __init__(self):
+        self._jobs = {}  # job_id -> Job, in submission order
+        self._served = defaultdict(float)  # submitter -> FLOPs handed out
+        self._lock = threading.Lock()
+
+    def add(self, job):
+        with self._lock:
+            active = {j.submitter for j in self._jobs.values() if j.state in ('queued', 'running')}
+            if job.submitter not in active and active:
+                floor = min(self._served[s] for s in active)
+                self._served[job.submitter] = max(self._served[job.submitter], floor)
+            self._jobs[job.job_id] = job
+        logging.info(f"Queued job {job.job_id} from '{job.submitter}' (priority {job.priority}, {job.tasks.total} tasks).")
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def remove(self, job_id):
+        """
+        Cancel a job and forget it. Its in-flight results are discarded on return.
+        """
+        with self._lock:
+            job = self._jobs.pop(job_id, None)
+        if job:
+            job.cancelled = True
+            job.discard()
+        return job
+
+    def sweep(self, retention, pinned=()):
+        """
+        Release the operands of finished jobs and evict those that finished
+        more than `retention` seconds ago, with their files. A failed job's
+        retention starts when a sweep first sees it failed.
+
+        Parameters:
+        - retention (float): Seconds a finished job's result stays available.
+        - pinned (collection of Job): Jobs whose results may still be invalidated
+          (unverified results in an audit window); they are left alone.
+
+        Returns:
+        - list of Job: The evicted jobs.
+        """
+        now = time.time()
+        evicted = []
+        for job in self.jobs():
+            if job.state not in ('done', 'failed') or job in pinned:
+                continue
+            finished = job.finished
+            if finished is None:
+                finished = job.finished = now
+            if not job.finalized:
+                job.finalize()
+            if now - finished >= retention:
+                with self._lock:
+                    if self._jobs.get(job.job_id) is not job:
+                        continue
+                    del self._jobs[job.job_id]
+                job.cancelled = True
+                job.discard()
+                evicted.append(job)
+                logging.info(f"Job {job.job_id} evicted {now - finished:.0f}s after it finished.")
+        return evicted
+
+    def jobs(self):
+        with self._lock:
+            return list(self._jobs.values())
+
+    def lease(self, max_tasks, span_for=None, max_bytes=None, lessee=None):
+        """
+        Lease up to max_tasks tasks from the job that is next in line.
+
+        Parameters:
+        - max_tasks (int): Maximum number of tasks to hand out.
+        - span_for (callable or None): Maps a Job to the k-span for this worker.
+        - max_bytes (int or None): Cap on the operand bytes of the lease.
+        - lessee (hashable or None): Passed on to TaskSource.lease.
+
+        Returns:
+        - tuple: (job, leased) with leased as returned by TaskSource.lease, or
+          (None, []) if no job has work pending right now.
+        """
+        with self._lock:
+            candidates = [job for job in self._jobs.values() if not job.cancelled and job.tasks.pending]
+            candidates.sort(key=lambda job: (-job.priority, self._served[job.submitter], job.submitted))
+        for job in candidates:
+            span = span_for(job) if span_for else 1
+            limit = max_tasks
+            if max_bytes:
+                limit = min(limit, max(1, max_bytes // job.task_bytes(span)))
+            leased = job.tasks.lease(limit, span, lessee)
+            if leased:
+                with self._lock:
+                    self._served[job.submitter] += sum(job.tile_flops(count) for _, count in leased)
+                if job.started is None:
+                    job.started = time.time()
+                    logging.info(f"Job {job.job_id} started.")
+                return job, leased
+        return None, []
+
+    def finish(self, job):
+        """
+        Record the completion time of a job whose aggregator just finished.
+        """
+        if job.aggregator.done and job.finished is None:
+            # Read back locally: a concurrent invalidation may reopen the job and clear job.finished
+            finished = job.finished = time.time()
+            if job.checkpoint is not None:
+                job.checkpoint.close('done', finished)
+            logging.info(f"Job {job.job_id} complete in {finished - job.started:.2f}s: C assembled ({job.aggregator.C.shape}).")
@@ -1,15 +1,24 @@
 # master.py
 import socket
-import pickle
+import asyncio
+import argparse
 import threading
-import queue
+import time
 import numpy as np
 import logging
 import requests  # For HTTP communication
-from singleSystem import split_matrices, aggregate_results
-from helper import send_data_in_chunks, receive_data_in_chunks
-from check import check
-from itertools import product  # For generating task combinations
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from helper import (send_frame_async, receive_frame_async, negotiate_codecs, WireStats, MSG_HELLO, MSG_LEASE,
+                    MSG_TASK, MSG_RESULT, MSG_POINTS, MSG_DONE, MSG_CANCEL, MSG_HEARTBEAT)
+from check import VerificationPool, VerificationPolicy
+from jobs import Job, JobQueue
+from checkpoint import find_checkpoints
+from panels import PanelCache
+from points_ledger import PointsLedger
+from job_api import create_job_api
+from scheduler import WorkerProfile, plan_tiles, fixed_plan, tile_span
+from stragglers import LatencyTracker, LeaseTable, RecoveryStats
 
 # Configure Logging
 logging.basicConfig(
@@ -27,13 +36,63 @@ MASTER_PORT = 65432
 DATA_SERVER_IP = "192.168.1.4"  # Data Server IP
 DATA_SERVER_PORT = 5001
 DATA_SERVER_URL = f"http://{DATA_SERVER_IP}:{DATA_SERVER_PORT}"
+OFFLINE = False  # Run without the data server: no user validation or points (load testing)
+LISTEN_BACKLOG = 4096  # Pending connections the listening socket queues
+SETTLE_THREADS = 32  # Threads that aggregate results off the event loop
+JOB_API_PORT = 5002  # HTTP API for submitting jobs and fetching results
+JOB_DATA_DIR = None  # Directory the job API may read .npy operands from by path; None allows uploads only
+IDLE_WAIT_SECONDS = 30.0  # How long an idle worker's lease request waits for new work
+IDLE_POLL_SECONDS = 1.0  # Recheck interval while waiting (catches requeued tasks)
 
-matrix_size = 4000  # Size of the matrices (400x400)
-block_size = 4     # Size of each block (4x4)
+matrix_size = 4000  # Size of the random startup job's matrices (4000x4000)
+block_size = None  # Fixed square block size; None lets the scheduler pick the tile shape
+
+# Output Configuration
+OUTPUT_PATH = "product_{job_id}.npy"  # Memory-mapped .npy file for C when it is too large for RAM
+MEMMAP_THRESHOLD_BYTES = 1 << 30  # Keep C in memory below this size
+CHECKPOINT_DIR = "checkpoints"  # Jobs, C and progress logs for resuming after a restart; None disables them
+JOB_RETENTION_SECONDS = 3600  # How long a finished job's result can be fetched before the job is evicted
+JOB_SWEEP_SECONDS = 10  # How often finished jobs are looked for
 
 # Retry Configuration
 MAX_RETRIES = 3  # Maximum number of retries per task
 
+# Verification Configuration
+SPOT_CHECK_MIN_RATE = 0.05  # Lowest fraction of a trusted worker's results that is verified
+SPOT_CHECK_PROBATION = 32  # Passed checks before a worker is sampled instead of fully verified
+AUDIT_WINDOW_BYTES = 64 * 1024 * 1024  # Unverified results kept per worker for retroactive invalidation
+AUDIT_BUDGET_BYTES = 1024 * 1024 * 1024  # ... and across all workers; past it the oldest results become final
+
+# Lease Configuration
+LEASE_TARGET_SECONDS = 1.0  # Aim for leases that take about this long to turn around
+MAX_LEASE_TASKS = 1024  # Upper bound on tasks per lease
+MAX_LEASE_BYTES = 64 * 1024 * 1024  # Upper bound on operand bytes per lease frame
+MAX_PREFETCH_LEASES = 2  # Leases a worker may hold beyond the one it is computing
+FRAME_SLACK_BYTES = 64 * 1024  # Inbound payload allowed beyond the results of a worker's open leases
+
+# Straggler Configuration
+SPECULATION = True  # Give idle workers copies of straggling leases at the tail of a job
+DEADLINE_PERCENTILE = 95  # Lease deadlines scale with this percentile of the worker's latency
+DEADLINE_FACTOR = 3.0  # ... times this factor
+DEADLINE_SLACK_SECONDS = 0.5  # ... plus this much
+STRAGGLER_POLL_SECONDS = 0.1  # Recheck interval of idle workers once a lease is past its deadline
+STALL_FACTOR = 10.0  # Drop a worker whose lease is this many deadlines late
+MAX_SPECULATIVE_COPIES = 1  # Extra copies of one lease
+
+# Heartbeat Configuration
+HEARTBEAT_MISSES = 3  # A heartbeating worker's lease expires after this many missed heartbeats
+REAP_INTERVAL_SECONDS = 0.5  # How often expired leases are looked for and requeued
+
+# Wire Configuration
+WIRE_CODECS = ('zstd', 'lz4', 'narrow')  # Codecs used with workers that support them, preferred first; zlib is slower than a LAN
+
+# Panel Cache Configuration
+SUPERTILE_BLOCKS = 8  # Each worker takes tasks from a square of this many blocks per side, reusing its cached panels
+
+# Points Configuration
+POINTS_FLUSH_SECONDS = 1.0  # How often credited points are written to the Data Server
+POINTS_BATCH_USERS = 1000  # Write early once this many users have uncredited points
+
 def get_local_ip():
     """
     Retrieves the local IP address of the master node.
@@ -46,175 +105,822 @@ def get_local_ip():
     except Exception:
         return "127.0.0.1"
 
-# Global Task Queue
-task_queue = queue.Queue()
+# Submitted jobs, served to the shared worker pool by priority and fair share
+job_queue = JobQueue()
 
-# Assigned Tasks Tracking
-assigned_tasks = {}
-task_lock = threading.Lock()
+# Pulsed when a job is submitted, so idle workers waiting for a lease wake up
+work_available = None
+event_loop = None
 
-def worker_handler(conn, addr):
+# Results are verified in batches on a shared pool, off the per-connection threads
+verification_pool = VerificationPool()
+verification_policy = VerificationPolicy(min_rate=SPOT_CHECK_MIN_RATE, probation=SPOT_CHECK_PROBATION,
+                                         audit_window_bytes=AUDIT_WINDOW_BYTES, audit_budget_bytes=AUDIT_BUDGET_BYTES)
+
+# Per-worker lease latencies and the leases being computed right now
+latency_tracker = LatencyTracker()
+lease_table = LeaseTable(latency_tracker, percentile=DEADLINE_PERCENTILE, factor=DEADLINE_FACTOR,
+                         slack=DEADLINE_SLACK_SECONDS, max_copies=MAX_SPECULATIVE_COPIES)
+recovery_stats = RecoveryStats()
+
+# Points are credited here and written to the Data Server in the background
+points_ledger = PointsLedger(flush_interval=POINTS_FLUSH_SECONDS, max_batch=POINTS_BATCH_USERS)
+
+# Lease settlement and user validation block, so they run here
+settle_executor = ThreadPoolExecutor(max_workers=SETTLE_THREADS, thread_name_prefix="Settler")
+
+# Measured capability of connected workers (peer address -> WorkerProfile)
+worker_profiles = {}
+profiles_lock = threading.Lock()
+
+class BatchSizer:
     """
-    Handles communication with a connected worker.
+    Adapts the number of tasks leased to one worker from the measured round trip
+    of its previous leases. Each lease should take about LEASE_TARGET_SECONDS
+    from send to result, so network latency is amortized over the whole batch
+    while slow workers still get small leases.
     """
-    worker_ip, worker_port = addr
-    thread_name = threading.current_thread().name
-    logging.info(f"Worker connected from {worker_ip}:{worker_port}")
+    def __init__(self, initial=1, target_seconds=LEASE_TARGET_SECONDS, max_tasks=MAX_LEASE_TASKS):
+        self.batch_size = initial
+        self.target_seconds = target_seconds
+        self.max_tasks = max_tasks
+
+    def record(self, n_tasks, elapsed):
+        """
+        Update the batch size after a lease of n_tasks took `elapsed` seconds.
+        Growth and shrinkage are limited to a factor of two per lease.
+        """
+        if n_tasks <= 0:
+            return
+        per_task = max(elapsed, 1e-6) / n_tasks
+        ideal = self.target_seconds / per_task
+        # Only grow past the last lease if it was full; a short tail lease says nothing
+        upper = 2 * n_tasks if n_tasks >= self.batch_size else self.batch_size
+        self.batch_size = int(max(1, min(self.max_tasks, upper, max(ideal, self.batch_size / 2))))
 
+# A returned lease waiting to be settled
+PendingLease = namedtuple('PendingLease', ['job', 'leased', 'results', 'selected', 'future', 'speculative'])
+
+def settle_lease(username, points, lease):
+    """
+    Wait for a lease's spot checks, then credit the user for its accepted tiles,
+    store them in C and requeue invalid ones. A failed check also invalidates the
+    worker's earlier unverified results and every unverified result of this lease.
+
+    Tiles may be held by more than one worker (speculative copies). Accepted
+    results claim their tiles in the task source and only the first claim is
+    stored and credited. Results of a job removed in the meantime are discarded.
+
+    Parameters:
+    - username (str): Worker's user.
+    - points (int): The user's points before this lease.
+    - lease (PendingLease): The lease as queued by WorkerSession.
+
+    Returns:
+    - tuple: (points after crediting, list of (first, count) tiles this lease won).
+    """
+    job, leased, results, selected, future, speculative = lease
+    if job.cancelled:
+        return points, []
     try:
-        with conn:
-            # Receive username upon connection
-            try:
-                data = receive_data_in_chunks(conn)
-                if not data or len(data) != 1:
-                    raise ValueError("Expected username upon connection.")
-                username = data[0]
-                logging.info(f"Worker for user '{username}' connected from {worker_ip}:{worker_port}")
-            except Exception as e:
-                logging.error(f"Failed to receive username from {worker_ip}:{worker_port}: {e}")
-                return
+        verdicts = iter(future.result())
+    except Exception as e:
+        logging.error(f"Validation error for user '{username}': {e}")
+        verdicts = iter([0] * sum(selected))
+
+    verified = []
+    unverified = []
+    failed = False
+    for (first, count), result, verify in zip(leased, results, selected):
+        tile_ids = range(first, first + count)
+        if not verify:
+            unverified.append((first, count, result, job))
+        elif next(verdicts) == 1:
+            verified.append((first, count, result, job))
+        else:
+            failed = True
+            # A speculative copy's tiles still belong to the original lease
+            if not speculative and job.tasks.fail(tile_ids):
+                # Requeued due to invalid result
+                logging.warning(f"Invalid result from user '{username}'. Task {first} of job {job.job_id} requeued.")
+
+    debited = 0
+    if failed:
+        # Nothing this worker returned without a check can be trusted any more
+        for first, count, result, owner in verification_policy.record_failure(username):
+            if owner.cancelled:
+                continue
+            if owner.checkpoint is not None:
+                owner.checkpoint.retract(first, count)
+            if owner.aggregator.retract(first, count, result):
+                owner.tasks.reopen(range(first, first + count))
+                owner.finished = None
+                debited += count
+        if not speculative:
+            job.tasks.release(task_id for first, count, _, _ in unverified for task_id in range(first, first + count))
+        unverified = []
+
+    # Claim the accepted tiles; a tile another copy already completed is dropped
+    accepted = verified + unverified
+    claimed = set(job.tasks.complete([task_id for first, count, _, _ in accepted
+                                      for task_id in range(first, first + count)]))
+    won = []
+    for entry in accepted:
+        first, count = entry[0], entry[1]
+        tile_ids = [task_id for task_id in range(first, first + count) if task_id in claimed]
+        if len(tile_ids) == count:
+            won.append(entry)
+        elif tile_ids:
+            # Part of a merged task was completed elsewhere; the rest is recomputed
+            job.tasks.reopen(tile_ids)
+    credited = sum(entry[1] for entry in won)
+    if not credited and not debited:
+        return points, []
+
+    # Credit the user's points, once per lease; the ledger writes them to the Data Server
+    new_points = points_ledger.credit(username, credited - debited)
+
+    for first, count, result, _ in won:
+        if job.aggregator.add(first, count, result) and job.checkpoint is not None:
+            job.checkpoint.record(first, count)
+    recovery_stats.completed(job, (task_id for first, count, _, _ in won for task_id in range(first, first + count)))
+    if speculative:
+        job.speculative_wins += len(won)
+    if not failed:
+        won_firsts = {entry[0] for entry in won}
+        verification_policy.record_pass(username, len(verified), [entry for entry in unverified if entry[0] in won_firsts])
+    logging.info(f"{credited} results of job {job.job_id} accepted from user '{username}' "
+                 f"({len(verified)} verified, {len(accepted) - len(won)} lost to other copies, "
+                 f"{debited} tiles invalidated). Points updated to {new_points}.")
+    if job.aggregator.done:
+        job_queue.finish(job)
+    return new_points, [(entry[0], entry[1]) for entry in won]
 
-            # Validate user via Data Server
+def validate_user(username):
+    """
+    Look up a user's points on the Data Server.
+
+    Returns:
+    - int: The user's points.
+    - None: If the user is not recognized or the Data Server is unreachable.
+    """
+    if OFFLINE:
+        return 0
+    try:
+        response = requests.get(f"{DATA_SERVER_URL}/get_points", params={'username': username}, timeout=5)
+        logging.debug(f"Data Server response for '/get_points': Status {response.status_code}, Body {response.text}")
+        if response.status_code != 200:
+            raise ValueError(f"User '{username}' not recognized.")
+        return points_ledger.observe(username, response.json().get('points', 0))
+    except Exception as e:
+        logging.error(f"Validation failed for user '{username}': {e}")
+        return None
+
+class WorkerSession:
+    """
+    State of one worker connection. worker_handler feeds it the frames the worker
+    sends and each on_* method handles one message type: HELLO once, then LEASE
+    and RESULT. A handler returns False when the session should end.
+
+    A worker may hold up to 1 + the 'prefetch' it advertises in HELLO leases at
+    once (at most 1 + MAX_PREFETCH_LEASES; the prefetch granted is sent back in
+    the HELLO reply), so its next lease is on the way while it computes the
+    current one. A lease asked for while the worker still
+    holds others is answered with an empty TASK frame if there is no work,
+    instead of waiting for some, so the results of the leases it holds are not
+    held up.
+
+    Workers that advertise a heartbeat interval in HELLO get leases that expire
+    after HEARTBEAT_MISSES silent intervals; every frame from the worker renews
+    its leases, and reap_expired_leases requeues them once they have expired.
+
+    Workers that advertise a panel cache in HELLO get TASK frames that reference
+    the panels they already hold instead of carrying them. The session mirrors
+    the worker's cache (see panels.PanelCache) to know which panels those are.
+
+    Workers that offer codecs or a prefetch in HELLO get a HELLO reply naming
+    the codecs picked from WIRE_CODECS, which both ends then encode their frames
+    with, and the prefetch granted.
+
+    Blocking work (user validation, verification and aggregation) runs on
+    executors and points are written to the Data Server by points_ledger, so the
+    event loop only moves frames and leases tasks.
+    """
+    def __init__(self, reader, writer, peer):
+        self.reader = reader
+        self.writer = writer
+        self.peer = peer
+        self.username = None
+        self.profile = None
+        self.points = 0
+        self.sizer = BatchSizer()
+        self.lease_id = 0
+        self.leases = {}  # lease_id -> LeaseRecord of the leases sent and not yet returned, oldest first
+        self.max_leases = 1  # Leases the worker may hold at once
+        self.last_result = time.monotonic()  # When the worker last returned a lease
+        self.pending = None  # Previous lease, still being verified
+        self.heartbeat = None  # Worker's heartbeat interval in seconds; None if it sends none
+        self.lease_ttl = None  # Seconds of silence after which the worker's leases expire
+        self.last_seen = time.monotonic()
+        self.panels = None  # Mirror of the worker's panel cache; None if it has none
+        self.panel_epoch = 0  # Bumped whenever the mirror is reset; the worker then resets its cache
+        self.claims = set()  # Ids of the jobs this worker has claimed a supertile of
+        self.codec = None  # Compressor of frames to and from the worker
+        self.narrow = False  # Whether integer arrays are narrowed on the wire
+        self.wire = WireStats()  # Frames received since the last result, charged to its job
+
+    async def on_hello(self, frame):
+        if self.username is not None:
+            raise ValueError("Duplicate HELLO.")
+        username = (frame.meta or {}).get('username')
+        if not username:
+            raise ValueError("Expected username upon connection.")
+        self.profile = WorkerProfile(gflops=frame.meta.get('gflops'))
+        self.heartbeat = frame.meta.get('heartbeat')
+        slots = max(1, int(frame.meta.get('slots') or 1))
+        self.sizer = BatchSizer(initial=slots)
+        self.max_leases = 1 + min(max(0, int(frame.meta.get('prefetch') or 0)), MAX_PREFETCH_LEASES)
+        if frame.meta.get('panel_cache'):
+            self.panels = PanelCache(int(frame.meta['panel_cache']))
+        offered = frame.meta.get('codecs')
+        if offered is not None:
+            self.codec, self.narrow = negotiate_codecs(offered, WIRE_CODECS)
+        logging.info(f"Worker for user '{username}' connected from {self.peer}: {self.profile}, {slots} compute slots, "
+                     f"up to {self.max_leases} leases at once")
+
+        # Validate user via Data Server
+        points = await asyncio.get_running_loop().run_in_executor(settle_executor, validate_user, username)
+        if points is None:
+            await send_frame_async(self.writer, MSG_DONE)  # Send termination signal
+            return False
+        logging.info(f"User '{username}' is valid with {points} points.")
+        self.username = username
+        self.points = points
+        if offered is not None or 'prefetch' in frame.meta:
+            await send_frame_async(self.writer, MSG_HELLO, meta={'codec': self.codec, 'narrow': self.narrow,
+                                                                 'prefetch': self.max_leases - 1})
+            logging.debug(f"Worker {self.peer} codecs: {self.codec or 'no compression'}, narrowing {self.narrow}.")
+        with profiles_lock:
+            worker_profiles[self.peer] = self.profile
+        return True
+
+    async def on_lease(self, frame):
+        if self.username is None or len(self.leases) >= self.max_leases:
+            raise ValueError("Unexpected lease request.")
+        requested = int((frame.meta or {}).get('max_tasks', 1))
+
+        # Lease a batch of tasks from the next job in line, deeper tiles for faster workers
+        job, leased, source = self.next_lease(requested)
+        if not leased and self.pending:
+            # Invalid results in the last lease may requeue tiles
+            await self.settle_pending()
+            job, leased, source = self.next_lease(requested)
+        if not leased and self.leases:
+            # A prefetch: the worker is still busy, so do not keep its results waiting
+            await send_frame_async(self.writer, MSG_TASK, 0, meta={'task_ids': []})
+            return True
+        deadline = time.monotonic() + IDLE_WAIT_SECONDS
+        while not leased:
+            # Keep idle workers connected for a while in case a job is submitted,
+            # and for as long as other workers' leases may still need copying
+            now = time.monotonic()
+            straggler = lease_table.next_deadline() if SPECULATION else None
+            if straggler is None and now >= deadline:
+                break
+            timeout = IDLE_POLL_SECONDS
+            if now < deadline:
+                timeout = min(timeout, deadline - now)
+            if straggler is not None:
+                timeout = min(timeout, max(straggler - now, STRAGGLER_POLL_SECONDS))
             try:
-                response = requests.get(f"{DATA_SERVER_URL}/get_points", params={'username': username}, timeout=5)
-                logging.debug(f"Data Server response for '/get_points': Status {response.status_code}, Body {response.text}")
-                if response.status_code != 200:
-                    raise ValueError(f"User '{username}' not recognized.")
-                points = response.json().get('points', 0)
-                logging.info(f"User '{username}' is valid with {points} points.")
-            except Exception as e:
-                logging.error(f"Validation failed for user '{username}': {e}")
-                send_data_in_chunks(conn, None)  # Send termination signal
-                return
+                await asyncio.wait_for(work_available.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            job, leased, source = self.next_lease(requested)
+        if not leased:
+            # No more tasks available
+            await send_frame_async(self.writer, MSG_DONE)  # Send termination signal
+            logging.info(f"No more tasks available. Terminating worker '{self.username}'.")
+            return False
+
+        # Send the whole batch in one frame. The worker computes its leases in
+        # order, so a prefetched one starts when the others should be done.
+        self.lease_id += 1
+        busy_until = max((record.expected for record in self.leases.values()), default=None)
+        record = lease_table.open(self, self.lease_id, job, leased, sum(job.tile_flops(count) for _, count in leased),
+                                  speculative=source is not None, prior=self.seconds_per_flop(), after=busy_until)
+        record.arrays = [block for first, count in leased for block in job.task_blocks(first, count)]
+        # Each result is padded to 8 bytes on the wire
+        record.result_bytes = sum(a.shape[0] * b.shape[1] * job.itemsize + 8
+                                  for a, b in zip(record.arrays[0::2], record.arrays[1::2]))
+        self.leases[self.lease_id] = record
+        if source is not None:
+            lease_table.contest(source, record)
+            job.speculative_tasks += len(leased)
+        if self.heartbeat:
+            # Heartbeats stop while the worker uploads its results, so allow for the upload
+            result_bytes = len(leased) * job.plan.tile_m * job.plan.tile_n * job.itemsize
+            self.lease_ttl = HEARTBEAT_MISSES * self.heartbeat + 2 * result_bytes / self.profile.bandwidth
+            record.expires = time.monotonic() + self.lease_ttl
+        meta = {'task_ids': [first for first, _ in leased], 'spans': [count for _, count in leased]}
+        if self.panels is not None:
+            arrays = self.reference_panels(record, meta)
+        else:
+            arrays = record.arrays
+            job.operand_bytes_sent += sum(block.nbytes for block in arrays)
+        await send_frame_async(self.writer, MSG_TASK, self.lease_id, arrays=arrays, meta=meta,
+                               codec=self.codec, narrow=self.narrow, stats=job.wire)
+        logging.debug(f"Sent {'speculative ' if source else ''}lease {self.lease_id} with {len(leased)} tasks "
+                      f"of job {job.job_id} to worker '{self.username}'.")
+
+        # Settle the previous lease while the worker computes this one
+        await self.settle_pending()
+        return True
+
+    def next_lease(self, requested):
+        """
+        Lease up to `requested` tasks, capped by the batch sizer and MAX_LEASE_BYTES.
+        With nothing left to hand out, copy a straggling lease of another worker.
+
+        Returns:
+        - tuple: (job, leased, source) where source is the LeaseRecord a
+          speculative lease copies, or None for a regular lease.
+        """
+        def span_for(job):
+            return tile_span(job.plan, self.profile, job.itemsize)
 
+        limit = min(requested, self.sizer.batch_size)
+        job, leased = job_queue.lease(limit, span_for, MAX_LEASE_BYTES, lessee=self)
+        if leased:
+            self.claims.add(job.job_id)
+        # Only idle workers copy stragglers; a prefetched copy would wait behind the worker's own leases
+        if leased or not SPECULATION or self.leases:
+            return job, leased, None
+        source, leased = lease_table.speculate(self, limit, prior=self.seconds_per_flop())
+        if not leased:
+            return None, [], None
+        return source.job, leased, source
+
+    def reference_panels(self, record, meta):
+        """
+        Fill in the panel references of a TASK frame for a worker with a panel
+        cache, and pick the panels that still have to be sent. Walks the panels
+        in the order the worker's resolve_panels does, so the mirror stays in step
+        with the worker's cache.
+
+        Parameters:
+        - record (LeaseRecord): The lease, with its operand blocks.
+        - meta (dict): The frame's meta; 'job_id', 'epoch', 'panels' and 'sent' are added.
+
+        Returns:
+        - list of np.ndarray: The panels to send, in the order of meta['sent'].
+        """
+        job = record.job
+        panels = []
+        sent = []
+        arrays = []
+        for (first, count), a, b in zip(record.leased, record.arrays[0::2], record.arrays[1::2]):
+            keys = job.panel_keys(first, count)
+            for key, panel in zip(keys, (a, b)):
+                if self.panels.get((job.job_id, key)) is not None:
+                    job.operand_bytes_saved += panel.nbytes
+                    continue
+                self.panels.put((job.job_id, key), True, panel.nbytes)
+                sent.append(key)
+                arrays.append(panel)
+                job.operand_bytes_sent += panel.nbytes
+            panels.append(keys)
+        meta.update(job_id=job.job_id, epoch=self.panel_epoch, panels=panels, sent=sent)
+        return arrays
+
+    def seen(self):
+        """
+        Note a frame from the worker and renew its leases.
+        """
+        self.last_seen = time.monotonic()
+        for record in self.leases.values():
+            if record.expires is not None:
+                record.expires = self.last_seen + self.lease_ttl
+
+    async def pump(self, frames):
+        """
+        Read frames from the worker as they arrive, so heartbeats renew the lease
+        even while a handler is busy, and pass everything else on to `frames`.
+        Puts None when the connection ends.
+        """
+        try:
             while True:
-                try:
-                    # Fetch a task from the global queue
-                    task = task_queue.get_nowait()
-                    a_block, b_block, retry_count = task
-                    logging.debug(f"Assigning task to user '{username}': Retry Count: {retry_count}")
-
-                    # Record the assignment
-                    with task_lock:
-                        assigned_tasks[thread_name] = task
-
-                    # Send task to worker
-                    send_data_in_chunks(conn, (a_block, b_block))
-                    logging.debug(f"Sent task to worker '{username}': {task}")
-
-                    # Receive result from worker
-                    data = receive_data_in_chunks(conn)
-                    if not data or len(data) != 2:
-                        raise ValueError("Expected tuple of (username, result).")
-
-                    received_username, result = data
-                    if received_username != username:
-                        raise ValueError(f"Username mismatch: {received_username} != {username}")
-
-                    logging.debug(f"Received result from user '{username}': {result}")
-
-                    # Validate the result
-                    try:
-                        is_valid = check(np.array(a_block), np.array(b_block), np.array(result))
-                    except Exception as e:
-                        logging.error(f"Validation error for user '{username}': {e}")
-                        is_valid = 0
-
-                    if is_valid == 1:
-                        # Increment user's points via Data Server
-                        try:
-                            new_points = points + 1
-                            update_response = requests.post(f"{DATA_SERVER_URL}/update_points", json={
-                                'username': username,
-                                'points': new_points
-                            }, timeout=5)
-                            logging.debug(f"Data Server response for '/update_points': Status {update_response.status_code}, Body {update_response.text}")
-                            if update_response.status_code != 200:
-                                raise ValueError("Failed to update points.")
-                            points = new_points
-                            logging.info(f"Valid result from user '{username}'. Points updated to {points}.")
-                            # Send updated points to worker
-                            send_data_in_chunks(conn, points)
-                            logging.debug(f"Sent updated points ({points}) to user '{username}'.")
-                        except Exception as e:
-                            logging.error(f"Failed to update/send points for user '{username}': {e}")
-                            # Requeue the task for reassignment
-                            task_queue.put((a_block, b_block, retry_count))
-                            continue  # Proceed to the next iteration
-                    else:
-                        # Requeue the task due to invalid result
-                        if retry_count < MAX_RETRIES:
-                            new_retry_count = retry_count + 1
-                            task_queue.put((a_block, b_block, new_retry_count))
-                            logging.warning(f"Invalid result from user '{username}'. Task requeued with retry count {new_retry_count}.")
-                        else:
-                            logging.error(f"Task failed after {MAX_RETRIES} retries. Discarding task: {task}")
-                    
-                    # Remove the task from assigned_tasks
-                    with task_lock:
-                        del assigned_tasks[thread_name]
-
-                except queue.Empty:
-                    # No more tasks available
-                    send_data_in_chunks(conn, None)  # Send termination signal
-                    logging.info(f"No more tasks available. Terminating worker '{username}'.")
-                    break
-                except Exception as e:
-                    logging.error(f"Error during task assignment or result processing for user '{username}': {e}")
-                    # If a task was assigned but not processed, requeue it
-                    with task_lock:
-                        if thread_name in assigned_tasks:
-                            task = assigned_tasks[thread_name]
-                            task_queue.put(task)
-                            del assigned_tasks[thread_name]
+                frame = await receive_frame_async(self.reader, self.wire, payload_limit=self.max_payload)
+                if frame is None:
                     break
+                self.seen()
+                if frame.msg_type != MSG_HEARTBEAT:
+                    await frames.put(frame)
+        except (ConnectionError, OSError, ValueError) as e:
+            logging.debug(f"Connection to worker {self.peer} lost: {e}")
+        finally:
+            await frames.put(None)
+
+    def max_payload(self):
+        """
+        Largest frame payload the worker may send: the results of every lease it
+        holds, so a client cannot make the master allocate more than that.
+        """
+        return FRAME_SLACK_BYTES + sum(record.result_bytes for record in self.leases.values())
 
+    def expire(self, record):
+        """
+        Requeue an expired lease and drop the connection, which may be half-open.
+        """
+        if self.leases.get(record.lease_id) is not record:
+            return
+        silent_for = time.monotonic() - self.last_seen
+        del self.leases[record.lease_id]
+        lease_table.close(record)
+        job = record.job
+        task_ids = [task_id for first, count in record.leased for task_id in range(first, first + count)]
+        # A speculative copy's tiles still belong to the original lease
+        if not record.speculative:
+            job.tasks.release(task_ids)
+            job.reclaimed_tasks += len(task_ids)
+            recovery_stats.reclaimed(job, task_ids, silent_for)
+        logging.warning(f"Lease {record.lease_id} of worker {self.peer} (user '{self.username}') expired after "
+                        f"{silent_for:.1f}s without a heartbeat. {len(task_ids)} tasks of job {job.job_id} requeued.")
+        self.writer.transport.abort()
+
+    def seconds_per_flop(self):
+        """
+        Latency prior from the worker's measured GFLOP/s, used until it has returned leases.
+        """
+        return 1.0 / (self.profile.gflops * 1e9)
+
+    def receive_timeout(self):
+        """
+        Seconds to wait for the worker's next frame: unbounded while it holds no
+        lease, and until its earliest lease is STALL_FACTOR deadlines late otherwise.
+        """
+        if not self.leases:
+            return None
+        stalled = min(record.sent + STALL_FACTOR * (record.deadline - record.sent) for record in self.leases.values())
+        return max(0.0, stalled - time.monotonic())
+
+    async def on_result(self, frame):
+        record = self.leases.get(frame.task_id)
+        if record is None:
+            raise ValueError(f"Unexpected results for lease {frame.task_id}.")
+        task_ids = [first for first, _ in record.leased]
+        if (frame.meta or {}).get('task_ids') != task_ids or len(frame.arrays) != len(task_ids):
+            raise ValueError(f"Result batch does not match lease {record.lease_id}.")
+
+        received_username = frame.meta.get('username')
+        if received_username != self.username:
+            raise ValueError(f"Username mismatch: {received_username} != {self.username}")
+
+        del self.leases[record.lease_id]
+        lease_table.close(record)
+        job = record.job
+        wire = self.wire.take()
+        wire.peer_seconds = float(frame.meta.get('codec_seconds') or 0.0)
+        job.wire.merge(wire)
+
+        # Tasks whose panels the worker's cache lost come back empty; its cache starts over
+        missing = set(frame.meta.get('missing') or ())
+        if missing:
+            logging.warning(f"Worker {self.peer} was missing panels for {len(missing)} tasks of lease {record.lease_id}. "
+                            f"Resetting its panel cache.")
+            if self.panels is not None:
+                self.panels.clear()
+                self.panel_epoch += 1
+
+        # Tasks another copy won come back empty; anything else must have the right shape and dtype
+        leased = []
+        arrays = []
+        results = []
+        forced = []
+        unprocessed = []
+        for (first, count), a, b, result in zip(record.leased, record.arrays[0::2], record.arrays[1::2], frame.arrays):
+            if first in missing and result.size == 0:
+                unprocessed.extend(range(first, first + count))
+                continue
+            if first in record.cancelled and result.size == 0:
+                continue
+            leased.append((first, count))
+            arrays.extend((a, b))
+            results.append(result)
+            forced.append(result.shape != (a.shape[0], b.shape[1]) or result.dtype != np.result_type(a, b))
+
+        # The worker gets to a lease once it has returned the one before
+        now = time.monotonic()
+        elapsed = now - max(record.sent, self.last_result)
+        self.last_result = now
+        self.sizer.record(len(task_ids), elapsed)
+        flops = sum(2 * a.shape[0] * a.shape[1] * b.shape[1] for a, b in zip(arrays[0::2], arrays[1::2]))
+        nbytes = sum(a.nbytes for a in arrays) + sum(c.nbytes for c in results)
+        self.profile.record_lease(flops, nbytes, elapsed, frame.meta.get('compute_seconds'))
+        latency_tracker.record(self.peer, flops, elapsed)
+        logging.debug(f"Received {len(results)} results for lease {record.lease_id} from user '{self.username}' "
+                      f"({len(task_ids) - len(results)} cancelled). Next batch size: {self.sizer.batch_size}, {self.profile}.")
+
+        # Hand the spot-checked results to the verification pool. Frames received
+        # by the event loop own their buffers, so the results need no copy.
+        if self.pending:
+            await self.settle_pending()
+        selected = [verify or force for verify, force in zip(verification_policy.select(self.username, len(results)), forced)]
+        triples = [triple for triple, verify in zip(zip(arrays[0::2], arrays[1::2], results), selected) if verify]
+        self.pending = PendingLease(job, leased, results, selected, verification_pool.submit(triples),
+                                    record.speculative)
+        # A speculative copy's tiles still belong to the original lease
+        if unprocessed and not record.speculative:
+            job.tasks.release(unprocessed)
+            notify_work()
+
+        # Send credited points to worker
+        await send_frame_async(self.writer, MSG_POINTS, record.lease_id, meta={'points': self.points})
+        logging.debug(f"Sent updated points ({self.points}) to user '{self.username}'.")
+        return True
+
+    async def settle_pending(self):
+        """
+        Settle the previous lease once its spot checks are done, and cancel other
+        copies of the tiles it won.
+        """
+        if not self.pending:
+            return
+        lease, self.pending = self.pending, None
+        try:
+            await asyncio.wrap_future(lease.future)
+        except Exception:
+            pass  # Reported by settle_lease
+        self.points, won = await asyncio.get_running_loop().run_in_executor(
+            settle_executor, settle_lease, self.username, self.points, lease)
+        for session, lease_id, firsts in lease_table.rivals(self, lease.job, won):
+            asyncio.create_task(session.cancel(lease_id, firsts))
+
+    async def cancel(self, lease_id, firsts):
+        """
+        Tell the worker to skip tasks of a lease it holds that another copy won.
+        """
+        record = self.leases.get(lease_id)
+        if record is None:
+            return
+        record.cancelled.update(firsts)
+        try:
+            await send_frame_async(self.writer, MSG_CANCEL, lease_id, meta={'task_ids': firsts})
+            logging.debug(f"Cancelled {len(firsts)} tasks of lease {lease_id} at worker {self.peer}.")
+        except Exception as e:
+            logging.warning(f"Could not cancel tasks at worker {self.peer}: {e}")
+
+    async def close(self):
+        """
+        Credit results already received and requeue the leases still in flight.
+        """
+        try:
+            await self.settle_pending()
+        except Exception as e:
+            logging.error(f"Failed to settle last lease for user '{self.username}': {e}")
+        for record in self.leases.values():
+            lease_table.close(record)
+            # A speculative copy's tiles still belong to the original lease
+            if not record.speculative:
+                record.job.tasks.release(task_id for first, count in record.leased
+                                         for task_id in range(first, first + count))
+        self.leases = {}
+        for job_id in self.claims:
+            job = job_queue.get(job_id)
+            if job is not None:
+                job.tasks.forget(self)
+        latency_tracker.forget(self.peer)
+        with profiles_lock:
+            worker_profiles.pop(self.peer, None)
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except Exception:
+            pass
+
+async def worker_handler(reader, writer):
+    """
+    Handles communication with a connected worker: receives frames and dispatches
+    them to its WorkerSession until either side ends the session.
+    """
+    worker_ip, worker_port = writer.get_extra_info('peername')[:2]
+    session = WorkerSession(reader, writer, f"{worker_ip}:{worker_port}")
+    handlers = {
+        MSG_HELLO: session.on_hello,
+        MSG_LEASE: session.on_lease,
+        MSG_RESULT: session.on_result,
+    }
+    logging.info(f"Worker connected from {worker_ip}:{worker_port}")
+
+    # Frames are read by their own task so heartbeats are seen while a handler waits
+    frames = asyncio.Queue(maxsize=1)
+    pump = asyncio.create_task(session.pump(frames))
+    try:
+        while True:
+            try:
+                frame = await asyncio.wait_for(frames.get(), session.receive_timeout())
+            except asyncio.TimeoutError:
+                logging.warning(f"Worker {session.peer} (user '{session.username}') stalled on lease "
+                                f"{session.lease_id}. Dropping it.")
+                break
+            if frame is None:
+                break
+            handler = handlers.get(frame.msg_type)
+            if handler is None:
+                raise ValueError(f"Unexpected message type {frame.msg_type}.")
+            if not await handler(frame):
+                break
     except Exception as e:
-        logging.error(f"Error handling worker {thread_name}: {e}")
+        logging.error(f"Error during task assignment or result processing for worker {session.peer} "
+                      f"(user '{session.username}'): {e}")
+    finally:
+        pump.cancel()
+        await session.close()
 
-def distribute_tasks():
+async def reap_expired_leases():
     """
-    Initializes the master node, sets up the server to accept worker connections,
-    and manages task distribution.
+    Requeue the leases of workers that stopped sending heartbeats, e.g. behind a
+    half-open connection that would otherwise pin their tasks indefinitely.
+    """
+    while True:
+        await asyncio.sleep(REAP_INTERVAL_SECONDS)
+        expired = lease_table.expired()
+        for record in expired:
+            try:
+                record.session.expire(record)
+            except Exception as e:
+                logging.error(f"Failed to reclaim lease {record.lease_id} of worker {record.session.peer}: {e}")
+        if expired:
+            notify_work()
+            logging.info(f"Lease recovery: {recovery_stats.summary()}")
+
+async def sweep_jobs():
+    """
+    Release the operands of finished jobs once no unverified result of theirs is
+    left in an audit window, and evict jobs past JOB_RETENTION_SECONDS.
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(JOB_SWEEP_SECONDS)
+        try:
+            # Audit window entries are (first, count, result, job)
+            pinned = verification_policy.windowed(3)
+            await loop.run_in_executor(settle_executor, job_queue.sweep, JOB_RETENTION_SECONDS, pinned)
+        except Exception as e:
+            logging.error(f"Failed to sweep finished jobs: {e}")
+
+def master_metrics():
     """
-    master_ip = MASTER_IP
-    master_port = MASTER_PORT
+    Master-wide counters served by the job API at /metrics.
+    """
+    return {
+        'workers': len(worker_profiles),
+        'speculative_leases': lease_table.speculated,
+        'recovery': recovery_stats.summary(),
+        'points': points_ledger.summary(),
+        'audit_window_bytes': verification_policy.window_bytes(),
+    }
+
+def submit_job(a, b, submitter='master', priority=0, block_size=None):
+    """
+    Plan a C = A x B multiply and queue it for the worker pool.
+
+    Parameters:
+    - a, b (np.ndarray): Operands.
+    - submitter (str): Who the job is accounted to for fair share.
+    - priority (int): Higher priorities are served first.
+    - block_size (int or None): Fixed square block size; None lets the scheduler pick.
 
-    logging.info(f"Master node is running on IP: {get_local_ip()}, Port: {master_port}")
+    Returns:
+    - Job: The queued job.
+    """
+    m, k = a.shape
+    n = b.shape[1]
+    itemsize = np.result_type(a, b).itemsize
+    if block_size is None:
+        with profiles_lock:
+            profiles = list(worker_profiles.values())
+        plan = plan_tiles(m, n, k, itemsize, profiles)
+    else:
+        plan = fixed_plan(m, n, k, block_size)
+
+    # Stream C to a memory-mapped file if it is too large for RAM; checkpointed jobs always do
+    output_path = OUTPUT_PATH if m * n * itemsize > MEMMAP_THRESHOLD_BYTES else None
+    job = Job(a, b, plan, submitter=submitter, priority=priority, output_path=output_path, max_retries=MAX_RETRIES,
+              checkpoint_dir=CHECKPOINT_DIR, supertile=SUPERTILE_BLOCKS)
+    logging.info(f"Job {job.job_id}: {plan.grid_m} x {plan.grid_n} x {plan.grid_k} tiles ({job.tasks.total} tasks).")
+    job_queue.add(job)
+    if event_loop is not None:
+        event_loop.call_soon_threadsafe(notify_work)
+    return job
 
-    # Generate matrices and split into blocks once
+def notify_work():
+    """
+    Wake every worker waiting for a lease. Runs on the event loop.
+    """
+    work_available.set()
+    work_available.clear()
+
+def resume_jobs():
+    """
+    Queue the jobs checkpointed in CHECKPOINT_DIR by an earlier run. Finished
+    jobs come back as done, so their results can still be fetched.
+
+    Returns:
+    - int: Number of unfinished jobs resumed.
+    """
+    resumed = 0
+    for checkpoint in find_checkpoints(CHECKPOINT_DIR):
+        try:
+            job = Job.resume(checkpoint, max_retries=MAX_RETRIES, supertile=SUPERTILE_BLOCKS)
+        except Exception as e:
+            logging.error(f"Could not resume the job in {checkpoint.directory}: {e}")
+            continue
+        job_queue.add(job)
+        if not job.aggregator.done:
+            resumed += 1
+            logging.info(f"Resumed job {job.job_id}: {job.tasks.completed} of {job.tasks.total} tasks "
+                         f"already complete.")
+    return resumed
+
+def submit_random_job():
+    """
+    Queue the original demo job: two random matrix_size x matrix_size integer matrices.
+    """
     matrix_a = np.random.randint(0, 10, size=(matrix_size, matrix_size))
     matrix_b = np.random.randint(0, 10, size=(matrix_size, matrix_size))
-    try:
-        a_blocks, b_blocks = split_matrices(matrix_a, matrix_b, block_size)
-        logging.info(f"Split matrices into {len(a_blocks)} row blocks and {len(b_blocks)} column blocks.")
-    except Exception as e:
-        logging.error(f"Error splitting matrices: {e}")
-        return
+    return submit_job(matrix_a, matrix_b, block_size=block_size)
 
-    # Enqueue n^2 tasks
-    total_tasks = 0
-    for a_block, b_block in product(a_blocks, b_blocks):
-        task_queue.put((a_block, b_block, 0))  # Initial retry_count=0
-        total_tasks += 1
-    logging.info(f"Enqueued a total of {total_tasks} tasks into the global task queue.")
+def start_job_api(port):
+    """
+    Serve the job submission API from a background thread.
+    """
+    app = create_job_api(job_queue, submit_job, metrics=master_metrics, data_dir=JOB_DATA_DIR)
+    thread = threading.Thread(target=lambda: app.run(host=MASTER_IP, port=port, threaded=True),
+                              name="JobAPI", daemon=True)
+    thread.start()
+    logging.info(f"Job API listening on port {port}.")
 
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-        s.bind((master_ip, master_port))
-        s.listen()
-        logging.info("Master node is waiting for workers to connect...")
+async def serve(host, port):
+    """
+    Accept worker connections on the event loop; each one runs worker_handler.
+    """
+    global work_available, event_loop
+    work_available = asyncio.Event()
+    event_loop = asyncio.get_running_loop()
+    server = await asyncio.start_server(worker_handler, host, port, backlog=LISTEN_BACKLOG)
+    reaper = asyncio.create_task(reap_expired_leases())
+    sweeper = asyncio.create_task(sweep_jobs())
+    if not OFFLINE:
+        points_ledger.start(DATA_SERVER_URL)
+    logging.info("Master node is waiting for workers to connect...")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        reaper.cancel()
+        sweeper.cancel()
+        points_ledger.stop()
 
-        while True:
-            try:
-                conn, addr = s.accept()
-                logging.info(f"Accepted connection from {addr}")
-                worker_thread = threading.Thread(
-                    target=worker_handler, args=(conn, addr),
-                    name=f"WorkerHandler-{addr}"
-                )
-                worker_thread.start()
-            except Exception as e:
-                logging.error(f"Error accepting connections: {e}")
+def distribute_tasks(random_job=True, api_port=JOB_API_PORT):
+    """
+    Initializes the master node, sets up the server to accept worker connections,
+    and manages task distribution across all submitted jobs.
+    """
+    logging.info(f"Master node is running on IP: {get_local_ip()}, Port: {MASTER_PORT}"
+                 f"{' (offline, no data server)' if OFFLINE else ''}")
+    if api_port:
+        start_job_api(api_port)
+    resumed = resume_jobs() if CHECKPOINT_DIR else 0
+    if random_job and not resumed:
+        submit_random_job()
+    asyncio.run(serve(MASTER_IP, MASTER_PORT))
 
 if __name__ == "__main__":
-    distribute_tasks()
+    parser = argparse.ArgumentParser(description="Master node: distributes matrix multiplication tiles to workers.")
+    parser.add_argument('--offline', action='store_true',
+                        help="Run without the data server (no user validation or points), e.g. for load tests.")
+    parser.add_argument('--port', type=int, default=MASTER_PORT, help="Port to accept workers on.")
+    parser.add_argument('--api-port', type=int, default=JOB_API_PORT, help="Port of the job API; 0 disables it.")
+    parser.add_argument('--data-dir', default=JOB_DATA_DIR,
+                        help="Directory jobs may name .npy operands in by relative path; by default only uploads and JSON are accepted.")
+    parser.add_argument('--no-random-job', action='store_true', help="Start idle and only run submitted jobs.")
+    parser.add_argument('--idle-wait', type=float, default=IDLE_WAIT_SECONDS,
+                        help="Seconds an idle worker waits for new work before it is released.")
+    parser.add_argument('--matrix-size', type=int, default=matrix_size, help="Size of the random startup job.")
+    parser.add_argument('--block-size', type=int, default=block_size, help="Fixed square block size.")
+    parser.add_argument('--checkpoint-dir', default=CHECKPOINT_DIR,
+                        help="Directory for job checkpoints; unfinished jobs in it are resumed at startup.")
+    parser.add_argument('--no-checkpoint', action='store_true', help="Keep no checkpoints, e.g. for load tests.")
+    parser.add_argument('--log-level', default='DEBUG', help="Logging level, e.g. INFO for large runs.")
+    args = parser.parse_args()
+
+    OFFLINE = args.offline
+    MASTER_PORT = args.port
+    IDLE_WAIT_SECONDS = args.idle_wait
+    matrix_size = args.matrix_size
+    block_size = args.block_size
+    CHECKPOINT_DIR = None if args.no_checkpoint else args.checkpoint_dir
+    JOB_DATA_DIR = args.data_dir
+    logging.getLogger().setLevel(args.log_level)
+    distribute_tasks(random_job=not args.no_random_job, api_port=args.api_port)
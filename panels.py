@@ -0,0 +1,109 @@
+# panels.py
+from collections import OrderedDict, defaultdict, deque
+
+
+class PanelCache:
+    """
+    LRU cache of operand panels (the A and B blocks of tasks), bounded by a byte budget.
+
+    Workers keep the panels they were sent, so a later task that needs the same
+    panel references it by key instead of carrying it again. The master keeps a
+    mirror of each worker's cache that holds only the sizes: both sides apply the
+    same lookups and insertions in the same order, so the mirror knows which
+    panels the worker still holds without asking.
+
+    Parameters:
+    - budget (int): Maximum bytes of panels held.
+    """
+    def __init__(self, budget):
+        self.budget = budget
+        self.nbytes = 0
+        self.epoch = 0  # Reset count of the master's mirror this cache is in step with
+        self._entries = OrderedDict()  # key -> (value, nbytes), least recently used first
+
+    def get(self, key):
+        """
+        Look a panel up and mark it as recently used.
+
+        Returns:
+        - The cached value, or None if the panel is not cached.
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def put(self, key, value, nbytes):
+        """
+        Insert a panel, evicting the least recently used ones to make room.
+        Panels larger than the whole budget are not cached.
+
+        Returns:
+        - bool: True if the panel was cached.
+        """
+        if nbytes > self.budget:
+            return False
+        while self.nbytes + nbytes > self.budget:
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self.nbytes -= evicted
+        self._entries[key] = (value, nbytes)
+        self.nbytes += nbytes
+        return True
+
+    def clear(self):
+        self._entries.clear()
+        self.nbytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def resolve_panels(cache, frame):
+    """
+    Worker side of a TASK frame that references panels: look up the (a, b)
+    panels of every task in order, taking the ones that are not cached from the
+    frame and caching copies of them (the frame's buffer is reused).
+
+    The master only leaves a panel out if its mirror says the worker holds it.
+    If a referenced panel is missing anyway, the task cannot be computed: it is
+    reported back and the cache is cleared. The master then resets its mirror and
+    bumps the frame's 'epoch'; the first frame of a new epoch clears the cache
+    again, so frames sent before the master heard of the miss cannot leave the
+    two out of step.
+
+    Parameters:
+    - cache (PanelCache): The worker's panel cache.
+    - frame (Frame): TASK frame with meta 'job_id', 'epoch', 'panels' ([a_key, b_key]
+      per task) and 'sent' (keys of the panels in frame.arrays, in order).
+
+    Returns:
+    - tuple: (blocks, missing) where blocks holds (a, b) per task, or None where
+      a panel is missing, and missing lists the first task ids of those tasks.
+    """
+    job_id = frame.meta['job_id']
+    if frame.meta.get('epoch', 0) != cache.epoch:
+        cache.clear()
+        cache.epoch = frame.meta.get('epoch', 0)
+    sent = defaultdict(deque)
+    for key, array in zip(frame.meta['sent'], frame.arrays):
+        sent[key].append(array)
+    blocks = []
+    missing = []
+    for task_id, keys in zip(frame.meta['task_ids'], frame.meta['panels']):
+        pair = []
+        for key in keys:
+            panel = cache.get((job_id, key))
+            if panel is None and sent[key]:
+                panel = sent[key].popleft()
+                if cache.put((job_id, key), panel.copy(), panel.nbytes):
+                    panel = cache.get((job_id, key))
+            pair.append(panel)
+        if pair[0] is None or pair[1] is None:
+            blocks.append(None)
+            missing.append(task_id)
+        else:
+            blocks.append(tuple(pair))
+    if missing:
+        cache.clear()
+    return blocks, missing
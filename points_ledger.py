@@ -0,0 +1,167 @@
+# points_ledger.py
+import time
+import uuid
+import threading
+import logging
+
+import requests  # For HTTP communication
+
+
+class PointsLedger:
+    """
+    The master's running total of every user's points, written to the Data
+    Server in the background.
+
+    Settling a lease credits the ledger, which updates the total at once and
+    queues the change. A flusher thread sends the queued changes every
+    `flush_interval` seconds, or sooner once `max_batch` users have changes
+    waiting. Credits to one user between flushes are coalesced, and the changes
+    of up to `max_batch` users go to the Data Server's /bulk_increment in one
+    request over a keep-alive session. Changes are deltas, so other writers'
+    credits to the same users are not overwritten.
+
+    A failed batch is retried unchanged, with the same batch id, on the next
+    flush: the Data Server applies each batch id once, so a batch that was
+    applied but whose reply was lost is not credited twice. A correctly computed
+    lease is never requeued because the Data Server was slow.
+
+    Parameters:
+    - flush_interval (float): Seconds between flushes.
+    - max_batch (int): Users with pending changes that trigger an early flush,
+      and users per request.
+    - timeout (float): Seconds to wait for each Data Server request.
+    """
+    def __init__(self, flush_interval=1.0, max_batch=1000, timeout=5.0):
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.timeout = timeout
+        self.url = None
+        self.credits = 0  # Credits (and debits) applied
+        self.requests = 0  # Update requests sent to the Data Server
+        self.failed_requests = 0
+        self.flush_seconds = 0.0  # Total time spent flushing
+        self._totals = {}  # username -> points, as the master knows them
+        self._pending = {}  # username -> points change not yet written
+        self._failed = []  # (batch_id, {username: points}) of batches to retry, oldest first
+        self._in_flight = set()  # Users whose changes are being written right now
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._session = None
+        self._thread = None
+
+    def start(self, url):
+        """
+        Start writing to the Data Server at `url`. Until then the ledger only
+        keeps totals, e.g. for a master running offline.
+        """
+        self.url = url
+        self._session = requests.Session()
+        self._thread = threading.Thread(target=self._run, name="PointsLedger", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop the flusher after writing what is still pending.
+        """
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._wake.set()
+        self._thread.join()
+        self._thread = None
+        self._session.close()
+
+    def observe(self, username, points):
+        """
+        Reconcile the ledger with a user's points read from the Data Server.
+        The server's value is adopted unless this master still has changes for
+        the user that the server has not seen.
+
+        Returns:
+        - int: The user's points.
+        """
+        with self._lock:
+            if username in self._pending or username in self._in_flight or \
+                    any(username in batch for _, batch in self._failed):
+                return self._totals[username]
+            self._totals[username] = points
+            return points
+
+    def credit(self, username, points):
+        """
+        Add `points` (negative to debit) to a user's total and queue the change.
+
+        Returns:
+        - int: The user's new total.
+        """
+        with self._lock:
+            total = self._totals.get(username, 0) + points
+            self._totals[username] = total
+            self.credits += 1
+            if self._thread is not None:
+                self._pending[username] = self._pending.get(username, 0) + points
+                if len(self._pending) >= self.max_batch:
+                    self._wake.set()
+            return total
+
+    def flush(self):
+        """
+        Write the batches that failed before, then every pending change, to the
+        Data Server. Batches that could not be written are kept for the next flush.
+
+        Returns:
+        - int: Number of users whose changes could not be written.
+        """
+        with self._lock:
+            pending, self._pending = list(self._pending.items()), {}
+            batches, self._failed = self._failed, []
+            batches += [(uuid.uuid4().hex, dict(pending[start:start + self.max_batch]))
+                        for start in range(0, len(pending), self.max_batch)]
+            self._in_flight = {username for _, batch in batches for username in batch}
+        if not batches:
+            return 0
+        started = time.perf_counter()
+        failed = []
+        for batch_id, batch in batches:
+            try:
+                response = self._session.post(f"{self.url}/bulk_increment",
+                                              json={'batch_id': batch_id, 'credits': batch}, timeout=self.timeout)
+                if response.status_code != 200:
+                    raise ValueError(f"Status {response.status_code}, Body {response.text}")
+                unknown = response.json().get('unknown')
+                if unknown:
+                    logging.warning(f"Data Server does not know users {unknown}; their points were not written.")
+            except Exception as e:
+                logging.error(f"Failed to write points of {len(batch)} users: {e}")
+                failed.append((batch_id, batch))
+        with self._lock:
+            self._failed = failed
+            self._in_flight = set()
+            self.requests += len(batches)
+            self.failed_requests += len(failed)
+            self.flush_seconds += time.perf_counter() - started
+        n_failed = sum(len(batch) for _, batch in failed)
+        logging.debug(f"Flushed points of {sum(len(batch) for _, batch in batches) - n_failed} users "
+                      f"to the Data Server{f', {n_failed} failed' if n_failed else ''}.")
+        return n_failed
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+        self.flush()
+
+    def summary(self):
+        """
+        JSON-serializable counters of the ledger.
+        """
+        with self._lock:
+            return {
+                'credits': self.credits,
+                'requests': self.requests,
+                'failed_requests': self.failed_requests,
+                'pending_users': len(self._pending) + sum(len(batch) for _, batch in self._failed),
+                'flush_seconds': self.flush_seconds,
+            }
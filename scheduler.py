@@ -0,0 +1,212 @@
+# scheduler.py
+import math
+import time
+import logging
+from collections import namedtuple
+
+import numpy as np
+
+# Cost model defaults, used until workers have been measured
+DEFAULT_WORKER_GFLOPS = 10.0
+DEFAULT_WORKER_BANDWIDTH = 12.5e6  # bytes/s (100 Mbit/s)
+DEFAULT_WORKER_COUNT = 4
+MASTER_BANDWIDTH = 125e6  # bytes/s (1 Gbit/s); every operand byte crosses the master's link
+MASTER_GFLOPS = 5.0  # Master-side verification throughput
+TASK_OVERHEAD_SECONDS = 2e-4  # Fixed per-tile cost: framing, bookkeeping, verification setup
+MIN_TILE = 4
+PROFILE_CLASS_WIDTH = 0.05  # Workers within about 5% in GFLOP/s and bandwidth are planned for as one class
+
+# Tile shape of C = A x B work items. A task covers rows [i*tile_m, ...), columns
+# [j*tile_n, ...) and the k range [kk*tile_k, ...) and produces a partial block
+# that is summed over kk.
+TilePlan = namedtuple('TilePlan', ['tile_m', 'tile_n', 'tile_k', 'grid_m', 'grid_n', 'grid_k',
+                                   'est_seconds', 'tile_seconds'])
+
+# Workers grouped into classes of similar profiles, one array entry per class:
+# member count, mean seconds per FLOP and per byte, and the slowest member's.
+ProfileClasses = namedtuple('ProfileClasses', ['counts', 'seconds_per_flop', 'seconds_per_byte',
+                                               'max_seconds_per_flop', 'max_seconds_per_byte'])
+
+
+class WorkerProfile:
+    """
+    Measured capability of one worker: compute throughput and link bandwidth.
+    GFLOP/s starts from what the worker advertises and both figures are refined
+    from every lease it returns.
+    """
+    def __init__(self, gflops=None, bandwidth=None, smoothing=0.3):
+        self.gflops = gflops or DEFAULT_WORKER_GFLOPS
+        self.bandwidth = bandwidth or DEFAULT_WORKER_BANDWIDTH
+        self.smoothing = smoothing
+
+    def record_lease(self, flops, nbytes, elapsed, compute_seconds):
+        """
+        Update the profile from one lease round trip.
+
+        Parameters:
+        - flops (int): Floating point operations in the lease.
+        - nbytes (int): Bytes sent and received for the lease.
+        - elapsed (float): Seconds from sending the lease to receiving its results.
+        - compute_seconds (float or None): Compute time reported by the worker.
+        """
+        alpha = self.smoothing
+        if compute_seconds and compute_seconds > 0:
+            self.gflops = (1 - alpha) * self.gflops + alpha * flops / compute_seconds / 1e9
+            transfer = elapsed - compute_seconds
+            if transfer > 0:
+                self.bandwidth = (1 - alpha) * self.bandwidth + alpha * nbytes / transfer
+
+    def tile_seconds(self, tile_m, tile_n, tile_k, itemsize):
+        """
+        Estimated time for this worker to receive, compute and return one tile.
+        """
+        flops = 2.0 * tile_m * tile_n * tile_k
+        nbytes = (tile_m * tile_k + tile_k * tile_n + tile_m * tile_n) * itemsize
+        return flops / (self.gflops * 1e9) + nbytes / self.bandwidth + TASK_OVERHEAD_SECONDS
+
+    def __repr__(self):
+        return f"WorkerProfile(gflops={self.gflops:.2f}, bandwidth={self.bandwidth / 1e6:.1f} MB/s)"
+
+
+def profile_classes(profiles):
+    """
+    Group worker profiles whose GFLOP/s and bandwidth fall in the same
+    PROFILE_CLASS_WIDTH log bin, so the planner's cost grows with the number of
+    distinct kinds of workers rather than the number of workers. A tile's time
+    is linear in seconds per FLOP and per byte, so a class's mean gives its
+    members' mean tile time.
+
+    Parameters:
+    - profiles (list of WorkerProfile): At least one profile.
+
+    Returns:
+    - ProfileClasses: Arrays with one entry per class.
+    """
+    per_flop = np.array([1.0 / (p.gflops * 1e9) for p in profiles])
+    per_byte = np.array([1.0 / p.bandwidth for p in profiles])
+    bins = np.round(np.log(np.stack([per_flop, per_byte], axis=1)) / math.log1p(PROFILE_CLASS_WIDTH))
+    _, labels, counts = np.unique(bins, axis=0, return_inverse=True, return_counts=True)
+    labels = labels.ravel()
+
+    def per_class(values, reduce):
+        out = np.full(len(counts), -np.inf) if reduce is np.maximum else np.zeros(len(counts))
+        reduce.at(out, labels, values)
+        return out
+    return ProfileClasses(counts, per_class(per_flop, np.add) / counts, per_class(per_byte, np.add) / counts,
+                          per_class(per_flop, np.maximum), per_class(per_byte, np.maximum))
+
+
+def _candidates(dim):
+    sizes = set()
+    size = MIN_TILE
+    while size < dim:
+        sizes.add(size)
+        size *= 2
+    sizes.add(dim)
+    return sorted(sizes)
+
+
+def estimate_seconds(m, n, k, tile_m, tile_n, tile_k, itemsize, profiles):
+    """
+    Cost model for the time to solution of an m x k by k x n multiply.
+
+    The job is bounded by the slower of the workers' aggregate tile throughput
+    and the master's link and verification throughput, plus one tile of tail
+    on the slowest worker.
+
+    The tile sizes may be arrays of candidates (broadcast against each other),
+    and `profiles` a list of WorkerProfile or their ProfileClasses; the estimate
+    then has the tile sizes' shape.
+    """
+    if not isinstance(profiles, ProfileClasses):
+        profiles = profile_classes(profiles)
+    tile_m, tile_n, tile_k = (np.asarray(size, dtype=np.float64)[..., None] for size in (tile_m, tile_n, tile_k))
+    tiles = np.ceil(m / tile_m) * np.ceil(n / tile_n) * np.ceil(k / tile_k)
+    flops = 2.0 * tile_m * tile_n * tile_k
+    nbytes = (tile_m * tile_k + tile_k * tile_n + tile_m * tile_n) * itemsize
+    # (..., classes) tile times of each class's mean and slowest member
+    tile_times = flops * profiles.seconds_per_flop + nbytes * profiles.seconds_per_byte + TASK_OVERHEAD_SECONDS
+    slowest = flops * profiles.max_seconds_per_flop + nbytes * profiles.max_seconds_per_byte + TASK_OVERHEAD_SECONDS
+    throughput = np.sum(profiles.counts / tile_times, axis=-1)
+    compute_bound = np.maximum(tiles[..., 0] / throughput, tile_times.min(axis=-1))
+
+    verify_flops = 2.0 * (tile_k * tile_n + tile_m * tile_k + tile_m * tile_n)
+    master_bound = tiles * (nbytes / MASTER_BANDWIDTH + verify_flops / (MASTER_GFLOPS * 1e9) + TASK_OVERHEAD_SECONDS)
+
+    return np.maximum(compute_bound, master_bound[..., 0]) + slowest.max(axis=-1)
+
+
+def plan_tiles(m, n, k, itemsize=8, profiles=None, worker_count=None):
+    """
+    Choose the tile shape for a job, including a split over the k dimension.
+
+    Every candidate shape is scored in one vectorized pass against the workers
+    grouped by profile_classes.
+
+    Parameters:
+    - m, n, k (int): C is m x n and the inner dimension is k.
+    - itemsize (int): Bytes per element of the operands.
+    - profiles (list of WorkerProfile or None): Known workers; defaults are used if empty.
+    - worker_count (int or None): Expected number of workers when fewer profiles are known.
+
+    Returns:
+    - TilePlan: The tile shape with the lowest estimated time to solution.
+    """
+    profiles = list(profiles or [])
+    worker_count = max(worker_count or len(profiles) or DEFAULT_WORKER_COUNT, len(profiles))
+    while len(profiles) < worker_count:
+        profiles.append(WorkerProfile())
+    classes = profile_classes(profiles)
+
+    grid = np.meshgrid(_candidates(m), _candidates(n), _candidates(k), indexing='ij')
+    estimates = estimate_seconds(m, n, k, *grid, itemsize, classes)
+    # Ties go to the first candidate, smallest tiles first, as before
+    best = np.unravel_index(np.argmin(estimates), estimates.shape)
+    tile_m, tile_n, tile_k = (int(sizes[best]) for sizes in grid)
+    est = float(estimates[best])
+
+    # Size work for the slowest worker; faster ones get deeper tiles (see tile_span)
+    flops = 2.0 * tile_m * tile_n * tile_k
+    nbytes = (tile_m * tile_k + tile_k * tile_n + tile_m * tile_n) * itemsize
+    slowest = float(np.max(flops * classes.max_seconds_per_flop + nbytes * classes.max_seconds_per_byte)
+                    + TASK_OVERHEAD_SECONDS)
+    plan = TilePlan(tile_m, tile_n, tile_k, math.ceil(m / tile_m), math.ceil(n / tile_n),
+                    math.ceil(k / tile_k), est, slowest)
+    logging.info(f"Planned {tile_m}x{tile_n}x{tile_k} tiles ({plan.grid_m}x{plan.grid_n}x{plan.grid_k} grid) "
+                 f"for {m}x{k} @ {k}x{n} on {len(profiles)} workers in {len(classes.counts)} classes; "
+                 f"estimated {est:.2f}s.")
+    return plan
+
+
+def fixed_plan(m, n, k, block_size):
+    """
+    Square output blocks over the full k range, i.e. the original row/column split.
+    """
+    return TilePlan(block_size, block_size, k, math.ceil(m / block_size), math.ceil(n / block_size),
+                    1, None, None)
+
+
+def tile_span(plan, profile, itemsize=8):
+    """
+    Number of consecutive k tiles to merge into one task for a worker, so that
+    heterogeneous workers all take about plan.tile_seconds per task: a worker
+    twice as fast as the slowest one gets tiles twice as deep.
+    """
+    if plan.grid_k <= 1 or not plan.tile_seconds:
+        return 1
+    per_tile = profile.tile_seconds(plan.tile_m, plan.tile_n, plan.tile_k, itemsize)
+    return int(max(1, min(plan.grid_k, plan.tile_seconds // per_tile)))
+
+
+def measure_gflops(size=256, repeats=3):
+    """
+    Quick local matrix-multiply benchmark a worker advertises at connect time.
+    """
+    a = np.random.rand(size, size)
+    b = np.random.rand(size, size)
+    np.dot(a, b)  # Warm up BLAS
+    start = time.perf_counter()
+    for _ in range(repeats):
+        np.dot(a, b)
+    elapsed = time.perf_counter() - start
+    return 2.0 * size ** 3 * repeats / max(elapsed, 1e-9) / 1e9
@@ -1,18 +1,198 @@
 # simulate_workers.py
-import threading
+"""
+Load test: thousands of simulated workers against one master.
+
+Starts master.py in offline mode (no data server) and opens --workers
+concurrent worker connections from a single asyncio process. The simulated
+workers speak the real protocol (HELLO, LEASE, TASK, RESULT, POINTS) and
+compute their tiles with np.dot, so every result passes verification.
+
+All workers connect and say HELLO first; leasing starts once every connection
+is up, so the run reports how long the master took to accept them all and then,
+once a second, open connections and completed tasks per second.
+
+Usage:
+    python simulate_workers.py [--workers 10000] [--matrix-size 1024] [--block-size 4]
+    python simulate_workers.py --master HOST:PORT    # against a running master
+
+Each connection needs a file descriptor on both ends; raise `ulimit -n` above
+the worker count before running this with 10k+ workers.
+"""
+import argparse
+import asyncio
+import resource
+import socket
 import subprocess
+import sys
+import time
 
-def start_worker():
-    subprocess.run(["python", "worker.py"])
+import numpy as np
+
+from helper import send_frame_async, receive_frame_async, MSG_HELLO, MSG_LEASE, MSG_RESULT, MSG_POINTS, MSG_DONE, MSG_CANCEL
+
+CONNECT_CONCURRENCY = 256  # Connection attempts in flight at once
+CONNECT_RETRIES = 20
+
+
+class Stats:
+    def __init__(self):
+        self.open = 0
+        self.peak_open = 0
+        self.ready = 0
+        self.tasks = 0
+        self.failed_connects = 0
+        self.finished = 0
+
+
+def raise_fd_limit():
+    """
+    Raise the soft open-file limit to the hard limit; the master subprocess inherits it.
+    """
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    return hard
+
+
+async def connect(host, port, gate):
+    delay = 0.05
+    for _ in range(CONNECT_RETRIES):
+        try:
+            async with gate:
+                return await asyncio.open_connection(host, port)
+        except OSError:
+            await asyncio.sleep(delay)
+            delay = min(2 * delay, 2.0)
+    return None
+
+
+async def receive_reply(reader):
+    # Cancellations only matter to workers that check for them mid-lease
+    while True:
+        frame = await receive_frame_async(reader)
+        if frame is None or frame.msg_type != MSG_CANCEL:
+            return frame
 
-if __name__ == "__main__":
-    num_workers = 4  # Number of worker nodes to simulate
-    threads = []
 
-    for _ in range(num_workers):
-        thread = threading.Thread(target=start_worker)
-        thread.start()
-        threads.append(thread)
+async def simulated_worker(idx, host, port, lease_size, gate, go, stats):
+    connection = await connect(host, port, gate)
+    if connection is None:
+        stats.failed_connects += 1
+        return
+    reader, writer = connection
+    stats.open += 1
+    stats.peak_open = max(stats.peak_open, stats.open)
+    username = f"sim-{idx}"
+    try:
+        await send_frame_async(writer, MSG_HELLO, meta={'username': username, 'gflops': 1.0})
+        stats.ready += 1
+        await go.wait()
+        while True:
+            await send_frame_async(writer, MSG_LEASE, meta={'max_tasks': lease_size})
+            frame = await receive_reply(reader)
+            if frame is None or frame.msg_type == MSG_DONE:
+                break
+            start = time.perf_counter()
+            results = [np.dot(a, b) for a, b in zip(frame.arrays[0::2], frame.arrays[1::2])]
+            await send_frame_async(writer, MSG_RESULT, frame.task_id, arrays=results, meta={
+                'username': username,
+                'task_ids': frame.meta['task_ids'],
+                'compute_seconds': time.perf_counter() - start,
+            })
+            frame = await receive_reply(reader)
+            if frame is None or frame.msg_type != MSG_POINTS:
+                break
+            stats.tasks += len(results)
+    except (ConnectionError, OSError):
+        pass
+    finally:
+        stats.open -= 1
+        stats.finished += 1
+        writer.close()
 
-    for thread in threads:
-        thread.join()
+
+async def report(stats, n_workers, interval=1.0):
+    start = time.perf_counter()
+    last_tasks = 0
+    print(f"{'t (s)':>6} {'open':>7} {'tasks/s':>9} {'tasks':>9}")
+    while stats.finished < n_workers:
+        await asyncio.sleep(interval)
+        rate = (stats.tasks - last_tasks) / interval
+        last_tasks = stats.tasks
+        print(f"{time.perf_counter() - start:>6.0f} {stats.open:>7} {rate:>9.0f} {stats.tasks:>9}")
+
+
+async def run(host, port, n_workers, lease_size, duration):
+    stats = Stats()
+    gate = asyncio.Semaphore(CONNECT_CONCURRENCY)
+    go = asyncio.Event()
+    start = time.perf_counter()
+    workers = [asyncio.create_task(simulated_worker(idx, host, port, lease_size, gate, go, stats))
+               for idx in range(n_workers)]
+    while stats.ready + stats.failed_connects + stats.finished < n_workers:
+        await asyncio.sleep(0.1)
+    print(f"{stats.ready} workers connected in {time.perf_counter() - start:.1f}s "
+          f"({stats.failed_connects} failed to connect).")
+
+    go.set()
+    reporter = asyncio.create_task(report(stats, n_workers))
+    start = time.perf_counter()
+    done, pending = await asyncio.wait(workers, timeout=duration)
+    elapsed = time.perf_counter() - start
+    for task in pending:
+        task.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
+    reporter.cancel()
+
+    print(f"\n{n_workers} workers: peak {stats.peak_open} concurrent connections.")
+    print(f"{stats.tasks} tasks in {elapsed:.1f}s: {stats.tasks / elapsed:.0f} tasks/s.")
+
+
+def wait_for_port(host, port, process, timeout=120):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("Master exited during startup.")
+        try:
+            with socket.create_connection((host, port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("Master did not start listening in time.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=10000, help="Number of concurrent simulated workers.")
+    parser.add_argument('--master', help="HOST:PORT of a running master; by default one is started offline.")
+    parser.add_argument('--port', type=int, default=65433, help="Port for the master started by this script.")
+    parser.add_argument('--matrix-size', type=int, default=1024, help="Operand size for the started master.")
+    parser.add_argument('--block-size', type=int, default=4, help="Block size for the started master.")
+    parser.add_argument('--lease-size', type=int, default=4, help="Tasks each worker asks for per lease.")
+    parser.add_argument('--duration', type=float, default=120.0, help="Stop after this many seconds.")
+    args = parser.parse_args()
+
+    limit = raise_fd_limit()
+    if args.workers + 64 > limit:
+        print(f"Warning: open-file limit {limit} is too low for {args.workers} workers.")
+
+    master = None
+    if args.master:
+        host, port = args.master.rsplit(':', 1)
+        port = int(port)
+    else:
+        host, port = '127.0.0.1', args.port
+        master = subprocess.Popen([sys.executable, 'master.py', '--offline', '--port', str(port),
+                                   '--matrix-size', str(args.matrix_size), '--block-size', str(args.block_size),
+                                   '--idle-wait', '0', '--api-port', '0', '--no-checkpoint', '--log-level', 'WARNING'])
+        wait_for_port(host, port, master)
+    try:
+        asyncio.run(run(host, port, args.workers, args.lease_size, args.duration))
+    finally:
+        if master:
+            master.terminate()
+            master.wait()
+
+
+if __name__ == "__main__":
+    main()
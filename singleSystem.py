@@ -1,6 +1,7 @@
 # singleSystem.py
 import numpy as np
 import logging
+import threading
 
 
 def split_matrices(A, B, block_size):
@@ -57,3 +58,124 @@ def aggregate_results(results, A_shape, B_shape, block_size):
             idx += 1
     logging.debug("aggregate_results: Successfully aggregated results into final matrix.")
     return C
+
+
+class ResultAggregator:
+    """
+    Streams validated tile results into their (i, j) slot of a preallocated C as
+    they arrive, in any order. Tiles that split the k dimension are summed into
+    their slot. With a path, C is a memory-mapped .npy file so jobs larger than
+    the master's RAM can be assembled.
+
+    Parameters:
+    - shape (tuple): Shape of C, (m, n).
+    - dtype (np.dtype): dtype of C.
+    - plan (scheduler.TilePlan): Tile shape and grid of the job.
+    - path (str or None): Output .npy file; None keeps C in memory.
+    - resume (bool): Reopen an existing file at `path` instead of creating it;
+      call restore() before adding results.
+    """
+
+    def __init__(self, shape, dtype, plan, path=None, resume=False):
+        self.plan = plan
+        self.path = path
+        if path and resume:
+            self.C = np.lib.format.open_memmap(path, mode='r+')
+            if self.C.shape != tuple(shape) or self.C.dtype != np.dtype(dtype):
+                raise ValueError(f"{path} holds a {self.C.shape} {self.C.dtype} array, expected {shape} {dtype}.")
+        elif path:
+            self.C = np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=shape)
+        else:
+            self.C = np.zeros(shape, dtype=dtype)
+        # One flag per tile of the (grid_m, grid_n, grid_k) grid, indexed by task id
+        self.completed = np.zeros(plan.grid_m * plan.grid_n * plan.grid_k, dtype=bool)
+        self.remaining = self.completed.size
+        self.finished = threading.Event()
+        self._lock = threading.Lock()
+
+    def add(self, task_id, span, block):
+        """
+        Write one validated result into C.
+
+        Parameters:
+        - task_id (int): Id of the first tile the result covers.
+        - span (int): Number of consecutive k tiles the result covers.
+        - block (np.ndarray): The (partial) product block.
+
+        Returns:
+        - bool: True if applied, False if any of its tiles was already complete.
+        """
+        rows, cols = self._slot(task_id, block)
+        with self._lock:
+            if self.completed[task_id:task_id + span].any():
+                logging.warning(f"ResultAggregator: tile {task_id} (span {span}) already complete; ignoring result.")
+                return False
+            if self.plan.grid_k == 1:
+                self.C[rows, cols] = block
+            else:
+                self.C[rows, cols] += block
+            self.completed[task_id:task_id + span] = True
+            self.remaining -= span
+            if self.remaining == 0:
+                if self.path:
+                    self.C.flush()
+                self.finished.set()
+                logging.info("ResultAggregator: all tiles complete.")
+        return True
+
+    def retract(self, task_id, span, block):
+        """
+        Undo an earlier add() of the same result, e.g. when a spot check later
+        shows the worker that produced it cannot be trusted.
+
+        Returns:
+        - bool: True if retracted, False if the tiles were not all complete.
+        """
+        rows, cols = self._slot(task_id, block)
+        with self._lock:
+            if not self.completed[task_id:task_id + span].all():
+                return False
+            if self.plan.grid_k == 1:
+                self.C[rows, cols] = 0
+            else:
+                self.C[rows, cols] -= block
+            self.completed[task_id:task_id + span] = False
+            self.remaining += span
+            self.finished.clear()
+        return True
+
+    def restore(self, done_blocks):
+        """
+        Resume from a checkpoint: keep the (i, j) blocks of C that were complete
+        and zero the others, which may hold partial sums that were never logged.
+
+        Parameters:
+        - done_blocks (np.ndarray): (grid_m * grid_n,) bool, True for complete blocks.
+        """
+        plan = self.plan
+        done = done_blocks.reshape(plan.grid_m, plan.grid_n)
+        column_block = np.arange(self.C.shape[1]) // plan.tile_n
+        with self._lock:
+            for i in np.flatnonzero(~done.all(axis=1)):
+                band = self.C[i * plan.tile_m:(i + 1) * plan.tile_m]
+                columns = np.flatnonzero(~done[i][column_block])
+                # Only zero columns holding data; writing zeros would dirty every page of a mostly empty C
+                dirty = columns[band[:, columns].any(axis=0)]
+                if dirty.size:
+                    band[:, dirty] = 0
+            self.completed = np.repeat(done_blocks, plan.grid_k)
+            self.remaining = int(self.completed.size - self.completed.sum())
+            if self.remaining == 0:
+                self.finished.set()
+
+    def _slot(self, task_id, block):
+        plan = self.plan
+        ij, kk = divmod(task_id, plan.grid_k)
+        i, j = divmod(ij, plan.grid_n)
+        rows = slice(i * plan.tile_m, i * plan.tile_m + block.shape[0])
+        cols = slice(j * plan.tile_n, j * plan.tile_n + block.shape[1])
+        return rows, cols
+
+    @property
+    def done(self):
+        return self.finished.is_set()
@@ -0,0 +1,319 @@
+# stragglers.py
+import time
+import threading
+import logging
+from collections import defaultdict, deque
+
+import numpy as np
+
+DEFAULT_DEADLINE_SECONDS = 60.0  # Lease deadline with no latency samples and no prior
+MIN_SAMPLES = 5  # Leases a worker must have returned before its own percentiles are used
+
+
+class LatencyTracker:
+    """
+    Recent lease round trips of each worker and of the whole pool, normalized to
+    seconds per FLOP so that leases of different sizes and jobs are comparable.
+    """
+    def __init__(self, window=64):
+        self.window = window
+        self._workers = defaultdict(lambda: deque(maxlen=window))
+        self._pool = deque(maxlen=16 * window)
+        self._lock = threading.Lock()
+
+    def record(self, worker, flops, elapsed):
+        """
+        Record that a worker turned around a lease of `flops` in `elapsed` seconds.
+        """
+        if flops <= 0 or elapsed <= 0:
+            return
+        with self._lock:
+            self._workers[worker].append(elapsed / flops)
+            self._pool.append(elapsed / flops)
+
+    def percentile(self, worker, q):
+        """
+        q-th percentile of a worker's seconds per FLOP. Uses the pool's samples
+        while the worker has fewer than MIN_SAMPLES.
+
+        Returns:
+        - float or None: None if nothing has been recorded yet.
+        """
+        with self._lock:
+            samples = self._workers.get(worker)
+            if not samples or len(samples) < MIN_SAMPLES:
+                samples = self._pool
+            if not samples:
+                return None
+            return float(np.percentile(samples, q))
+
+    def forget(self, worker):
+        with self._lock:
+            self._workers.pop(worker, None)
+
+
+class LeaseRecord:
+    """
+    A lease a worker is computing right now.
+    """
+    def __init__(self, session, lease_id, job, leased, flops, sent, deadline, expected, speculative):
+        self.session = session
+        self.lease_id = lease_id
+        self.job = job
+        self.leased = leased
+        self.flops = flops
+        self.sent = sent
+        self.deadline = deadline  # Past this the lease counts as straggling
+        self.expected = expected  # When the worker's median latency says it should finish
+        self.speculative = speculative
+        self.copies = 0
+        self.cancelled = set()  # First task ids another copy won
+        self.arrays = None  # Operand blocks, kept by the master to verify the results
+        self.result_bytes = 0  # Payload bytes of the results the worker may send back
+        self.expires = None  # Reclaimed past this unless renewed by a heartbeat; None never expires
+
+
+class LeaseTable:
+    """
+    Open leases with deadlines derived from the LatencyTracker.
+
+    A lease's deadline is `factor` times its worker's `percentile` latency for the
+    lease's FLOPs plus `slack`. Once a job has nothing left to hand out, an idle
+    worker may be given a speculative copy of another worker's lease if that lease
+    is past its deadline, or if the idle worker is expected to finish the copy
+    before the holder finishes the original. Leases that share tiles this way are
+    indexed so the losers can be cancelled when the first valid result is in.
+
+    Parameters:
+    - latency (LatencyTracker): Observed latencies.
+    - percentile (float): Latency percentile deadlines are based on.
+    - factor (float): Multiplier on that percentile.
+    - slack (float): Seconds added to every deadline.
+    - max_copies (int): Speculative copies allowed per lease.
+    """
+    def __init__(self, latency, percentile=95, factor=3.0, slack=1.0, max_copies=1):
+        self.latency = latency
+        self.percentile = percentile
+        self.factor = factor
+        self.slack = slack
+        self.max_copies = max_copies
+        self.speculated = 0
+        self._by_job = defaultdict(set)  # job_id -> open LeaseRecords
+        self._contested = defaultdict(set)  # (job_id, first task id) -> LeaseRecords holding a copy
+        self._deadline_cache = (float('-inf'), None)  # (computed at, next_deadline())
+        self._candidate_cache = (float('-inf'), [], 0.0)  # (computed at, copyable leases by urgency, most time left per FLOP)
+        self._lock = threading.Lock()
+
+    def open(self, session, lease_id, job, leased, flops, speculative=False, prior=None, after=None):
+        """
+        Register a lease that was just sent to `session`'s worker.
+
+        Parameters:
+        - prior (float or None): Seconds per FLOP to assume for the worker before
+          any latency has been observed, e.g. from its advertised GFLOP/s.
+        - after (float or None): time.monotonic() when the worker is expected to
+          start on the lease, if it is still busy with earlier ones; the deadline
+          counts from then.
+
+        Returns:
+        - LeaseRecord: The record to close once the results are in.
+        """
+        now = time.monotonic()
+        slow = self.latency.percentile(session.peer, self.percentile) or prior
+        median = self.latency.percentile(session.peer, 50) or prior
+        start = max(now, after or now)
+        deadline = start + (self.factor * slow * flops + self.slack if slow else DEFAULT_DEADLINE_SECONDS)
+        expected = start + (median * flops if median else 0.0)
+        record = LeaseRecord(session, lease_id, job, leased, flops, now, deadline, expected, speculative)
+        with self._lock:
+            self._by_job[job.job_id].add(record)
+        return record
+
+    def close(self, record):
+        with self._lock:
+            records = self._by_job.get(record.job.job_id)
+            if records is not None:
+                records.discard(record)
+                if not records:
+                    del self._by_job[record.job.job_id]
+            for first, _ in record.leased:
+                holders = self._contested.get((record.job.job_id, first))
+                if holders is not None:
+                    holders.discard(record)
+                    if not holders:
+                        del self._contested[(record.job.job_id, first)]
+
+    def _candidates(self, now, max_age):
+        """
+        Leases of jobs with nothing left to hand out that may still be copied,
+        overdue ones first (longest overdue first), then by time left. Rebuilt
+        at most every `max_age` seconds, so idle workers polling for stragglers
+        do not each scan every open lease. Called with the lock held.
+
+        Returns:
+        - tuple: (candidates, the most seconds left per FLOP of a lease that is not overdue)
+        """
+        computed, candidates, left_per_flop = self._candidate_cache
+        if now - computed > max_age:
+            candidates = [record for records in self._by_job.values() for record in records
+                          if not (record.speculative or record.copies >= self.max_copies
+                                  or record.job.cancelled or record.job.tasks.pending)]
+            candidates.sort(key=lambda record: (now <= record.deadline,
+                                                record.deadline - now if now > record.deadline else now - record.expected))
+            left_per_flop = max(((record.expected - now) / max(record.flops, 1) for record in candidates
+                                 if now <= record.deadline), default=0.0)
+            self._candidate_cache = (now, candidates, left_per_flop)
+        return candidates, left_per_flop
+
+    def speculate(self, session, max_tasks, prior=None, max_age=0.1):
+        """
+        Pick a straggling lease of another worker for an idle `session` to copy.
+        `prior` is the idle worker's assumed seconds per FLOP, as for open().
+        Candidates are ranked once per `max_age` seconds (see _candidates) and
+        rechecked here, so a poll costs about one lookup.
+
+        Returns:
+        - tuple: (source LeaseRecord, entries) where entries are the (first, count)
+          tasks of the source that are still outstanding, at most max_tasks; or
+          (None, []) if nothing is worth copying.
+        """
+        now = time.monotonic()
+        rate = self.latency.percentile(session.peer, 50) or prior
+        best = None
+        with self._lock:
+            candidates, left_per_flop = self._candidates(now, max_age)
+            if rate and left_per_flop <= rate and not (candidates and now > candidates[0].deadline):
+                # Nothing overdue, and this worker would finish no copy before the original
+                return None, []
+            for record in candidates:
+                if (record.session is session or record.copies >= self.max_copies
+                        or record not in self._by_job.get(record.job.job_id, ())):
+                    continue
+                overdue = now > record.deadline
+                eta = rate * record.flops if rate else 0.0
+                if overdue or record.expected - now > eta:
+                    best = (overdue, record)
+                    break
+            if best is None:
+                return None, []
+            record = best[1]
+            entries = [(first, count) for first, count in record.leased
+                       if record.job.tasks.outstanding(range(first, first + count))][:max_tasks]
+            if not entries:
+                return None, []
+            record.copies += 1
+            self.speculated += 1
+        logging.info(f"Straggler: lease {record.lease_id} of {record.session.peer} (job {record.job.job_id}) "
+                     f"is {'overdue' if best[0] else 'behind'}; copying {len(entries)} tasks to {session.peer}.")
+        return record, entries
+
+    def expired(self, now=None):
+        """
+        Open leases whose expiry has passed without being renewed.
+        """
+        now = now or time.monotonic()
+        with self._lock:
+            return [record for records in self._by_job.values() for record in records
+                    if record.expires is not None and record.expires < now]
+
+    def next_deadline(self, max_age=0.1):
+        """
+        Earliest deadline among the leases that could still be copied, so idle
+        workers can wait for stragglers instead of leaving. The answer is cached
+        for `max_age` seconds; every idle worker polls this.
+
+        Returns:
+        - float or None: A time.monotonic() value, or None if there is nothing to copy.
+        """
+        now = time.monotonic()
+        with self._lock:
+            if now - self._deadline_cache[0] > max_age:
+                deadlines = [record.deadline for records in self._by_job.values() for record in records
+                             if not (record.speculative or record.copies >= self.max_copies or record.job.cancelled)]
+                self._deadline_cache = (now, min(deadlines, default=None))
+            return self._deadline_cache[1]
+
+    def contest(self, source, copy):
+        """
+        Index the tiles that a speculative copy shares with its source lease.
+        """
+        with self._lock:
+            for first, _ in copy.leased:
+                holders = self._contested[(copy.job.job_id, first)]
+                holders.add(source)
+                holders.add(copy)
+
+    def rivals(self, winner, job, won):
+        """
+        Other open leases holding copies of tiles that `winner` just completed.
+
+        Returns:
+        - list of tuple: (session, lease_id, first task ids) per losing lease.
+        """
+        losers = defaultdict(list)
+        with self._lock:
+            for first, _ in won:
+                for record in self._contested.get((job.job_id, first), ()):
+                    if record.session is not winner:
+                        losers[record].append(first)
+        return [(record.session, record.lease_id, firsts) for record, firsts in losers.items()]
+
+
+class RecoveryStats:
+    """
+    How quickly the tasks of dead workers are reclaimed and recomputed.
+
+    - detection: seconds from a worker's last sign of life to its lease being reclaimed.
+    - recovery: seconds from reclaiming a task to its result being accepted from another worker.
+    """
+    def __init__(self, window=1024):
+        self.expired_leases = 0
+        self.reclaimed_tasks = 0
+        self._detection = deque(maxlen=window)
+        self._recovery = deque(maxlen=window)
+        self._reclaimed = {}  # (job_id, task_id) -> time.monotonic() it was reclaimed
+        self._lock = threading.Lock()
+
+    def reclaimed(self, job, task_ids, silent_for):
+        """
+        Record that an expired lease was reclaimed after `silent_for` seconds of silence.
+        """
+        now = time.monotonic()
+        with self._lock:
+            self.expired_leases += 1
+            self._detection.append(silent_for)
+            for task_id in task_ids:
+                self._reclaimed[(job.job_id, task_id)] = now
+                self.reclaimed_tasks += 1
+
+    def completed(self, job, task_ids):
+        """
+        Record accepted results; those of reclaimed tasks count towards recovery time.
+        """
+        if not self._reclaimed:
+            return
+        now = time.monotonic()
+        with self._lock:
+            for task_id in task_ids:
+                reclaimed = self._reclaimed.pop((job.job_id, task_id), None)
+                if reclaimed is not None:
+                    self._recovery.append(now - reclaimed)
+
+    def summary(self):
+        """
+        JSON-serializable counts and p50 / p95 / max of detection and recovery seconds.
+        """
+        def quantiles(samples):
+            if not samples:
+                return None
+            return {'p50': float(np.percentile(samples, 50)), 'p95': float(np.percentile(samples, 95)),
+                    'max': float(max(samples)), 'samples': len(samples)}
+
+        with self._lock:
+            return {
+                'expired_leases': self.expired_leases,
+                'reclaimed_tasks': self.reclaimed_tasks,
+                'awaiting_recovery': len(self._reclaimed),
+                'detection_seconds': quantiles(list(self._detection)),
+                'recovery_seconds': quantiles(list(self._recovery)),
+            }
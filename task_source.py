@@ -0,0 +1,268 @@
+# task_source.py
+import threading
+import logging
+from collections import deque
+
+
+class TaskSource:
+    """
+    Hands out the (i, j, kk) tile coordinates of a tiled C = A x B on demand.
+
+    Task ids are row-major indices into the tile grid with kk innermost, so
+    consecutive ids of the same (i, j) cover a contiguous k range. Fresh tasks
+    are handed out from cursors instead of a pre-filled queue: the (i, j) grid is
+    split into supertiles of `supertile` x `supertile` blocks, each with its own
+    cursor. A lessee (e.g. a worker connection) keeps taking tasks from the
+    supertile it claimed, so its leases keep reusing the same few panels of A and
+    B, and then moves on to the next supertile in the same row, which shares its
+    A panels. Supertiles are first claimed down the columns, so lessees start on
+    different rows. Once every supertile is claimed, lessees share the one with
+    the most tasks left.
+
+    Only requeued and in-flight ids and the cursors of started supertiles are
+    stored; completed tasks are counted, not remembered. Memory does not depend
+    on the matrix size.
+
+    A source resumed from a checkpoint gets the (i, j) blocks that were already
+    complete; the cursors skip their tasks.
+    """
+
+    def __init__(self, n_row_blocks, n_col_blocks, n_k_blocks=1, max_retries=3, done_blocks=None, supertile=1):
+        self.n_row_blocks = n_row_blocks
+        self.n_col_blocks = n_col_blocks
+        self.n_k_blocks = n_k_blocks
+        self.total = n_row_blocks * n_col_blocks * n_k_blocks
+        self.max_retries = max_retries
+        self.supertile = supertile
+        self.n_super_rows = -(-n_row_blocks // supertile)
+        self.n_super_cols = -(-n_col_blocks // supertile)
+
+        self._issued = 0           # Fresh tasks handed out, including those complete before a restart
+        self._cursors = {}         # supertile -> fresh positions taken from it, for supertiles with tasks left
+        self._claimed = bytearray(self.n_super_rows * self.n_super_cols)  # Supertiles ever claimed
+        self._next_claim = 0       # Position in the column-major claim order up to which all are claimed
+        self._owners = {}          # lessee -> supertile it takes fresh tasks from
+        self._abandoned = deque()  # Supertiles with tasks left whose lessee went away
+        self._requeue_order = deque()  # Requeued task ids in reissue order; ids no longer in _requeued are stale
+        self._requeued = {}        # task_id -> retry_count, waiting to be reissued
+        self._in_flight = {}       # task_id -> retry_count
+        self.completed = 0
+        self.failed = 0
+        self._lock = threading.Lock()
+
+        # (i, j) blocks completed before a restart; the cursors skip them
+        self._done_blocks = done_blocks
+        if done_blocks is not None:
+            self.completed = self._issued = int(done_blocks.sum()) * n_k_blocks
+
+    def coordinates(self, task_id):
+        """
+        Map a task id to its (i, j, kk) tile coordinates.
+        """
+        ij, kk = divmod(task_id, self.n_k_blocks)
+        i, j = divmod(ij, self.n_col_blocks)
+        return i, j, kk
+
+    def lease(self, max_tasks, span=1, lessee=None):
+        """
+        Take up to max_tasks tasks, requeued tasks first.
+
+        Fresh tasks may merge up to `span` consecutive k tiles of the same (i, j)
+        into one deeper task; requeued tasks are always handed out singly.
+
+        Parameters:
+        - max_tasks (int): Maximum number of tasks to hand out.
+        - span (int): Maximum number of k tiles per fresh task.
+        - lessee (hashable or None): Who the tasks are for; fresh tasks come from
+          the supertile this lessee has claimed. Call forget() when it goes away.
+
+        Returns:
+        - list of (int, int): (first task id, number of k tiles) per leased task;
+          empty if nothing is pending right now.
+        """
+        leased = []
+        with self._lock:
+            while len(leased) < max_tasks and self._requeued:
+                task_id = self._requeue_order.popleft()
+                retry_count = self._requeued.pop(task_id, None)
+                if retry_count is None:
+                    continue  # Claimed by a late result since it was requeued
+                self._in_flight[task_id] = retry_count
+                leased.append((task_id, 1))
+            while len(leased) < max_tasks and self._issued < self.total:
+                supertile = self._supertile_for(lessee)
+                if supertile is None:
+                    break
+                rows, cols = self._supertile_shape(supertile)
+                position = self._cursors[supertile]
+                ij, kk = divmod(position, self.n_k_blocks)
+                # Never merge across an (i, j) boundary
+                count = min(span, self.n_k_blocks - kk)
+                i, j = self._supertile_block(supertile, ij, cols)
+                first = (i * self.n_col_blocks + j) * self.n_k_blocks + kk
+                if self._done_blocks is not None and self._done_blocks[i * self.n_col_blocks + j]:
+                    count = self.n_k_blocks  # Complete before a restart: skip the whole block
+                else:
+                    for task_id in range(first, first + count):
+                        self._in_flight[task_id] = 0
+                    self._issued += count
+                    leased.append((first, count))
+                position += count
+                if position < rows * cols * self.n_k_blocks:
+                    self._cursors[supertile] = position
+                else:
+                    del self._cursors[supertile]
+        return leased
+
+    def _supertile_shape(self, supertile):
+        big_i, big_j = divmod(supertile, self.n_super_cols)
+        rows = min(self.supertile, self.n_row_blocks - big_i * self.supertile)
+        cols = min(self.supertile, self.n_col_blocks - big_j * self.supertile)
+        return rows, cols
+
+    def _supertile_block(self, supertile, ij, cols):
+        big_i, big_j = divmod(supertile, self.n_super_cols)
+        i, j = divmod(ij, cols)
+        return big_i * self.supertile + i, big_j * self.supertile + j
+
+    def _supertile_for(self, lessee):
+        """
+        The supertile `lessee` takes fresh tasks from, claiming another one when
+        its own has none left: the next one in its row if unclaimed, then one
+        abandoned by another lessee, then a never-claimed one, and finally the
+        one with the most tasks left. Returns None if no fresh tasks are left.
+        """
+        current = self._owners.get(lessee)
+        if current in self._cursors:
+            return current
+        claim = None
+        if current is not None and current % self.n_super_cols + 1 < self.n_super_cols:
+            if not self._claimed[current + 1]:
+                claim = current + 1
+        while claim is None and self._abandoned:
+            supertile = self._abandoned.popleft()
+            if supertile in self._cursors:
+                claim = supertile
+        while claim is None and self._next_claim < len(self._claimed):
+            supertile = self._claimed_at(self._next_claim)
+            if not self._claimed[supertile]:
+                claim = supertile
+            self._next_claim += 1
+        if claim is None:
+            if not self._cursors:
+                return None
+            claim = max(self._cursors, key=self._remaining)
+        elif not self._claimed[claim]:
+            self._claimed[claim] = 1
+            self._cursors[claim] = 0
+        self._owners[lessee] = claim
+        return claim
+
+    def _claimed_at(self, order):
+        big_j, big_i = divmod(order, self.n_super_rows)
+        return big_i * self.n_super_cols + big_j
+
+    def _remaining(self, supertile):
+        rows, cols = self._supertile_shape(supertile)
+        return rows * cols * self.n_k_blocks - self._cursors[supertile]
+
+    def forget(self, lessee):
+        """
+        Drop a lessee's claim; the rest of its supertile goes to the next lessee that needs one.
+        """
+        with self._lock:
+            supertile = self._owners.pop(lessee, None)
+            if supertile in self._cursors:
+                self._abandoned.append(supertile)
+
+    def complete(self, task_ids):
+        """
+        Mark tasks as done. Completion is a claim: a task held by several workers
+        (speculative copies) is completed once, by whichever result comes first.
+        A requeued task can still be claimed by a late valid result.
+
+        Returns:
+        - list of int: The task ids this call completed.
+        """
+        claimed = []
+        with self._lock:
+            for task_id in task_ids:
+                if self._in_flight.pop(task_id, None) is None and self._requeued.pop(task_id, None) is None:
+                    continue
+                claimed.append(task_id)
+                self.completed += 1
+        return claimed
+
+    def fail(self, task_ids):
+        """
+        Record an invalid result. Each task is requeued until it has been retried
+        max_retries times, after which it is dropped.
+
+        Returns:
+        - int: Number of tasks requeued.
+        """
+        requeued = 0
+        dropped = []
+        with self._lock:
+            for task_id in task_ids:
+                retry_count = self._in_flight.pop(task_id, None)
+                if retry_count is None:
+                    continue
+                if retry_count < self.max_retries:
+                    self._requeue(task_id, retry_count + 1)
+                    requeued += 1
+                else:
+                    self.failed += 1
+                    dropped.append(task_id)
+        for task_id in dropped:
+            logging.error(f"Task {task_id} failed after {self.max_retries} retries. Discarding it.")
+        return requeued
+
+    def release(self, task_ids):
+        """
+        Return leased tasks that were never processed (e.g. the worker disconnected)
+        without counting it as a retry.
+        """
+        with self._lock:
+            for task_id in task_ids:
+                retry_count = self._in_flight.pop(task_id, None)
+                if retry_count is not None:
+                    self._requeue(task_id, retry_count)
+
+    def reopen(self, task_ids):
+        """
+        Requeue tasks that were already completed, e.g. because their results were
+        retroactively invalidated.
+        """
+        with self._lock:
+            for task_id in task_ids:
+                self._requeue(task_id, 0)
+                self.completed -= 1
+
+    def _requeue(self, task_id, retry_count):
+        # Called with the lock held
+        self._requeued[task_id] = retry_count
+        self._requeue_order.append(task_id)
+
+    def outstanding(self, task_ids):
+        """
+        The subset of task_ids that is leased and not yet completed.
+        """
+        with self._lock:
+            return [task_id for task_id in task_ids if task_id in self._in_flight]
+
+    @property
+    def in_flight(self):
+        return len(self._in_flight)
+
+    @property
+    def pending(self):
+        """
+        Number of tasks not yet handed out (fresh plus requeued).
+        """
+        with self._lock:
+            return self.total - self._issued + len(self._requeued)
+
+    @property
+    def done(self):
+        return self.completed + self.failed >= self.total
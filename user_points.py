@@ -1,78 +1,394 @@
 # user_points.py
 import json
 import os
+import time
+import sqlite3
 import logging
+import threading
+from contextlib import contextmanager
 
-POINTS_FILE = 'user_points.json'
+DB_FILE = 'user_points.db'  # SQLite database holding users, their points and wallet addresses
+POINTS_FILE = 'user_points.json'  # Points and wallets of earlier versions, migrated into DB_FILE once
+USERS_FILE = 'users.json'  # Password hashes of earlier versions, migrated into DB_FILE once
+APPLIED_BATCHES = 100000  # Recent bulk increment batch ids remembered, so a retried batch is applied once
+BUSY_TIMEOUT_MS = 5000  # How long a write waits for another process's write to finish
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    username TEXT PRIMARY KEY,
+    password_hash TEXT,
+    points INTEGER NOT NULL DEFAULT 0,
+    wallet_address TEXT
+);
+CREATE INDEX IF NOT EXISTS users_wallet_address ON users (wallet_address, points);  -- Covers the airdrop scans
+CREATE TABLE IF NOT EXISTS applied_batches (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    batch_id TEXT UNIQUE NOT NULL,
+    applied_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS epoch_points (  -- Points earned since the last closed epoch, by active users only
+    username TEXT PRIMARY KEY,
+    points INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS epochs (
+    epoch INTEGER PRIMARY KEY AUTOINCREMENT,
+    closed_at REAL NOT NULL,
+    users INTEGER NOT NULL,
+    points INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS epoch_history (  -- Points each closed epoch pays out
+    epoch INTEGER NOT NULL,
+    username TEXT NOT NULL,
+    points INTEGER NOT NULL,
+    PRIMARY KEY (epoch, username)
+);
+"""
+SCHEMA_VERSION = 1  # 1: epochs; points earned before them are seeded into the first epoch
+
+# Adds a change to the open epoch of an existing user
+EPOCH_CREDIT = ("INSERT INTO epoch_points (username, points) VALUES (?, ?) "
+                "ON CONFLICT (username) DO UPDATE SET points = points + excluded.points")
 
-def load_user_points():
-    """
-    Load user points and wallet addresses from a JSON file.
-    
-    Returns:
-    - dict: A dictionary mapping usernames to their respective points and wallet addresses.
-    """
-    if not os.path.exists(POINTS_FILE):
-        logging.info(f"{POINTS_FILE} does not exist. Starting with empty data.")
-        return {}
-    with open(POINTS_FILE, 'r') as f:
-        try:
-            data = json.load(f)
-            # Ensure each user's data has 'points' and 'wallet_address'
-            user_points = {}
-            for user, info in data.items():
-                points = info.get('points', 0)
-                wallet_address = info.get('wallet_address', None)
-                user_points[str(user)] = {
-                    "points": int(points),
-                    "wallet_address": wallet_address
-                }
-            logging.info(f"Loaded user points and wallet addresses from {POINTS_FILE}.")
-            return user_points
-        except json.JSONDecodeError:
-            logging.error("Points file is corrupted. Starting with empty data.")
-            return {}
-
-def save_user_points(user_points):
-    """
-    Save user points and wallet addresses to a JSON file.
-    
-    Parameters:
-    - user_points (dict): A dictionary mapping usernames to their respective points and wallet addresses.
-    """
-    try:
-        with open(POINTS_FILE, 'w') as f:
-            json.dump(user_points, f, indent=4)
-        logging.info(f"Saved user points and wallet addresses to {POINTS_FILE}.")
-    except Exception as e:
-        logging.error(f"Error saving user points: {e}")
 
-def set_wallet_address(username, wallet_address):
+class PointsStore:
     """
-    Set the wallet address for a user.
-    
+    Users, their points and wallet addresses in an SQLite database in WAL mode.
+
+    Every change is a single-row update (or one transaction for a bulk
+    increment), so its cost does not grow with the number of users, a crash
+    cannot leave a half-written file behind, and readers are not blocked by a
+    writer. Several threads and processes may share one database file; each
+    thread gets its own connection.
+
+    Points are also accounted in epochs for airdrops. Every change is added to
+    the open epoch of its user, so only users active since the last epoch have
+    a row there. close_epoch() checkpoints those rows as the closed epoch's
+    payout and starts a new one.
+
     Parameters:
-    - username (str): The username.
-    - wallet_address (str): The wallet address to set.
+    - path (str): Database file, created if it does not exist.
     """
-    if username in user_points:
-        user_points[username]['wallet_address'] = wallet_address
-        save_user_points(user_points)
-        logging.info(f"Set wallet address for user '{username}' to {wallet_address}.")
-    else:
-        logging.error(f"User '{username}' not found when setting wallet address.")
-
-def get_wallet_address(username):
+    def __init__(self, path=DB_FILE):
+        self.path = path
+        self._local = threading.local()
+        self._pid = os.getpid()
+        self._connection().executescript(SCHEMA)
+        with self._transaction() as conn:
+            if conn.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+                # Nothing has been paid out yet: the first epoch covers every point earned so far
+                conn.execute("INSERT OR IGNORE INTO epoch_points (username, points) "
+                             "SELECT username, points FROM users WHERE points != 0")
+                conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def _connection(self):
+        if self._pid != os.getpid():
+            # Forked, e.g. by a pre-loading server: connections must not cross processes
+            self._local = threading.local()
+            self._pid = os.getpid()
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # Autocommit mode; transactions are opened explicitly by _transaction
+            conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT_MS / 1000, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")  # Durable across process crashes; WAL keeps the file consistent
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        """
+        Run a block in a write transaction, taking the write lock up front so two
+        writers never deadlock upgrading their read locks.
+        """
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def close(self):
+        """
+        Close this thread's connection.
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def migrate_json(self, users_file=USERS_FILE, points_file=POINTS_FILE):
+        """
+        Import users and points from the JSON files of earlier versions into an
+        empty database. Imported files are renamed with a '.migrated' suffix so
+        they are not imported again. Safe to call from several processes at once:
+        the first one imports, under the database's write lock.
+
+        Returns:
+        - int: Number of users imported.
+        """
+        with self._transaction() as conn:
+            sources = [path for path in (users_file, points_file) if path and os.path.exists(path)]
+            if not sources:
+                return 0
+            if conn.execute("SELECT 1 FROM users LIMIT 1").fetchone() is not None:
+                logging.warning(f"Not migrating {', '.join(sources)}: {self.path} already holds users.")
+                return 0
+            data = {}
+            for path in sources:
+                try:
+                    with open(path, 'r') as f:
+                        data[path] = json.load(f)
+                except (OSError, json.JSONDecodeError) as e:
+                    logging.error(f"Could not read {path} for migration: {e}")
+                    return 0
+            hashes = data.get(users_file, {})
+            points = data.get(points_file, {})
+            rows = []
+            for username in set(hashes) | set(points):
+                info = points.get(username, {})
+                rows.append((str(username), hashes.get(username), int(info.get('points', 0)),
+                             info.get('wallet_address')))
+            conn.executemany("INSERT INTO users (username, password_hash, points, wallet_address) VALUES (?, ?, ?, ?)",
+                             rows)
+            conn.executemany(EPOCH_CREDIT, [(row[0], row[2]) for row in rows if row[2]])
+            for path in sources:
+                os.replace(path, path + '.migrated')
+        logging.info(f"Migrated {len(rows)} users from {', '.join(sources)} to {self.path}.")
+        return len(rows)
+
+    def register(self, username, password_hash):
+        """
+        Add a user with no points. A user imported without a password takes this one.
+
+        Returns:
+        - bool: False if the username is taken.
+        """
+        with self._transaction() as conn:
+            cursor = conn.execute("INSERT INTO users (username, password_hash) VALUES (?, ?) "
+                                  "ON CONFLICT (username) DO UPDATE SET password_hash = excluded.password_hash "
+                                  "WHERE users.password_hash IS NULL", (username, password_hash))
+            return cursor.rowcount == 1
+
+    def password_hash(self, username):
+        """
+        Returns:
+        - str or None: The user's password hash, or None if the user does not exist or has none.
+        """
+        row = self._connection().execute("SELECT password_hash FROM users WHERE username = ?", (username,)).fetchone()
+        return row[0] if row else None
+
+    def get(self, username):
+        """
+        Returns:
+        - dict or None: The user's 'points' and 'wallet_address', or None if the user does not exist.
+        """
+        row = self._connection().execute("SELECT points, wallet_address FROM users WHERE username = ?",
+                                         (username,)).fetchone()
+        return {'points': row[0], 'wallet_address': row[1]} if row else None
+
+    def set_points(self, username, points):
+        """
+        Returns:
+        - bool: False if the user does not exist.
+        """
+        with self._transaction() as conn:
+            row = conn.execute("SELECT points FROM users WHERE username = ?", (username,)).fetchone()
+            if row is None:
+                return False
+            conn.execute("UPDATE users SET points = ? WHERE username = ?", (points, username))
+            if points != row[0]:
+                conn.execute(EPOCH_CREDIT, (username, points - row[0]))
+            return True
+
+    def increment(self, username, points):
+        """
+        Add `points` to a user's points; negative points debit them.
+
+        Returns:
+        - int or None: The user's new points, or None if the user does not exist.
+        """
+        with self._transaction() as conn:
+            if conn.execute("UPDATE users SET points = points + ? WHERE username = ?", (points, username)).rowcount != 1:
+                return None
+            conn.execute(EPOCH_CREDIT, (username, points))
+            return conn.execute("SELECT points FROM users WHERE username = ?", (username,)).fetchone()[0]
+
+    def bulk_increment(self, credits, batch_id=None):
+        """
+        Add points to many users in one transaction. A batch id that was already
+        applied is not applied again.
+
+        Parameters:
+        - credits (dict): Maps usernames to the points to add.
+        - batch_id (str or None): Identifies the batch for retries.
+
+        Returns:
+        - tuple: (applied, unknown) where applied is False for a repeated batch
+          and unknown lists the usernames that do not exist.
+        """
+        with self._transaction() as conn:
+            if batch_id is not None:
+                if conn.execute("SELECT 1 FROM applied_batches WHERE batch_id = ?", (batch_id,)).fetchone():
+                    return False, []
+                conn.execute("INSERT INTO applied_batches (batch_id, applied_at) VALUES (?, ?)",
+                             (batch_id, time.time()))
+                conn.execute("DELETE FROM applied_batches WHERE seq <= (SELECT MAX(seq) FROM applied_batches) - ?",
+                             (APPLIED_BATCHES,))
+            unknown = [username for username, points in credits.items()
+                       if conn.execute("UPDATE users SET points = points + ? WHERE username = ?",
+                                       (points, username)).rowcount != 1]
+            conn.executemany(EPOCH_CREDIT, [(username, points) for username, points in credits.items()
+                                            if username not in unknown])
+            return True, unknown
+
+    def set_wallet_address(self, username, wallet_address):
+        """
+        Set the wallet address for a user.
+
+        Returns:
+        - bool: False if the user does not exist.
+        """
+        with self._transaction() as conn:
+            return conn.execute("UPDATE users SET wallet_address = ? WHERE username = ?",
+                                (wallet_address, username)).rowcount == 1
+
+    def get_wallet_address(self, username):
+        """
+        Returns:
+        - str or None: The wallet address or None if not set.
+        """
+        user = self.get(username)
+        return user['wallet_address'] if user else None
+
+    def find_by_wallet(self, wallet_address):
+        """
+        Returns:
+        - list of str: Usernames with this wallet address.
+        """
+        rows = self._connection().execute("SELECT username FROM users WHERE wallet_address = ?",
+                                          (wallet_address,)).fetchall()
+        return [row[0] for row in rows]
+
+    @contextmanager
+    def snapshot(self):
+        """
+        Read in one transaction, so every query in the block sees the same data
+        even while other connections keep writing.
+        """
+        conn = self._connection()
+        conn.execute("BEGIN")
+        try:
+            yield self
+        finally:
+            conn.execute("COMMIT")
+
+    def close_epoch(self):
+        """
+        Close the open epoch: the points its users earned become the epoch's
+        payout and the next epoch starts from zero. Only users active in the
+        epoch are touched. Users without a wallet address, or whose points went
+        down over the epoch, carry their points into the next epoch instead.
+
+        Returns:
+        - tuple or None: (epoch, users, points) of the closed epoch, or None if no
+          user earned points to pay out.
+        """
+        with self._transaction() as conn:
+            users, points = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(e.points), 0) FROM epoch_points e JOIN users u USING (username) "
+                "WHERE e.points > 0 AND u.wallet_address IS NOT NULL AND u.wallet_address != ''").fetchone()
+            if not users:
+                return None
+            epoch = conn.execute("INSERT INTO epochs (closed_at, users, points) VALUES (?, ?, ?)",
+                                 (time.time(), users, points)).lastrowid
+            conn.execute("INSERT INTO epoch_history (epoch, username, points) "
+                         "SELECT ?, e.username, e.points FROM epoch_points e JOIN users u USING (username) "
+                         "WHERE e.points > 0 AND u.wallet_address IS NOT NULL AND u.wallet_address != ''", (epoch,))
+            conn.execute("DELETE FROM epoch_points WHERE username IN "
+                         "(SELECT username FROM epoch_history WHERE epoch = ?)", (epoch,))
+            conn.execute("DELETE FROM epoch_points WHERE points = 0")
+        logging.info(f"Closed epoch {epoch}: {points} points earned by {users} users.")
+        return epoch, users, points
+
+    def epochs(self):
+        """
+        Returns:
+        - list of tuple: (epoch, closed_at, users, points) of every closed epoch, oldest first.
+        """
+        return self._connection().execute("SELECT epoch, closed_at, users, points FROM epochs ORDER BY epoch").fetchall()
+
+    def wallet_totals(self, epoch=None):
+        """
+        Parameters:
+        - epoch (int or None): A closed epoch, or None for lifetime points.
+
+        Returns:
+        - tuple: (wallets, points, unpaid) where wallets counts the distinct wallet
+          addresses that hold points, points is their sum, and unpaid counts the
+          users with points but no wallet address.
+        """
+        source, params = self._points_source(epoch)
+        row = self._connection().execute(
+            f"SELECT COUNT(DISTINCT wallet_address), COALESCE(SUM(points), 0) FROM {source} "
+            "WHERE wallet_address IS NOT NULL AND wallet_address != '' AND points > 0", params).fetchone()
+        unpaid = self._connection().execute(
+            f"SELECT COUNT(*) FROM {source} WHERE (wallet_address IS NULL OR wallet_address = '') AND points > 0",
+            params).fetchone()
+        return row[0], row[1], unpaid[0]
+
+    def wallet_points(self, epoch=None, chunk=10000):
+        """
+        Stream the points of every wallet address, summed over the users that
+        share it, in address order. Rows are fetched `chunk` at a time.
+
+        Parameters:
+        - epoch (int or None): A closed epoch, or None for lifetime points.
+
+        Yields:
+        - tuple: (wallet_address, points)
+        """
+        source, params = self._points_source(epoch)
+        cursor = self._connection().execute(
+            f"SELECT wallet_address, SUM(points) FROM {source} "
+            "WHERE wallet_address IS NOT NULL AND wallet_address != '' AND points > 0 "
+            "GROUP BY wallet_address ORDER BY wallet_address", params)
+        try:
+            while True:
+                rows = cursor.fetchmany(chunk)
+                if not rows:
+                    return
+                yield from rows
+        finally:
+            cursor.close()
+
+    @staticmethod
+    def _points_source(epoch):
+        """
+        Rows of (wallet_address, points) for lifetime points, or one closed epoch's
+        payout (read through the epoch's primary key range, so its cost follows
+        the epoch's active users).
+        """
+        if epoch is None:
+            return "users", ()
+        return ("(SELECT u.wallet_address AS wallet_address, h.points AS points FROM epoch_history h "
+                "JOIN users u USING (username) WHERE h.epoch = ?)"), (epoch,)
+
+    def __len__(self):
+        return self._connection().execute("SELECT COUNT(*) FROM users").fetchone()[0]
+
+
+def load_user_points(path=DB_FILE):
     """
-    Get the wallet address for a user.
-    
-    Parameters:
-    - username (str): The username.
-    
+    Load user points and wallet addresses from the database.
+
     Returns:
-    - str or None: The wallet address or None if not set.
+    - dict: A dictionary mapping usernames to their respective points and wallet addresses.
     """
-    return user_points.get(username, {}).get('wallet_address', None)
-
-# Initialize user_points
-user_points = load_user_points()
+    store = PointsStore(path)
+    try:
+        rows = store._connection().execute("SELECT username, points, wallet_address FROM users").fetchall()
+    finally:
+        store.close()
+    return {username: {'points': points, 'wallet_address': wallet_address} for username, points, wallet_address in rows}
@@ -3,14 +3,17 @@
 from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify
 import requests
 import socket
+import queue
 import threading
-import pickle
 import json
 import logging
 from werkzeug.security import generate_password_hash, check_password_hash
 from time import sleep
-import struct
 import numpy as np 
+from helper import send_frame, receive_frame, ReceiveBuffer, available_codecs, WireStats, MSG_HELLO, MSG_LEASE, MSG_TASK, MSG_RESULT, MSG_POINTS, MSG_DONE, MSG_CANCEL, MSG_HEARTBEAT
+from scheduler import measure_gflops
+from panels import PanelCache, resolve_panels
+from worker_pool import ComputePool
 
 
 # Global variables
@@ -36,57 +39,162 @@ DATA_SERVER_URL = 'http://192.168.1.4:5001'  # Ensure this is correct
 MASTER_SERVER_IP = '192.168.1.4'  # Replace with actual master server IP
 MASTER_SERVER_PORT = 65432
 
+# Lease sizing: request enough tasks to stay busy for about this long per round trip
+LEASE_TARGET_SECONDS = 1.0
+MAX_LEASE_TASKS = 1024
+
+# Liveness: tell the master we are alive this often, so it can reclaim our lease if we go silent
+HEARTBEAT_INTERVAL_SECONDS = 1.0
+
+# Compute: tasks computed at once (None uses every core), small tasks on processes, and
+# leases asked for ahead of the one being computed so the pool never waits for the network
+COMPUTE_SLOTS = None
+COMPUTE_PROCESSES = True
+PREFETCH_LEASES = 1
+
+# Operand panels kept between leases, so the master need not resend them; 0 disables the cache
+PANEL_CACHE_BYTES = 256 * 1024 * 1024
+
 # Thread-safe storage for user points
 points_lock = threading.Lock()
 points_map = {}
 
 def connect_to_master(username):
     global active_connections
+    # Heartbeats are sent from their own thread; frames must not interleave
+    send_lock = threading.Lock()
+    stop_heartbeats = threading.Event()
+    pool = None
+    receiver = None
     try:
         sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         sock.connect((MASTER_SERVER_IP, MASTER_SERVER_PORT))
         
         # Store the connection reference so we can close it later if needed
         active_connections[username] = sock
+        recv_buffer = ReceiveBuffer(sock)
 
         logging.info(f"Connected to master server at {MASTER_SERVER_IP}:{MASTER_SERVER_PORT}")
 
-        # Send username to master
-        send_data_in_chunks(sock, [username])
-        logging.debug(f"Sent username '{username}' to master server.")
-
+        # Send username, measured compute capability and compute slots to master
+        gflops = measure_gflops()
+        pool = ComputePool(COMPUTE_SLOTS, COMPUTE_PROCESSES, compute=lambda a, b: perform_computation(a, b))
+        send_frame(sock, MSG_HELLO, meta={'username': username, 'gflops': gflops,
+                                          'heartbeat': HEARTBEAT_INTERVAL_SECONDS,
+                                          'panel_cache': PANEL_CACHE_BYTES, 'codecs': available_codecs(),
+                                          'slots': pool.slots, 'prefetch': PREFETCH_LEASES})
+        logging.debug(f"Sent username '{username}' to master server ({gflops:.2f} GFLOP/s, {pool.slots} slots).")
+
+        # The master replies with the codecs to use and the prefetch it grants, or DONE if it rejects us
+        reply = receive_reply(sock, recv_buffer)
+        if reply is None or reply.msg_type != MSG_HELLO:
+            logging.info("Master did not accept the connection.")
+            return
+        codec, narrow = reply.meta.get('codec'), reply.meta.get('narrow', False)
+        prefetch = min(PREFETCH_LEASES, int(reply.meta.get('prefetch', 0)))
+        wire = WireStats()
+        logging.info(f"Frames use {codec or 'no compression'}{' with integer narrowing' if narrow else ''}; "
+                     f"prefetching {prefetch} leases.")
+        threading.Thread(target=send_heartbeats, args=(sock, send_lock, stop_heartbeats),
+                         name=f"Heartbeat-{username}", daemon=True).start()
+
+        # From here on frames are read by their own thread, so the next lease and
+        # cancellations arrive while the pool computes. Frames and finished leases
+        # are handled in order on this thread.
+        events = queue.Queue()
+        buffers = [recv_buffer] + [ReceiveBuffer(sock) for _ in range(prefetch + 1)]
+        receiver = threading.Thread(target=receive_frames, args=(sock, events, wire, buffers),
+                                    name=f"Receiver-{username}", daemon=True)
+        receiver.start()
+
+        panel_cache = PanelCache(PANEL_CACHE_BYTES)
+        leases = {}  # lease_id -> (task_ids, cancelled task ids, missing task ids) of leases being computed
+        lease_size = 1
+        asking = False  # A lease request is waiting for its reply
+        starved = False  # The master had nothing to prefetch; ask again once idle
+        finished = False  # The master has no more tasks
         while True:
-            task = receive_data_in_chunks(sock)
-            if task is None:
+            # Keep up to `prefetch` leases queued behind the one being computed
+            if not (finished or asking or (starved and leases)) and len(leases) <= prefetch:
+                with send_lock:
+                    send_frame(sock, MSG_LEASE, meta={'max_tasks': lease_size})
+                asking = True
+            if finished and not leases:
                 logging.info("No more tasks received. Closing connection.")
                 break
 
-            a_block, b_block = task
-            logging.debug(f"Received task: a_block={a_block}, b_block={b_block}")
-
-            # Perform computation
-            result = perform_computation(a_block, b_block)
-            logging.debug(f"Computed result: {result}")
-
-            # Send result back to master
-            send_data_in_chunks(sock, [username, result])
-            logging.debug(f"Sent result back to master for user '{username}'.")
-
-            # Receive updated points
-            updated_points = receive_data_in_chunks(sock)
-            if updated_points is None:
-                logging.warning("No points received from master.")
-                continue
-
-            # Update points_map in a thread-safe manner
-            with points_lock:
-                points_map[username] = updated_points
-                logging.info(f"Updated points for user '{username}': {updated_points}")
+            kind, frame, *done = events.get()
+            if kind == 'result':
+                # A lease is computed: send all its results back to master in one frame,
+                # with the time spent encoding the previous results and decoding this lease
+                task_ids, cancelled, missing = leases.pop(frame)
+                results, compute_seconds = done
+                if cancelled:
+                    logging.info(f"Skipped {len(cancelled)} tasks of lease {frame} finished by other workers.")
+                lease_size = next_lease_size(len(task_ids), compute_seconds)
+                starved = False
+                codec_seconds = wire.take()
+                with send_lock:
+                    send_frame(sock, MSG_RESULT, frame, arrays=results,
+                               meta={'username': username, 'task_ids': task_ids, 'compute_seconds': compute_seconds,
+                                     'missing': missing,
+                                     'codec_seconds': codec_seconds.encode_seconds + codec_seconds.decode_seconds},
+                               codec=codec, narrow=narrow, stats=wire)
+                logging.debug(f"Sent results of lease {frame} back to master for user '{username}'.")
+            elif frame is None:
+                logging.warning("Connection to master lost.")
+                break
+            elif frame.msg_type == MSG_DONE:
+                finished = True
+                asking = False
+            elif frame.msg_type == MSG_TASK:
+                asking = False
+                task_ids = (frame.meta or {}).get('task_ids', [])
+                if not task_ids:
+                    starved = True
+                    continue
+                # Panels we hold are referenced by key; the rest arrive in the frame
+                missing = []
+                if 'panels' in frame.meta:
+                    blocks, missing = resolve_panels(panel_cache, frame)
+                elif len(frame.arrays) == 2 * len(task_ids):
+                    blocks = list(zip(frame.arrays[0::2], frame.arrays[1::2]))
+                else:
+                    logging.error(f"Malformed lease {frame.task_id} from master.")
+                    break
+                logging.debug(f"Received lease {frame.task_id} with {len(task_ids)} tasks "
+                              f"({len(frame.arrays)} panels sent).")
+                if missing:
+                    logging.warning(f"Missing cached panels for {len(missing)} tasks of lease {frame.task_id}.")
+                cancelled = set()
+                leases[frame.task_id] = (task_ids, cancelled, missing)
+                pool.run(blocks, lambda index, task_ids=task_ids, cancelled=cancelled: task_ids[index] in cancelled,
+                         lambda results, seconds, lease_id=frame.task_id: events.put(('result', lease_id, results, seconds)))
+            elif frame.msg_type == MSG_CANCEL:
+                if frame.task_id in leases:
+                    leases[frame.task_id][1].update(frame.meta['task_ids'])
+            elif frame.msg_type == MSG_POINTS:
+                # Update points_map in a thread-safe manner
+                with points_lock:
+                    points_map[username] = frame.meta['points']
+                    logging.info(f"Updated points for user '{username}': {frame.meta['points']}")
+            else:
+                logging.error(f"Unexpected frame type {frame.msg_type} from master.")
+                break
 
     except Exception as e:
         logging.error(f"Error connecting to master server: {e}")
     finally:
-        # Always clean up the socket
+        stop_heartbeats.set()
+        if pool is not None:
+            pool.shutdown()
+        # Always clean up the socket; shutting it down first ends the receiver thread's read
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        if receiver is not None:
+            receiver.join(timeout=1.0)
         try:
             sock.close()
             logging.info("Socket connection closed.")
@@ -97,81 +205,77 @@ def connect_to_master(username):
         if username in active_connections:
             del active_connections[username]
 
-def perform_computation(a_block, b_block):
+def send_heartbeats(sock, send_lock, stop):
     """
-    Performs matrix multiplication on the received blocks.
-
-    Parameters:
-    - a_block (list): Sub-matrix from matrix A.
-    - b_block (list): Sub-matrix from matrix B.
-
-    Returns:
-    - list: Resulting sub-matrix after multiplication.
+    Send a heartbeat every HEARTBEAT_INTERVAL_SECONDS until `stop` is set or the connection fails.
     """
-    try:
-        a_np = np.array(a_block)
-        b_np = np.array(b_block)
-        result_np = np.dot(a_np, b_np)
-        return result_np.tolist()
-    except Exception as e:
-        logging.error(f"Error during computation: {e}")
-        return []
+    while not stop.wait(HEARTBEAT_INTERVAL_SECONDS):
+        try:
+            with send_lock:
+                send_frame(sock, MSG_HEARTBEAT)
+        except OSError as e:
+            logging.debug(f"Heartbeats stopped: {e}")
+            return
 
-def send_data_in_chunks(conn, data):
+def receive_frames(sock, events, stats, buffers):
     """
-    Serialize and send data with a fixed-length header indicating the data size.
+    Read frames from the master into `events` until the connection ends, which
+    is signalled by a None frame.
+
+    Frames are read into a ring of reusable buffers, moving on to the next one
+    after each frame that carries arrays. The pool may still be computing on
+    the panels of every lease the worker holds, so the ring needs one buffer per
+    lease it may hold (1 + the prefetch) plus the one being read into; panels
+    that outlive their lease are copied into the panel cache by resolve_panels.
     """
-    try:
-        serialized_data = pickle.dumps(data)
-        data_length = len(serialized_data)
-        header = struct.pack('!I', data_length)  # 4-byte unsigned int, network byte order
-        conn.sendall(header + serialized_data)
-        logging.debug(f"Sent data of length {data_length} bytes.")
-    except Exception as e:
-        logging.error(f"Error sending data: {e}")
-        raise
+    index = 0
+    while True:
+        frame = receive_frame(sock, buffers[index], stats)
+        events.put(('frame', frame))
+        if frame is None:
+            return
+        if frame.arrays:
+            index = (index + 1) % len(buffers)
+
+def receive_reply(sock, buffer, stats=None):
+    """
+    Receive the master's next reply, dropping cancellations that arrived too late to matter.
+    """
+    while True:
+        frame = receive_frame(sock, buffer, stats)
+        if frame is None or frame.msg_type != MSG_CANCEL:
+            return frame
 
-def receive_data_in_chunks(conn):
+def next_lease_size(n_tasks, elapsed):
     """
-    Receive data sent with a fixed-length header indicating the data size.
+    Size the next lease request from how long the last batch took to compute.
+
+    Parameters:
+    - n_tasks (int): Number of tasks in the last batch.
+    - elapsed (float): Seconds spent computing it.
+
+    Returns:
+    - int: Number of tasks to ask for next, between 1 and MAX_LEASE_TASKS.
     """
-    try:
-        # First, receive the header
-        header = recvall(conn, 4)
-        if not header:
-            logging.warning("No header received.")
-            return None
-        data_length = struct.unpack('!I', header)[0]
-        logging.debug(f"Expecting to receive {data_length} bytes of data.")
-
-        # Then, receive the actual data
-        serialized_data = recvall(conn, data_length)
-        if not serialized_data:
-            logging.warning("No serialized data received.")
-            return None
-        data = pickle.loads(serialized_data)
-        logging.debug(f"Received data: {data}")
-        return data
-    except Exception as e:
-        logging.error(f"Error receiving data: {e}")
-        return None
+    per_task = max(elapsed, 1e-6) / max(n_tasks, 1)
+    return int(max(1, min(MAX_LEASE_TASKS, LEASE_TARGET_SECONDS / per_task)))
 
-def recvall(conn, n):
+def perform_computation(a_block, b_block):
     """
-    Helper function to receive exactly n bytes or return None if EOF is hit.
+    Performs matrix multiplication on the received blocks.
+
+    Parameters:
+    - a_block (np.ndarray): Sub-matrix from matrix A.
+    - b_block (np.ndarray): Sub-matrix from matrix B.
+
+    Returns:
+    - np.ndarray: Resulting sub-matrix after multiplication (empty on error).
     """
-    data = b''
     try:
-        while len(data) < n:
-            packet = conn.recv(n - len(data))
-            if not packet:
-                logging.warning("Connection closed by the other side.")
-                return None
-            data += packet
-        return data
+        return np.dot(a_block, b_block)
     except Exception as e:
-        logging.error(f"Error in recvall: {e}")
-        return None
+        logging.error(f"Error during computation: {e}")
+        return np.empty((0, 0))
 
 @app.route("/", methods=["GET", "POST"])
 def index():
@@ -0,0 +1,144 @@
+# worker_pool.py
+import os
+import time
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+import numpy as np
+
+SMALL_TASK_FLOPS = 2 * 64 ** 3  # Tasks below this are computed in batches rather than one by one
+BATCH_FLOPS = 64 * SMALL_TASK_FLOPS  # Work per batch of small tasks
+
+
+def multiply_batch(pairs):
+    """
+    Compute a batch of small tasks, on a pool process or thread.
+
+    Parameters:
+    - pairs (list of tuple): (a, b) blocks.
+
+    Returns:
+    - list of np.ndarray: a @ b for each pair.
+    """
+    return [np.dot(a, b) for a, b in pairs]
+
+
+class ComputePool:
+    """
+    Compute slots of a worker, so one worker uses every core.
+
+    Tasks large enough for BLAS run one per slot on a thread pool; numpy releases
+    the GIL while it multiplies. Small tasks spend their time in the interpreter
+    instead, so they are grouped into batches of about BATCH_FLOPS, which run on a
+    process pool of the same size when there is more than one slot.
+
+    Leases are computed in the order they are handed to run(), so a lease queued
+    behind another one starts as slots free up.
+
+    Parameters:
+    - slots (int or None): Tasks computed at once; None uses every core.
+    - processes (bool): Compute batches of small tasks on processes.
+    - compute (callable): Multiplies one (a, b) pair on a thread.
+    """
+    def __init__(self, slots=None, processes=True, compute=np.dot):
+        self.slots = slots or os.cpu_count() or 1
+        self.compute = compute
+        self._threads = ThreadPoolExecutor(self.slots, thread_name_prefix="Compute")
+        self._processes = None
+        if processes and self.slots > 1:
+            # Spawned, not forked: the worker process runs Flask and socket threads
+            self._processes = ProcessPoolExecutor(self.slots, mp_context=multiprocessing.get_context('spawn'))
+
+    def run(self, blocks, skip, done):
+        """
+        Compute the tasks of one lease.
+
+        Parameters:
+        - blocks (list): (a, b) per task, or None for a task that cannot be computed.
+        - skip (callable): skip(index) is True if task `index` is no longer needed;
+          asked just before the task (or its batch) starts.
+        - done (callable): Called from a pool thread as done(results, compute_seconds)
+          once every task has finished. Skipped and uncomputable tasks get empty
+          results; compute_seconds runs from the lease's first task starting.
+        """
+        results = [None] * len(blocks)
+        state = {'remaining': len(blocks), 'started': None}
+        lock = threading.Lock()
+
+        def start():
+            with lock:
+                if state['started'] is None:
+                    state['started'] = time.perf_counter()
+
+        def finish(indices):
+            with lock:
+                state['remaining'] -= len(indices)
+                last = state['remaining'] == 0
+            if last:
+                done(results, time.perf_counter() - state['started'])
+
+        def empty(index):
+            block = blocks[index]
+            return np.empty((0, 0), dtype=np.result_type(*block) if block is not None else np.float64)
+
+        def compute(index):
+            try:
+                return self.compute(*blocks[index])
+            except Exception as e:
+                logging.error(f"Error during computation: {e}")
+                return empty(index)
+
+        def run_task(index):
+            start()
+            results[index] = empty(index) if skip(index) else compute(index)
+            finish([index])
+
+        def run_batch(indices):
+            start()
+            wanted = [index for index in indices if blocks[index] is not None and not skip(index)]
+            for index in set(indices) - set(wanted):
+                results[index] = empty(index)
+            if wanted:
+                pairs = [blocks[index] for index in wanted]
+                try:
+                    if self._processes is not None:
+                        values = self._processes.submit(multiply_batch, pairs).result()
+                    else:
+                        values = [compute(index) for index in wanted]
+                except Exception as e:
+                    logging.error(f"Batch of {len(pairs)} tasks failed on the process pool: {e}. Computing it here.")
+                    values = [compute(index) for index in wanted]
+                for index, value in zip(wanted, values):
+                    results[index] = value
+            finish(indices)
+
+        if not blocks:
+            state['started'] = time.perf_counter()
+            done(results, 0.0)
+            return
+        batch = []
+        batch_flops = 0
+        for index, block in enumerate(blocks):
+            if block is None:
+                results[index] = empty(index)
+                batch.append(index)  # Finished with the next batch, so done() fires once
+                continue
+            a, b = block
+            flops = 2 * a.shape[0] * a.shape[1] * b.shape[1]
+            if flops >= SMALL_TASK_FLOPS:
+                self._threads.submit(run_task, index)
+                continue
+            batch.append(index)
+            batch_flops += flops
+            if batch_flops >= BATCH_FLOPS:
+                self._threads.submit(run_batch, batch)
+                batch, batch_flops = [], 0
+        if batch:
+            self._threads.submit(run_batch, batch)
+
+    def shutdown(self):
+        self._threads.shutdown(wait=False, cancel_futures=True)
+        if self._processes is not None:
+            self._processes.shutdown(wait=False, cancel_futures=True)